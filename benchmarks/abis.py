@@ -0,0 +1,136 @@
+"""Minimal ABIs of the contracts the bot talks to (only the functions and events it uses),
+   and synthetic codex data, served by the stand-in node and explorer (see `standin.py`)."""
+
+# Same addresses as the bot (see Transacter, CraftingEngine, ItemCodex, SkillCodex and Multicall)
+ADDRESSES = {
+    "summoner": "0xce761d788df608bd21bdd59d6f4b54b2e27f25bb",
+    "attributes": "0xb5f5af1087a8da62a23b08c00c6ec9af21f397a1",
+    "gold": "0x2069b76afe6b734fb65d1d099e7ec64ee9cc76b2",
+    "skills": "0x51c0b29a1d84611373ba301706c6b4b72283c80f",
+    "craft1": "0x2a0f1cb17680161cf255348ddfdee94ea8ca196a",
+    "feats": "0x4f51ee975c01b0d6b29754657d7b3cc182f20d8a",
+    "crafting": "0xf41270836df4db1d28f7fd0935270e3a603e78cc",
+    "goods": "0x0c5c1cc0a7ae65fe372fbb08ff16578de4b980f3",
+    "armors": "0xf5114a952aca3e9055a52a87938efefc8bb7878c",
+    "weapons": "0xee1a2ea55945223404d73c0bbe57f540bbaad0d8",
+    "skill_codex": "0x67ae39a2ee91d7258a86cd901b17527e19e493b3",
+    "class_skills": "0x6292f3fb422e393342f257857e744d43b1ae7e70",
+    "multicall": "0xca11bde05977b3631167028862be2a173976ca11"
+}
+
+def function(name, inputs = (), outputs = (), mutability = "view"):
+    """ABI of a function. `inputs` and `outputs` are lists of types, or of (type, components) for tuples."""
+    def params(types):
+        entries = []
+        for i, param_type in enumerate(types):
+            if isinstance(param_type, tuple):
+                param_type, components = param_type
+                entries.append({"name": f"arg{i}", "type": param_type, "components": params(components)})
+            else:
+                entries.append({"name": f"arg{i}", "type": param_type})
+        return entries
+    return {"name": name, "type": "function", "stateMutability": mutability,
+            "inputs": params(inputs), "outputs": params(outputs)}
+
+def event(name, inputs):
+    """ABI of an event. `inputs` is a list of (name, type, indexed)."""
+    return {"name": name, "type": "event", "anonymous": False,
+            "inputs": [{"name": name, "type": param_type, "indexed": indexed} for name, param_type, indexed in inputs]}
+
+def erc20_summoner_token(extra = ()):
+    """Gold and craft mats: ERC20-like tokens held by summoners"""
+    return [
+        function("balanceOf", ["uint256"], ["uint256"]),
+        function("allowance", ["uint256", "uint256"], ["uint256"]),
+        function("transfer", ["uint256", "uint256", "uint256"], ["bool"], "nonpayable"),
+        function("approve", ["uint256", "uint256", "uint256"], ["bool"], "nonpayable"),
+        event("Transfer", [("from", "uint256", True), ("to", "uint256", True), ("amount", "uint256", False)]),
+        event("Approval", [("from", "uint256", True), ("to", "uint256", True), ("amount", "uint256", False)])
+    ] + list(extra)
+
+ERC721_TRANSFER = event("Transfer", [("from", "address", True), ("to", "address", True), ("tokenId", "uint256", True)])
+
+ABIS = {
+    "summoner": [
+        function("ownerOf", ["uint256"], ["address"]),
+        function("summoner", ["uint256"], ["uint256", "uint256", "uint256", "uint256"]),
+        function("adventurers_log", ["uint256"], ["uint256"]),
+        function("getApproved", ["uint256"], ["address"]),
+        function("isApprovedForAll", ["address", "address"], ["bool"]),
+        function("xp_required", ["uint256"], ["uint256"]),
+        function("adventure", ["uint256"], [], "nonpayable"),
+        function("level_up", ["uint256"], [], "nonpayable"),
+        function("approve", ["address", "uint256"], [], "nonpayable"),
+        function("setApprovalForAll", ["address", "bool"], [], "nonpayable"),
+        function("safeTransferFrom", ["address", "address", "uint256"], [], "nonpayable"),
+        function("summon", ["uint256"], [], "nonpayable"),
+        ERC721_TRANSFER,
+        event("summoned", [("owner", "address", True), ("_class", "uint256", False), ("summoner", "uint256", False)]),
+        event("leveled", [("owner", "address", True), ("level", "uint256", False), ("summoner", "uint256", False)])
+    ],
+    "attributes": [
+        function("ability_scores", ["uint256"], ["uint32"] * 6),
+        function("character_created", ["uint256"], ["bool"]),
+        function("calculate_point_buy", ["uint256"] * 6, ["uint256"]),
+        function("point_buy", ["uint256"] + ["uint32"] * 6, [], "nonpayable"),
+        event("Created", [("creator", "address", True), ("summoner", "uint256", False)] + \
+                         [(name, "uint32", False) for name in ["str", "dex", "con", "int", "wis", "cha"]])
+    ],
+    "gold": erc20_summoner_token([
+        function("claimable", ["uint256"], ["uint256"]),
+        function("claim", ["uint256"], [], "nonpayable")
+    ]),
+    "craft1": erc20_summoner_token([
+        function("adventurers_log", ["uint256"], ["uint256"]),
+        function("scout", ["uint256"], ["uint256"]),
+        function("adventure", ["uint256"], ["uint256"], "nonpayable")
+    ]),
+    "skills": [
+        function("get_skills", ["uint256"], ["uint8[36]"]),
+        function("is_valid_set", ["uint256", "uint8[36]"], ["bool"]),
+        function("set_skills", ["uint256", "uint8[36]"], [], "nonpayable"),
+        function("class_skills_by_name", ["uint256"], ["string[]"])
+    ],
+    "feats": [],
+    "crafting": [
+        function("items", ["uint256"], ["uint8", "uint8", "uint32", "uint256"]),
+        function("craft", ["uint256", "uint8", "uint8", "uint256"], [], "nonpayable"),
+        function("simulate", ["uint256", "uint256", "uint256", "uint256"], ["bool", "int256", "uint256", "uint256"]),
+        ERC721_TRANSFER
+    ],
+    "goods": [
+        function("item_by_id", ["uint256"], ["uint256", "uint256", "uint256", "string", "string"])
+    ],
+    "armors": [
+        function("item_by_id", ["uint256"], ["uint256", "uint256", "uint256", "uint256", "uint256", "uint256",
+                                             "int256", "uint256", "string", "string"])
+    ],
+    "weapons": [
+        function("item_by_id", ["uint256"], ["uint256", "uint256", "uint256", "uint256", "uint256", "uint256",
+                                             "uint256", "uint256", "int256", "uint256", "string", "string"])
+    ],
+    "skill_codex": [
+        function("skill_by_id", ["uint256"], ["uint256", "string", "uint256", "uint256", "bool", "bool", "string", "string"])
+    ],
+    "multicall": [
+        function("aggregate3", [("tuple[]", ["address", "bool", "bytes"])], [("tuple[]", ["bool", "bytes"])], "payable")
+    ]
+}
+# The skills contract also serves class skills (see SkillCodex)
+ABIS["class_skills"] = ABIS["skills"]
+
+CODEX_SIZES = {"goods": 24, "armors": 18, "weapons": 59, "skill_codex": 36}
+
+def item_by_id(codex_name, id):
+    """Synthetic codex entry, in the same format as the codex contracts"""
+    cost = (1 + id % 10) * 10**18
+    name = f"{codex_name[:-1].capitalize()} {id}"
+    if codex_name == "goods":
+        return [id, cost, 1 + id % 5, name, "A synthetic good"]
+    if codex_name == "armors":
+        return [id, cost, 1 + id % 4, 5 + id % 20, id % 8, 1 + id % 6, -(id % 4), 5 * (id % 7), name, "A synthetic armor"]
+    return [id, cost, 1 + id % 3, 1 + id % 5, 1 + id % 3, 1 + id % 10, 4 + id % 9, 2 + id % 2, id % 3, 10 * (id % 4),
+            name, "A synthetic weapon"]
+
+def skill_by_id(id):
+    return [id, f"Skill {id}", 1 + id % 6, 0, id % 2 == 0, id % 3 == 0, "Synthetic check", "Synthetic action"]
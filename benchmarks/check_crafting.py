@@ -0,0 +1,77 @@
+"""Brute-force check of the crafting probability grids against the scalar rules, with and without NumPy.
+
+`CraftingEngine.get_proba_grid` must match `check_craft_proba` for every combination, and the least craft mats
+from `get_min_craft_mats_grid` must be the first multiple of 10 reaching the target when trying them one by one.
+Also times the grids against the scalar loops:
+    python3 benchmarks/check_crafting.py"""
+
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import crafting
+from crafting import CraftingEngine
+
+CRAFT_LEVELS = range(0, 21)
+INT_LEVELS = range(3, 41)
+ITEM_DCS = range(0, 41)
+CRAFT_MATS = range(0, 421, 10)
+TARGET_PROBAS = [0.01, 0.05, 0.5, 0.73, 0.75, 0.9, 0.99, 1]
+
+def brute_force_min_craft_mats(craft_level, int_level, item_dc, target_proba):
+    return next((mats for mats in CRAFT_MATS
+                 if CraftingEngine.check_craft_proba(craft_level, int_level, item_dc, mats) >= target_proba - 1e-9), None)
+
+def check():
+    """Mismatches against the scalar rules, as a list of strings"""
+    mismatches = []
+    grid = CraftingEngine.get_proba_grid(CRAFT_LEVELS, INT_LEVELS, ITEM_DCS, CRAFT_MATS)
+    for i, craft_level in enumerate(CRAFT_LEVELS):
+        for j, int_level in enumerate(INT_LEVELS):
+            for k, item_dc in enumerate(ITEM_DCS):
+                for l, mats in enumerate(CRAFT_MATS):
+                    expected = CraftingEngine.check_craft_proba(craft_level, int_level, item_dc, mats)
+                    if abs(grid[i][j][k][l] - expected) > 1e-9:
+                        mismatches.append(f"proba({craft_level}, {int_level}, {item_dc}, {mats}): " + \
+                                          f"{grid[i][j][k][l]} instead of {expected}")
+    for target_proba in TARGET_PROBAS:
+        min_mats = CraftingEngine.get_min_craft_mats_grid(CRAFT_LEVELS, INT_LEVELS, ITEM_DCS, target_proba)
+        for i, craft_level in enumerate(CRAFT_LEVELS):
+            for j, int_level in enumerate(INT_LEVELS):
+                for k, item_dc in enumerate(ITEM_DCS):
+                    expected = brute_force_min_craft_mats(craft_level, int_level, item_dc, target_proba)
+                    if min_mats[i][j][k] != expected:
+                        mismatches.append(f"min_mats({craft_level}, {int_level}, {item_dc}, {target_proba}): " + \
+                                          f"{min_mats[i][j][k]} instead of {expected}")
+    return mismatches
+
+def time_it(fun):
+    start = time.perf_counter()
+    fun()
+    return round(time.perf_counter() - start, 3)
+
+def main():
+    numpy = crafting.np
+    failed = False
+    for name, np in [("numpy", numpy), ("plain Python", None)]:
+        if name == "numpy" and np is None:
+            print("NumPy isn't installed: only checking the plain Python grids")
+            continue
+        crafting.np = np
+        mismatches = check()
+        for mismatch in mismatches[:20]:
+            print("Mismatch: " + mismatch)
+        print(f"{name}: {len(mismatches)} mismatches, grid in " + \
+              f"{time_it(lambda: CraftingEngine.get_proba_grid(CRAFT_LEVELS, INT_LEVELS, ITEM_DCS, CRAFT_MATS))}s")
+        failed |= bool(mismatches)
+    crafting.np = numpy
+    scalar_time = time_it(lambda: [CraftingEngine.check_craft_proba(craft_level, int_level, item_dc, mats)
+                                   for craft_level in CRAFT_LEVELS for int_level in INT_LEVELS
+                                   for item_dc in ITEM_DCS for mats in CRAFT_MATS])
+    print(f"Scalar loop: {scalar_time}s")
+    sys.exit(1 if failed else 0)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""Benchmarks of fleet commands against the local stand-in (see `standin.py`).
+
+Each command runs in a subprocess, like a cron job would, against a fresh chain and a fresh cache directory.
+For each fleet size and command, records the wall time, the number of RPC calls (by method and contract function)
+and the bytes transferred. Compare to a stored baseline to catch regressions:
+    python3 benchmarks/run_benchmarks.py --sizes 10 100 --baseline benchmarks/baseline.json
+    python3 benchmarks/run_benchmarks.py --sizes 10 100 --save-baseline benchmarks/baseline.json
+
+Counts and bytes are deterministic, so they get a small tolerance. Wall time depends on the machine: it gets a large one."""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from eth_account import Account
+from tabulate import tabulate
+
+from standin import Chain, FIRST_SUMMONER_ID, StandIn
+
+BOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Deterministic owner of the synthetic fleet
+PRIVATE_KEY = "0x" + "42" * 32
+PASSWORD = "benchmark"
+
+DEFAULT_SIZES = [10, 100, 1000, 10000]
+
+# Relative increase over the baseline that counts as a regression
+COUNT_TOLERANCE = 0.05
+WALL_TIME_TOLERANCE = 0.5
+
+# Crafts attempted per benchmark: one item per 10 summoners
+CRAFTED_PER_SUMMONER = 0.1
+
+def get_commands(fleet_size):
+    """Command line (without the shared options) of each benchmarked command"""
+    return {
+        "show summoners": ["show", "summoners"],
+        "show items": ["show", "items"],
+        "run": ["run"],
+        "transfer-all": ["transfer-all", "gold", "--to", str(FIRST_SUMMONER_ID)],
+        "set-skill all": ["set-skill", "craft", "2", "all"],
+        "craft": ["craft", "good", "1", "--crafter", "all", "--mats", "40",
+                  "-n", str(max(int(fleet_size * CRAFTED_PER_SUMMONER), 1))]
+    }
+
+def write_keyfile(directory):
+    path = os.path.join(directory, "keyfile.json")
+    with open(path, "w") as f:
+        # Cheap key derivation: the benchmark shouldn't measure it
+        json.dump(Account.encrypt(PRIVATE_KEY, PASSWORD, kdf = "pbkdf2", iterations = 2), f)
+    return path
+
+def run_command(name, command, fleet_size, timeout):
+    """Run one command against a fresh chain. Returns its measures."""
+    owner_address = Account.from_key(PRIVATE_KEY).address
+    chain = Chain(owner_address, fleet_size)
+    standin = StandIn(chain).start()
+    try:
+        with tempfile.TemporaryDirectory() as directory:
+            keyfile = write_keyfile(directory)
+            env = dict(os.environ, RARITYBOT_CACHE_DIR = os.path.join(directory, "cache"))
+            args = [sys.executable, os.path.join(BOT_DIR, "rarity.py")] + command + \
+                   ["-k", keyfile, "-p", PASSWORD, "--rpc", standin.url, "--explorer-api", standin.explorer_url,
+                    "--max-rps", "0", "--txmode", "batch"]
+            start = time.time()
+            try:
+                process = subprocess.run(args, cwd = BOT_DIR, env = env, capture_output = True, text = True, timeout = timeout)
+                returncode, output = process.returncode, process.stdout + process.stderr
+            except subprocess.TimeoutExpired as e:
+                returncode, output = None, "Timed out after " + str(timeout) + "s"
+            wall_time = time.time() - start
+    finally:
+        standin.stop()
+    result = dict({"command": name, "fleet_size": fleet_size, "wall_time": round(wall_time, 3),
+                   "returncode": returncode, "transactions": len(chain.transactions)}, **chain.stats.as_dict())
+    if returncode != 0:
+        result["output"] = output[-2000:]
+    return result
+
+def get_key(result):
+    return f"{result['command']} @ {result['fleet_size']}"
+
+def compare(results, baseline):
+    """Regressions against the baseline, as a list of strings"""
+    regressions = []
+    for result in results:
+        reference = baseline.get(get_key(result))
+        if reference is None:
+            continue
+        if result["returncode"] != 0 and reference["returncode"] == 0:
+            regressions.append(f"{get_key(result)}: failed (exit code {result['returncode']})")
+        for measure in ["rpc_calls", "http_requests", "bytes_sent", "bytes_received", "transactions", "wall_time"]:
+            tolerance = WALL_TIME_TOLERANCE if measure == "wall_time" else COUNT_TOLERANCE
+            if result[measure] > reference[measure] * (1 + tolerance):
+                regressions.append(f"{get_key(result)}: {measure} {result[measure]} instead of {reference[measure]}")
+    return regressions
+
+def print_results(results):
+    rows = [{"command": result["command"], "fleet size": result["fleet_size"], "wall time (s)": result["wall_time"],
+             "RPC calls": result["rpc_calls"], "HTTP requests": result["http_requests"], "tx": result["transactions"],
+             "kB received": round(result["bytes_received"] / 1000, 1), "kB sent": round(result["bytes_sent"] / 1000, 1),
+             "status": "ok" if result["returncode"] == 0 else "FAILED"} for result in results]
+    print(tabulate(rows, headers = "keys", tablefmt = "pretty"))
+
+def main():
+    parser = argparse.ArgumentParser(description = "Benchmark fleet commands against a local stand-in node and explorer")
+    parser.add_argument("--sizes", help = "Fleet sizes. Default: " + " ".join(str(size) for size in DEFAULT_SIZES) + \
+                        " (10000 takes a while)", nargs = "+", type = int, default = DEFAULT_SIZES)
+    parser.add_argument("--commands", help = "Commands to benchmark. Default: all.", nargs = "+",
+                        choices = list(get_commands(1)), default = list(get_commands(1)))
+    parser.add_argument("--timeout", help = "Max time (in seconds) for one command. Default: 3600.", default = 3600, type = int)
+    parser.add_argument("--output", help = "Write all measures (with RPC calls by method and function) to this JSON file.")
+    parser.add_argument("--baseline", help = "Compare to this baseline and exit with an error on regressions.")
+    parser.add_argument("--save-baseline", help = "Save the measures as a baseline to this file " + \
+                        "(replacing those of the same commands and sizes).")
+    args = parser.parse_args()
+
+    results = []
+    for fleet_size in args.sizes:
+        commands = get_commands(fleet_size)
+        for name in args.commands:
+            print(f"Running `{name}` with {fleet_size} summoners...", flush = True)
+            result = run_command(name, commands[name], fleet_size, args.timeout)
+            if result["returncode"] != 0:
+                print(result["output"])
+            results.append(result)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent = 2)
+    if args.save_baseline:
+        # Measures of other sizes and commands are kept, e.g. 10k summoners, which takes more than an hour
+        baseline = {}
+        if os.path.exists(args.save_baseline):
+            with open(args.save_baseline) as f:
+                baseline = json.load(f)
+        baseline.update({get_key(result): result for result in results})
+        with open(args.save_baseline, "w") as f:
+            json.dump(baseline, f, indent = 2, sort_keys = True)
+        print("Baseline saved to " + args.save_baseline)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f))
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+        print("No regression against " + args.baseline)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,788 @@
+"""Local stand-in for the Fantom RPC node and the FTMScan API, serving a synthetic fleet.
+
+The chain is a plain Python model of the rarity contracts (only what the bot uses, see `abis.py`):
+calls and tx are decoded with the contract ABIs and run against in-memory state. Each tx is mined at once in its own block.
+Every JSON-RPC call and explorer request is counted, along with the bytes received and sent (see `Stats`).
+
+Run it on its own to point the bot at it:
+    python3 benchmarks/standin.py --fleet-size 100 --owner 0x... --port 8545
+    python3 rarity.py show --rpc http://127.0.0.1:8545/ --explorer-api http://127.0.0.1:8545/api --max-rps 0"""
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+import argparse
+import hashlib
+import json
+import threading
+
+from eth_abi import decode_abi, encode_abi
+from eth_account import Account
+from web3 import Web3
+from web3._utils.abi import get_abi_input_types, get_abi_output_types
+from eth_utils import function_abi_to_4byte_selector
+from web3._utils.events import event_abi_to_log_topic
+import rlp
+
+from abis import ABIS, ADDRESSES, CODEX_SIZES, item_by_id, skill_by_id
+
+ZERO_ADDRESS = "0x" + "0" * 40
+GENESIS_TIME = 1700000000
+CHAIN_ID = 250
+GAS_PRICE = 100 * 10**9
+DAY = 86400
+
+# Summoner owned by the crafting contract, who spends gold and craft mats (see CraftingEngine)
+CRAFTING_SPENDER = 1758709
+FIRST_SUMMONER_ID = 1000000
+
+# Genesis mints are spread over blocks, like real transfer histories (the explorer pages by block)
+MINTS_PER_BLOCK = 100
+
+class Revert(Exception):
+    pass
+
+def require(condition, reason):
+    if not condition:
+        raise Revert(reason)
+
+def to_hex(value):
+    if isinstance(value, int):
+        return hex(value)
+    return "0x" + bytes(value).hex()
+
+def id_topic(value):
+    return "0x" + hex(value)[2:].rjust(64, "0")
+
+def address_topic(address):
+    return "0x" + "0" * 24 + address.lower()[2:]
+
+class Stats:
+    """Counters of one benchmark run"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.http_requests = 0
+            self.rpc_calls = 0
+            self.rpc_errors = 0
+            self.bytes_received = 0
+            self.bytes_sent = 0
+            self.explorer_requests = 0
+            self.methods = {}
+            self.functions = {}
+
+    def count(self, counters, key, amount = 1):
+        counters[key] = counters.get(key, 0) + amount
+
+    def as_dict(self):
+        with self.lock:
+            return {
+                "http_requests": self.http_requests,
+                "rpc_calls": self.rpc_calls,
+                "rpc_errors": self.rpc_errors,
+                "bytes_received": self.bytes_received,
+                "bytes_sent": self.bytes_sent,
+                "explorer_requests": self.explorer_requests,
+                "methods": dict(sorted(self.methods.items())),
+                "functions": dict(sorted(self.functions.items()))
+            }
+
+class Chain:
+    """In-memory rarity contracts, with `fleet_size` summoners (and some crafted items) owned by `owner_address`"""
+
+    def __init__(self, owner_address, fleet_size, stats = None):
+        self.owner = Web3.toChecksumAddress(owner_address)
+        self.stats = stats or Stats()
+        # Functions by contract name and selector, decoded with eth_abi directly (much faster than web3 contracts)
+        self.functions = {(name, bytes(function_abi_to_4byte_selector(abi))):
+                              (abi["name"], get_abi_input_types(abi), get_abi_output_types(abi))
+                          for name, contract_abi in ABIS.items() for abi in contract_abi if abi["type"] == "function"}
+        self.names_by_address = {address.lower(): name for name, address in ADDRESSES.items()}
+        self.event_topics = {(name, abi["name"]): Web3.toHex(event_abi_to_log_topic(abi))
+                             for name, contract_abi in ABIS.items() for abi in contract_abi if abi["type"] == "event"}
+        self.handlers = {
+            "summoner": SummonerContract(self), "attributes": AttributesContract(self),
+            "gold": GoldContract(self), "craft1": CraftMatsContract(self), "skills": SkillsContract(self),
+            "class_skills": SkillsContract(self), "crafting": CraftingContract(self),
+            "goods": CodexContract("goods"), "armors": CodexContract("armors"), "weapons": CodexContract("weapons"),
+            "skill_codex": CodexContract("skill_codex"), "multicall": MulticallContract(self)
+        }
+
+        self.blocks = [] # {"number", "timestamp", "hash", "transactions"}
+        self.transactions = {} # tx hash => tx
+        self.receipts = {} # tx hash => receipt
+        self.logs = [] # all logs, in chain order
+        self.nft_transfers = [] # for the explorer
+        self.nonces = {} # address => tx count
+        self.pending_logs = None
+
+        self.summoners = {}
+        self.approvals_for_all = set()
+        self.items = {}
+        self.mine_block()
+        self.create_fleet(fleet_size)
+
+    ### BLOCKS ---------------------------
+
+    @property
+    def block_number(self):
+        return len(self.blocks) - 1
+
+    @property
+    def timestamp(self):
+        return self.blocks[-1]["timestamp"]
+
+    def mine_block(self, tx_hashes = ()):
+        number = len(self.blocks)
+        self.blocks.append({"number": number, "timestamp": GENESIS_TIME + number,
+                            "hash": Web3.toHex(Web3.keccak(text = f"block {number}")), "transactions": list(tx_hashes)})
+        return self.blocks[-1]
+
+    def emit(self, contract_name, event_name, topics, data = b""):
+        """Log an event of the tx being run"""
+        self.pending_logs.append({"address": ADDRESSES[contract_name],
+                                  "topics": [self.event_topics[(contract_name, event_name)]] + topics,
+                                  "data": to_hex(data)})
+
+    def transfer_nft(self, contract_name, from_address, to_address, token_id, tx_hash):
+        self.emit(contract_name, "Transfer", [address_topic(from_address), address_topic(to_address), id_topic(token_id)])
+        self.nft_transfers.append({"blockNumber": str(len(self.blocks)), "hash": tx_hash, "from": from_address.lower(),
+                                   "to": to_address.lower(), "tokenID": str(token_id),
+                                   "contractAddress": ADDRESSES[contract_name]})
+
+    ### FLEET ----------------------------
+
+    def create_fleet(self, fleet_size):
+        """Deterministic mix of summoners: ready or not, with or without attributes, crafters or not, etc"""
+        for start in range(0, fleet_size, MINTS_PER_BLOCK):
+            tx_hash = Web3.toHex(Web3.keccak(text = f"genesis {start}"))
+            self.pending_logs = []
+            for i in range(start, min(start + MINTS_PER_BLOCK, fleet_size)):
+                token_id = FIRST_SUMMONER_ID + i
+                self.summoners[token_id] = self.new_summoner(i)
+                self.transfer_nft("summoner", ZERO_ADDRESS, self.owner, token_id, tx_hash)
+                if i % 5 == 0:
+                    # Some crafted items
+                    item_id = len(self.items) + 1
+                    base_type = 1 + i % 3
+                    codex_name = ["goods", "armors", "weapons"][base_type - 1]
+                    self.items[item_id] = [base_type, 1 + i % CODEX_SIZES[codex_name], GENESIS_TIME, token_id]
+                    self.transfer_nft("crafting", ZERO_ADDRESS, self.owner, item_id, tx_hash)
+            self.add_logs(self.pending_logs, tx_hash, len(self.blocks))
+            self.mine_block([])
+        self.pending_logs = None
+
+    def new_summoner(self, i):
+        crafting_contract = Web3.toChecksumAddress(ADDRESSES["crafting"])
+        has_attributes = i % 4 != 0
+        is_crafter = has_attributes and i % 2 == 0
+        skills = [0] * 36
+        if is_crafter:
+            skills[5] = 1 + i % 4
+        level = 1 + i % 6
+        return {
+            "owner": self.owner,
+            "xp": (i % 4) * 500 * 10**18,
+            "log": 0 if i % 3 else GENESIS_TIME + DAY // 2,
+            "class": 1 + i % 11,
+            "level": level,
+            "approved": crafting_contract if is_crafter else ZERO_ADDRESS,
+            "attributes": [10 + i % 5, 10, 12, 12 + 2 * (i % 4), 10, 8] if has_attributes else None,
+            "skills": skills,
+            "cellar_log": 0 if i % 2 else GENESIS_TIME + DAY // 2,
+            "claimed_level": level if i % 2 else 1,
+            "gold": (i % 5) * 20 * 10**18,
+            "craft1": (i % 6) * 30 + (100 if is_crafter else 0),
+            "crafts": 0,
+            "allowances": {("gold", CRAFTING_SPENDER): 2**256 - 1, ("craft1", CRAFTING_SPENDER): 2**256 - 1} if is_crafter else {}
+        }
+
+    def is_approved_or_owner(self, sender, token_id):
+        summoner = self.summoners.get(token_id)
+        if summoner is None:
+            return False
+        sender = Web3.toChecksumAddress(sender)
+        return sender in (summoner["owner"], summoner["approved"]) or (summoner["owner"], sender) in self.approvals_for_all
+
+    ### CALLS AND TX ---------------------
+
+    def decode(self, to, data):
+        contract_name = self.names_by_address.get((to or "").lower())
+        require(contract_name is not None, "no contract at " + str(to))
+        data = Web3.toBytes(hexstr = data) if isinstance(data, str) else bytes(data)
+        function = self.functions.get((contract_name, data[:4]))
+        require(function is not None, "unknown function")
+        function_name, input_types, output_types = function
+        try:
+            values = decode_abi(input_types, data[4:])
+        except Exception:
+            raise Revert("invalid input")
+        # Same types as web3 (addresses are checksummed, arrays are lists)
+        values = [Web3.toChecksumAddress(value) if param_type == "address" else (list(value) if isinstance(value, tuple) else value)
+                  for param_type, value in zip(input_types, values)]
+        return contract_name, function_name, values, output_types
+
+    def call(self, to, data, sender, tx_hash = None):
+        """Run a function (call or tx) and return its encoded output. Raises Revert."""
+        contract_name, function_name, values, output_types = self.decode(to, data)
+        self.stats.count(self.stats.functions, contract_name + "." + function_name)
+        handler = getattr(self.handlers[contract_name], function_name)
+        outputs = handler(Web3.toChecksumAddress(sender or ZERO_ADDRESS), tx_hash, *values)
+        if not output_types:
+            return b""
+        return encode_abi(output_types, outputs if len(output_types) > 1 else [outputs])
+
+    def send_raw_transaction(self, raw_tx):
+        raw_tx = Web3.toBytes(hexstr = raw_tx)
+        tx_hash = Web3.toHex(Web3.keccak(raw_tx))
+        if tx_hash in self.transactions:
+            raise ValueError("already known")
+        nonce, gas_price, gas, to, value, data, v, r, s = rlp.decode(raw_tx)
+        sender = Account.recover_transaction(raw_tx)
+        to = Web3.toChecksumAddress(to)
+        tx = {"hash": tx_hash, "from": sender, "to": to, "nonce": int.from_bytes(nonce, "big"), "input": to_hex(data),
+              "gas": int.from_bytes(gas, "big"), "gasPrice": int.from_bytes(gas_price, "big")}
+
+        # Run the tx, then mine it in its own block
+        self.pending_logs = []
+        try:
+            self.call(to, data, sender, tx_hash)
+            status = 1
+        except Revert:
+            status = 0
+            self.pending_logs = []
+        block = self.mine_block([tx_hash])
+        self.nonces[sender] = self.nonces.get(sender, 0) + 1
+        tx["blockNumber"] = block["number"]
+        self.transactions[tx_hash] = tx
+        self.receipts[tx_hash] = {"status": status, "blockNumber": block["number"], "from": sender, "to": to,
+                                  "gasUsed": min(tx["gas"], 50000), "gasPrice": tx["gasPrice"],
+                                  "logs": self.add_logs(self.pending_logs, tx_hash, block["number"])}
+        self.pending_logs = None
+        return tx_hash
+
+    def add_logs(self, logs, tx_hash, block_number):
+        for log_index, log in enumerate(logs):
+            log.update({"blockNumber": block_number, "transactionHash": tx_hash, "logIndex": log_index})
+        self.logs.extend(logs)
+        return logs
+
+    def get_logs(self, address, topics, from_block, to_block):
+        addresses = {a.lower() for a in (address if isinstance(address, list) else [address])} if address else None
+        matches = []
+        for log in self.logs:
+            if not from_block <= log["blockNumber"] <= to_block:
+                continue
+            if addresses is not None and log["address"].lower() not in addresses:
+                continue
+            if all(topic is None or (log["topics"][i] if i < len(log["topics"]) else None) in
+                   (topic if isinstance(topic, list) else [topic]) for i, topic in enumerate(topics or [])):
+                matches.append(log)
+        return matches
+
+class SummonerContract:
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def get(self, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        require(summoner is not None, "no summoner")
+        return summoner
+
+    def ownerOf(self, sender, tx_hash, token_id):
+        return self.get(token_id)["owner"]
+
+    def summoner(self, sender, tx_hash, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        if summoner is None:
+            return [0, 0, 0, 0]
+        return [summoner["xp"], summoner["log"], summoner["class"], summoner["level"]]
+
+    def adventurers_log(self, sender, tx_hash, token_id):
+        return self.get(token_id)["log"]
+
+    def getApproved(self, sender, tx_hash, token_id):
+        return self.get(token_id)["approved"]
+
+    def isApprovedForAll(self, sender, tx_hash, owner, operator):
+        return (owner, operator) in self.chain.approvals_for_all
+
+    def xp_required(self, sender, tx_hash, level):
+        return level * (level + 1) // 2 * 1000 * 10**18
+
+    def adventure(self, sender, tx_hash, token_id):
+        require(self.chain.is_approved_or_owner(sender, token_id), "!owner")
+        summoner = self.get(token_id)
+        require(self.chain.timestamp + 1 > summoner["log"], "!log")
+        summoner["log"] = self.chain.timestamp + 1 + DAY
+        summoner["xp"] += 250 * 10**18
+
+    def level_up(self, sender, tx_hash, token_id):
+        require(self.chain.is_approved_or_owner(sender, token_id), "!owner")
+        summoner = self.get(token_id)
+        xp_required = self.xp_required(sender, tx_hash, summoner["level"])
+        require(summoner["xp"] >= xp_required, "!xp")
+        summoner["xp"] -= xp_required
+        summoner["level"] += 1
+        # Like the contract, the event holds the level before the level up
+        self.chain.emit("summoner", "leveled", [address_topic(sender)], encode_abi(["uint256", "uint256"], [summoner["level"] - 1, token_id]))
+
+    def approve(self, sender, tx_hash, to, token_id):
+        summoner = self.get(token_id)
+        require(summoner["owner"] == sender, "!owner")
+        summoner["approved"] = to
+
+    def setApprovalForAll(self, sender, tx_hash, operator, approved):
+        if approved:
+            self.chain.approvals_for_all.add((sender, operator))
+        else:
+            self.chain.approvals_for_all.discard((sender, operator))
+
+    def safeTransferFrom(self, sender, tx_hash, from_address, to_address, token_id):
+        require(self.chain.is_approved_or_owner(sender, token_id), "!owner")
+        summoner = self.get(token_id)
+        require(summoner["owner"] == from_address, "!from")
+        summoner["owner"] = to_address
+        summoner["approved"] = ZERO_ADDRESS
+        self.chain.transfer_nft("summoner", from_address, to_address, token_id, tx_hash)
+
+    def summon(self, sender, tx_hash, class_id):
+        require(1 <= class_id <= 11, "!class")
+        token_id = FIRST_SUMMONER_ID + len(self.chain.summoners)
+        summoner = self.chain.new_summoner(len(self.chain.summoners))
+        summoner.update({"owner": sender, "class": class_id, "level": 1, "xp": 0, "log": 0})
+        self.chain.summoners[token_id] = summoner
+        self.chain.transfer_nft("summoner", ZERO_ADDRESS, sender, token_id, tx_hash)
+        self.chain.emit("summoner", "summoned", [address_topic(sender)], encode_abi(["uint256", "uint256"], [class_id, token_id]))
+
+class AttributesContract:
+
+    POINT_COSTS = {8: 0, 9: 1, 10: 2, 11: 3, 12: 4, 13: 5, 14: 6, 15: 8, 16: 10, 17: 13, 18: 16}
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def ability_scores(self, sender, tx_hash, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        return (summoner and summoner["attributes"]) or [0] * 6
+
+    def character_created(self, sender, tx_hash, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        return bool(summoner and summoner["attributes"])
+
+    def calculate_point_buy(self, sender, tx_hash, *scores):
+        require(all(score in self.POINT_COSTS for score in scores), "!score")
+        return sum(self.POINT_COSTS[score] for score in scores)
+
+    def point_buy(self, sender, tx_hash, token_id, *scores):
+        require(self.chain.is_approved_or_owner(sender, token_id), "!owner")
+        summoner = self.chain.summoners[token_id]
+        require(not summoner["attributes"], "created")
+        require(self.calculate_point_buy(sender, tx_hash, *scores) == 32, "!points")
+        summoner["attributes"] = list(scores)
+        self.chain.emit("attributes", "Created", [address_topic(sender)], encode_abi(["uint256"] + ["uint32"] * 6, [token_id] + list(scores)))
+
+class SummonerTokenContract:
+    """Gold and craft mats: balances and allowances of summoners"""
+
+    name = None
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def balanceOf(self, sender, tx_hash, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        return summoner[self.name] if summoner else 0
+
+    def allowance(self, sender, tx_hash, from_id, spender_id):
+        summoner = self.chain.summoners.get(from_id)
+        return summoner["allowances"].get((self.name, spender_id), 0) if summoner else 0
+
+    def move(self, from_id, to_id, amount):
+        """Move tokens between summoners (the crafting spender isn't modeled as a summoner)"""
+        require(self.chain.summoners[from_id][self.name] >= amount, "!balance")
+        self.chain.summoners[from_id][self.name] -= amount
+        if to_id in self.chain.summoners:
+            self.chain.summoners[to_id][self.name] += amount
+        self.chain.emit(self.name, "Transfer", [id_topic(from_id), id_topic(to_id)], encode_abi(["uint256"], [amount]))
+
+    def mint(self, to_id, amount):
+        self.chain.summoners[to_id][self.name] += amount
+        self.chain.emit(self.name, "Transfer", [id_topic(0), id_topic(to_id)], encode_abi(["uint256"], [amount]))
+
+    def transfer(self, sender, tx_hash, from_id, to_id, amount):
+        require(self.chain.is_approved_or_owner(sender, from_id), "!owner")
+        self.move(from_id, to_id, amount)
+        return True
+
+    def approve(self, sender, tx_hash, from_id, spender_id, amount):
+        require(self.chain.is_approved_or_owner(sender, from_id), "!owner")
+        self.chain.summoners[from_id]["allowances"][(self.name, spender_id)] = amount
+        self.chain.emit(self.name, "Approval", [id_topic(from_id), id_topic(spender_id)], encode_abi(["uint256"], [amount]))
+        return True
+
+class GoldContract(SummonerTokenContract):
+
+    name = "gold"
+
+    def claimable(self, sender, tx_hash, token_id):
+        require(self.chain.is_approved_or_owner(sender, token_id), "!owner")
+        summoner = self.chain.summoners[token_id]
+        return max(summoner["level"] - summoner["claimed_level"], 0) * 500 * 10**18
+
+    def claim(self, sender, tx_hash, token_id):
+        amount = self.claimable(sender, tx_hash, token_id)
+        require(amount > 0, "!claimable")
+        self.chain.summoners[token_id]["claimed_level"] = self.chain.summoners[token_id]["level"]
+        self.mint(token_id, amount)
+
+class CraftMatsContract(SummonerTokenContract):
+
+    name = "craft1"
+
+    def adventurers_log(self, sender, tx_hash, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        return summoner["cellar_log"] if summoner else 0
+
+    def scout(self, sender, tx_hash, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        if not summoner or not summoner["attributes"]:
+            return 0
+        return 3 * summoner["level"]
+
+    def adventure(self, sender, tx_hash, token_id):
+        require(self.chain.is_approved_or_owner(sender, token_id), "!owner")
+        summoner = self.chain.summoners[token_id]
+        require(self.chain.timestamp + 1 > summoner["cellar_log"], "!log")
+        reward = self.scout(sender, tx_hash, token_id)
+        require(reward > 0, "!reward")
+        summoner["cellar_log"] = self.chain.timestamp + 1 + DAY
+        self.mint(token_id, reward)
+        return reward
+
+class SkillsContract:
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def get_skills(self, sender, tx_hash, token_id):
+        summoner = self.chain.summoners.get(token_id)
+        return summoner["skills"] if summoner else [0] * 36
+
+    def is_valid_set(self, sender, tx_hash, token_id, skills):
+        summoner = self.chain.summoners.get(token_id)
+        if not summoner or not summoner["attributes"]:
+            return False
+        int_modifier = (summoner["attributes"][3] - 10) // 2
+        points = max(4 + int_modifier, 1) * (summoner["level"] + 3)
+        return max(skills) <= summoner["level"] + 3 and sum(skills) <= points
+
+    def set_skills(self, sender, tx_hash, token_id, skills):
+        require(self.chain.is_approved_or_owner(sender, token_id), "!owner")
+        summoner = self.chain.summoners[token_id]
+        require(self.is_valid_set(sender, tx_hash, token_id, skills), "!valid")
+        require(all(new >= old for new, old in zip(skills, summoner["skills"])), "!lower")
+        summoner["skills"] = list(skills)
+
+    def class_skills_by_name(self, sender, tx_hash, class_id):
+        return [f"Skill {id}" for id in range(1, CODEX_SIZES["skill_codex"] + 1) if id % 11 + 1 == class_id or id % 3 == 0]
+
+class CraftingContract:
+
+    XP_PER_CRAFT = 250 * 10**18
+    WEAPON_DC = {1: 20, 2: 25, 3: 30}
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def items(self, sender, tx_hash, item_id):
+        require(item_id in self.chain.items, "!item")
+        return self.chain.items[item_id]
+
+    def get_item(self, base_type, item_type):
+        require(base_type in (1, 2, 3), "!base_type")
+        codex_name = ["goods", "armors", "weapons"][base_type - 1]
+        require(1 <= item_type <= CODEX_SIZES[codex_name], "!item_type")
+        item = item_by_id(codex_name, item_type)
+        dc = 20 if base_type == 1 else (20 + item[4] if base_type == 2 else self.WEAPON_DC[item[2]])
+        return item[1], dc
+
+    def roll(self, summoner_id, salt):
+        """Deterministic d20 (0..19), whatever the order tx of different summoners are mined in"""
+        return hashlib.sha256(f"{summoner_id}:{salt}".encode()).digest()[0] % 20
+
+    def check(self, summoner_id, base_type, item_type, craft_mats, salt):
+        summoner = self.chain.summoners[summoner_id]
+        cost, dc = self.get_item(base_type, item_type)
+        dc = max(dc - craft_mats // 10, 0)
+        craft_level = summoner["skills"][5]
+        int_modifier = ((summoner["attributes"] or [0] * 6)[3] - 10) // 2
+        if craft_level == 0 or craft_level + int_modifier <= 0:
+            return False, 0, cost, dc
+        check = craft_level + int_modifier + self.roll(summoner_id, salt)
+        return check >= dc, check, cost, dc
+
+    def simulate(self, sender, tx_hash, summoner_id, base_type, item_type, craft_mats):
+        require(summoner_id in self.chain.summoners, "!summoner")
+        return list(self.check(summoner_id, base_type, item_type, craft_mats, "block " + str(self.chain.block_number)))
+
+    def craft(self, sender, tx_hash, summoner_id, base_type, item_type, craft_mats):
+        chain = self.chain
+        require(chain.is_approved_or_owner(sender, summoner_id), "!owner")
+        summoner = chain.summoners[summoner_id]
+        crafting_contract = Web3.toChecksumAddress(ADDRESSES["crafting"])
+        require(chain.is_approved_or_owner(crafting_contract, summoner_id), "!approved")
+        require(summoner["xp"] >= self.XP_PER_CRAFT, "!xp")
+        require(summoner["allowances"].get(("craft1", CRAFTING_SPENDER), 0) >= craft_mats, "!craft allowance")
+        require(summoner["craft1"] >= craft_mats, "!craft")
+        crafted, check, cost, dc = self.check(summoner_id, base_type, item_type, craft_mats, summoner["crafts"] + 1)
+        if crafted:
+            require(summoner["allowances"].get(("gold", CRAFTING_SPENDER), 0) >= cost, "!gold allowance")
+            require(summoner["gold"] >= cost, "!gold")
+
+        summoner["crafts"] += 1
+        if craft_mats:
+            chain.handlers["craft1"].move(summoner_id, CRAFTING_SPENDER, craft_mats)
+        if crafted:
+            chain.handlers["gold"].move(summoner_id, CRAFTING_SPENDER, cost)
+            item_id = len(chain.items) + 1
+            chain.items[item_id] = [base_type, item_type, chain.timestamp + 1, summoner_id]
+            chain.transfer_nft("crafting", ZERO_ADDRESS, sender, item_id, tx_hash)
+        summoner["xp"] -= self.XP_PER_CRAFT
+
+class CodexContract:
+
+    def __init__(self, codex_name):
+        self.codex_name = codex_name
+
+    def item_by_id(self, sender, tx_hash, id):
+        require(1 <= id <= CODEX_SIZES[self.codex_name], "!id")
+        return item_by_id(self.codex_name, id)
+
+    def skill_by_id(self, sender, tx_hash, id):
+        require(1 <= id <= CODEX_SIZES["skill_codex"], "!id")
+        return skill_by_id(id)
+
+class MulticallContract:
+
+    def __init__(self, chain):
+        self.chain = chain
+
+    def aggregate3(self, sender, tx_hash, calls):
+        results = []
+        for target, allow_failure, call_data in calls:
+            try:
+                # Reads are made by the multicall contract
+                results.append((True, self.chain.call(target, call_data, ADDRESSES["multicall"])))
+            except Revert:
+                require(allow_failure, "call failed")
+                results.append((False, b""))
+        return results
+
+class StandIn:
+    """JSON-RPC node and FTMScan-like API for a `Chain`, served over HTTP on localhost"""
+
+    def __init__(self, chain, port = 0):
+        self.chain = chain
+        self.stats = chain.stats
+        self.lock = threading.Lock()
+        standin = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+                self.respond(standin.handle_rpc(body), len(body))
+
+            def do_GET(self):
+                self.respond(standin.handle_explorer(self.path), 0)
+
+            def respond(self, payload, bytes_received):
+                response = json.dumps(payload).encode()
+                with standin.stats.lock:
+                    standin.stats.bytes_received += bytes_received + len(self.requestline) + 2
+                    standin.stats.bytes_sent += len(response)
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(response)))
+                self.end_headers()
+                self.wfile.write(response)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_address[1]}/"
+
+    @property
+    def explorer_url(self):
+        return self.url + "api"
+
+    def start(self):
+        self.thread = threading.Thread(target = self.server.serve_forever, daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+    ### JSON-RPC -------------------------
+
+    def handle_rpc(self, body):
+        try:
+            request = json.loads(body)
+        except ValueError:
+            return {"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "parse error"}}
+        with self.stats.lock:
+            self.stats.http_requests += 1
+        if isinstance(request, list):
+            return [self.handle_request(r) for r in request]
+        return self.handle_request(request)
+
+    def handle_request(self, request):
+        method = request.get("method")
+        params = request.get("params", [])
+        with self.stats.lock:
+            self.stats.rpc_calls += 1
+            self.stats.count(self.stats.methods, method)
+        try:
+            with self.lock:
+                result = self.dispatch(method, params)
+            return {"jsonrpc": "2.0", "id": request.get("id"), "result": result}
+        except (Revert, ValueError) as e:
+            with self.stats.lock:
+                self.stats.rpc_errors += 1
+            if isinstance(e, Revert):
+                error = {"code": 3, "message": "execution reverted: " + str(e), "data": "0x"}
+            else:
+                error = {"code": -32000, "message": str(e)}
+            return {"jsonrpc": "2.0", "id": request.get("id"), "error": error}
+
+    def get_block_number(self, tag):
+        if tag in (None, "latest", "pending", "safe", "finalized"):
+            return self.chain.block_number
+        if tag == "earliest":
+            return 0
+        return min(int(tag, 16), self.chain.block_number)
+
+    def dispatch(self, method, params):
+        chain = self.chain
+        if method == "eth_chainId":
+            return hex(CHAIN_ID)
+        if method == "net_version":
+            return str(CHAIN_ID)
+        if method == "eth_blockNumber":
+            return hex(chain.block_number)
+        if method == "eth_gasPrice":
+            return hex(GAS_PRICE)
+        if method == "eth_getBlockByNumber":
+            return self.format_block(chain.blocks[self.get_block_number(params[0])])
+        if method == "eth_call":
+            call = params[0]
+            return to_hex(chain.call(call.get("to"), call.get("data", call.get("input", "0x")), call.get("from")))
+        if method == "eth_estimateGas":
+            return hex(300000)
+        if method == "eth_getTransactionCount":
+            return hex(chain.nonces.get(Web3.toChecksumAddress(params[0]), 0))
+        if method == "eth_sendRawTransaction":
+            return chain.send_raw_transaction(params[0])
+        if method == "eth_getTransactionReceipt":
+            return self.format_receipt(params[0]) if params[0] in chain.receipts else None
+        if method == "eth_getTransactionByHash":
+            return self.format_transaction(params[0]) if params[0] in chain.transactions else None
+        if method == "eth_getLogs":
+            log_filter = params[0]
+            logs = chain.get_logs(log_filter.get("address"), log_filter.get("topics"),
+                                  self.get_block_number(log_filter.get("fromBlock", "latest")),
+                                  self.get_block_number(log_filter.get("toBlock", "latest")))
+            return [self.format_log(log) for log in logs]
+        raise ValueError("method not supported: " + str(method))
+
+    def format_block(self, block):
+        return {"number": hex(block["number"]), "hash": block["hash"],
+                "parentHash": self.chain.blocks[max(block["number"] - 1, 0)]["hash"],
+                "timestamp": hex(block["timestamp"]), "transactions": block["transactions"],
+                "gasLimit": hex(30000000), "gasUsed": "0x0", "miner": ZERO_ADDRESS, "difficulty": "0x0",
+                "totalDifficulty": "0x0", "extraData": "0x", "size": "0x0", "nonce": "0x0000000000000000",
+                "logsBloom": "0x" + "00" * 256, "sha3Uncles": "0x" + "00" * 32, "stateRoot": "0x" + "00" * 32,
+                "transactionsRoot": "0x" + "00" * 32, "receiptsRoot": "0x" + "00" * 32, "uncles": []}
+
+    def format_log(self, log):
+        block = self.chain.blocks[log["blockNumber"]]
+        return {"address": Web3.toChecksumAddress(log["address"]), "topics": log["topics"], "data": log["data"],
+                "blockNumber": hex(log["blockNumber"]), "blockHash": block["hash"], "transactionHash": log["transactionHash"],
+                "transactionIndex": "0x0", "logIndex": hex(log["logIndex"]), "removed": False}
+
+    def format_receipt(self, tx_hash):
+        receipt = self.chain.receipts[tx_hash]
+        return {"transactionHash": tx_hash, "transactionIndex": "0x0",
+                "blockHash": self.chain.blocks[receipt["blockNumber"]]["hash"], "blockNumber": hex(receipt["blockNumber"]),
+                "from": receipt["from"], "to": receipt["to"], "cumulativeGasUsed": hex(receipt["gasUsed"]),
+                "gasUsed": hex(receipt["gasUsed"]), "effectiveGasPrice": hex(receipt["gasPrice"]), "contractAddress": None,
+                "logs": [self.format_log(log) for log in receipt["logs"]], "logsBloom": "0x" + "00" * 256,
+                "status": hex(receipt["status"]), "type": "0x0"}
+
+    def format_transaction(self, tx_hash):
+        tx = self.chain.transactions[tx_hash]
+        return {"hash": tx_hash, "from": tx["from"], "to": tx["to"], "nonce": hex(tx["nonce"]), "input": tx["input"],
+                "gas": hex(tx["gas"]), "gasPrice": hex(tx["gasPrice"]), "value": "0x0",
+                "blockNumber": hex(tx["blockNumber"]), "blockHash": self.chain.blocks[tx["blockNumber"]]["hash"],
+                "transactionIndex": "0x0", "v": "0x0", "r": "0x0", "s": "0x0"}
+
+    ### EXPLORER -------------------------
+
+    def handle_explorer(self, path):
+        query = {key: values[0] for key, values in parse_qs(urlparse(path).query).items()}
+        action = query.get("action")
+        with self.stats.lock:
+            self.stats.explorer_requests += 1
+            self.stats.count(self.stats.methods, "explorer." + str(action))
+        if action == "getabi":
+            name = self.chain.names_by_address.get(query.get("address", "").lower())
+            if name is None:
+                return {"status": "0", "message": "NOTOK", "result": "Contract source code not verified"}
+            return {"status": "1", "message": "OK", "result": json.dumps(ABIS[name])}
+        if action == "tokennfttx":
+            with self.lock:
+                return self.get_nft_transfers(query)
+        return {"status": "0", "message": "NOTOK", "result": "Unknown action"}
+
+    def get_nft_transfers(self, query):
+        address = query.get("address", "").lower()
+        contract_address = query.get("contractaddress", "").lower()
+        start_block = int(query.get("startblock", 0))
+        end_block = int(query.get("endblock", 999999999))
+        page = int(query.get("page", 1))
+        offset = int(query.get("offset", 10000))
+        transfers = [transfer for transfer in self.chain.nft_transfers
+                     if transfer["contractAddress"].lower() == contract_address and address in (transfer["from"], transfer["to"])
+                     and start_block <= int(transfer["blockNumber"]) <= end_block]
+        transfers = transfers[(page - 1) * offset:page * offset]
+        if not transfers:
+            return {"status": "0", "message": "No transactions found", "result": []}
+        return {"status": "1", "message": "OK", "result": transfers}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description = "Local stand-in for the RPC node and FTMScan, with a synthetic fleet")
+    parser.add_argument("--fleet-size", help = "Number of summoners. Default: 100", default = 100, type = int)
+    parser.add_argument("--owner", help = "Address owning the fleet", required = True)
+    parser.add_argument("--port", help = "Port to listen on. Default: 8545", default = 8545, type = int)
+    args = parser.parse_args()
+
+    standin = StandIn(Chain(args.owner, args.fleet_size), port = args.port)
+    print(f"Serving {args.fleet_size} summoners of {args.owner} on {standin.url} (explorer API: {standin.explorer_url})")
+    try:
+        standin.server.serve_forever()
+    except KeyboardInterrupt:
+        print(json.dumps(standin.stats.as_dict(), indent = 2))
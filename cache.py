@@ -0,0 +1,61 @@
+import json
+import os
+
+try:
+    import fcntl
+except ImportError:
+    # Windows
+    fcntl = None
+    import msvcrt
+
+# Where the bot keeps data between runs (ABIs, ownership index, etc).
+# Override with the RARITYBOT_CACHE_DIR environment variable.
+CACHE_DIR = os.environ.get("RARITYBOT_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".raritybot"))
+
+def cache_path(*path_parts):
+    """Path to a file in the cache directory. Creates parent directories as needed."""
+    path = os.path.join(CACHE_DIR, *path_parts)
+    os.makedirs(os.path.dirname(path), exist_ok = True)
+    return path
+
+def load_json(path, default = None):
+    """Load a json file, or return `default` if it doesn't exist or is corrupted"""
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        return default
+
+def save_json(path, data):
+    """Save data as json. Writes to a temporary file first so readers never see a partial file."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok = True)
+    tmp_path = path + ".tmp." + str(os.getpid())
+    with open(tmp_path, mode = "w") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+    return path
+
+class FileLock:
+    """Exclusive lock shared between processes (e.g. overlapping cron jobs). Use with `with FileLock(path):`"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, mode = "a")
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+        return self
+
+    def __exit__(self, *exc_info):
+        if fcntl:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
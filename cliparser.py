@@ -1,8 +1,20 @@
 import argparse
 from raritydata import RarityData
+import network
+import ownership
+from transacter import GasPriceOracle
+from daemon import Daemon
+from crafting import CraftingSimulator
 
 DEFAULT_KEY_FILE = "privatekeyencrypted.json"
 
+def percentage(value):
+    """Argparse type for a chance of success, in %: an integer in (0, 100]"""
+    value = int(value)
+    if not 0 < value <= 100:
+        raise argparse.ArgumentTypeError(str(value) + " is not a percentage between 1 and 100")
+    return value
+
 def create_parser():
     """Create rarity CLI parser"""
 
@@ -22,6 +34,42 @@ def create_parser():
     config_group.add_argument('-g', '--maxgasprice', help='''Optional max gas price (integer in gwei) you're willing to pay. 
     Abort if gas price is superior. Gas price is typically between 100 and 500 gwei.''',
                         default = 10000, type = int)
+    config_group.add_argument('--gas-price-ttl', help='''How long (in seconds) the gas price is cached before asking the node again. 
+                        Default: ''' + str(GasPriceOracle.DEFAULT_TTL) + '''. Use 1 to check it about every block, 0 to check it before every tx.''',
+                        default = GasPriceOracle.DEFAULT_TTL, type = int)
+    config_group.add_argument('--rpc', help='''RPC endpoint used for all blockchain calls. 
+                        Default: ''' + network.DEFAULT_RPC_ENDPOINT,
+                        default = network.DEFAULT_RPC_ENDPOINT)
+    config_group.add_argument('--explorer-api', help='''FTMScan-compatible API used to list transfers and download ABIs. 
+                        Default: ''' + network.DEFAULT_EXPLORER_API,
+                        default = network.DEFAULT_EXPLORER_API)
+    config_group.add_argument('--pool-size', help='''Max number of HTTP connections kept open to the RPC endpoint 
+                        and to FTMScan. Default: ''' + str(network.DEFAULT_POOL_SIZE),
+                        default = network.DEFAULT_POOL_SIZE, type = int)
+    config_group.add_argument('--rescan', help='''Scan the whole transfer history to find summoners and items, 
+                        instead of only the transfers since the last run.''',
+                        action = "store_true")
+    config_group.add_argument('--ownership-source', help='''Where to find which summoners and items belong to the address. 
+                        "ftmscan" uses the FTMScan API (default), "logs" scans Transfer events directly with the RPC endpoint.''',
+                        default = ownership.DEFAULT_SOURCE, choices = ownership.SOURCES)
+    config_group.add_argument('--scan-from-block', help='''First block scanned with `--ownership-source logs`. 
+                        Default: ''' + str(ownership.DEFAULT_FIRST_BLOCK) + ''' (before rarity was deployed). Use 0 on a local dev chain.''',
+                        default = ownership.DEFAULT_FIRST_BLOCK, type = int)
+    config_group.add_argument('--workers', help='''Max number of requests made in parallel 
+                        (to load summoners or scan logs). Default: ''' + str(network.DEFAULT_WORKERS),
+                        default = network.DEFAULT_WORKERS, type = int)
+    config_group.add_argument('--max-rps', help='''Max number of requests per second to the RPC endpoint, 
+                        across all parallel workers. 0 for no limit. Default: ''' + str(network.DEFAULT_MAX_RPS),
+                        default = network.DEFAULT_MAX_RPS, type = int)
+
+    config_group.add_argument('--metrics-file', help='''Append the RPC metrics of the run (calls, errors, bytes and latency 
+                        by RPC method and contract function) to this file, as one JSON line, e.g. to follow trends across cron runs.''',
+                        default = None)
+
+    config_group.add_argument('--max-staleness', help='''How old (in seconds) summoner data stored by previous runs can be 
+                        to be used instead of read again. Default: 300 for `show` and `run`, 0 for other commands. 
+                        Attributes and cooldowns not expired yet are always reused.''',
+                        default = None, type = int)
 
     # This is the top level parser to which we'll add subparsers
     parser = argparse.ArgumentParser(description='Manage your rarity summoners')
@@ -35,14 +83,34 @@ def create_parser():
                             "Default location: " + DEFAULT_KEY_FILE,
                             default = DEFAULT_KEY_FILE)
     
+    # Command REFRESH-ABIS:
+    parser_refresh_abis = subparsers.add_parser("refresh-abis", 
+                        help = "Download contract ABIs again. ABIs are otherwise stored locally after the first run.")
+    parser_refresh_abis.add_argument("--bundle", help = "Also save the ABIs in the bot's `abis` directory, " + \
+                        "so they ship with the bot and fresh installs can start offline.",
+                        action = "store_true")
+    
+    # Command REFRESH-CODEX:
+    parser_refresh_codex = subparsers.add_parser("refresh-codex", parents = [shared_parser],
+                        help = "Read item and skill codex data from the chain again, and save it in the bot's codex snapshot.")
+    parser_refresh_codex.add_argument("--verify", help = "Only check the snapshot shipped with the bot against the chain.",
+                        action = "store_true")
+
      # Command SHOW (alias LIST) takes argument 'what':
     show_options = ["summoners", "gas", "skills", "items", "craftable", "crafting-proba"]
     parser_list = subparsers.add_parser("show", aliases = ["list"], parents = [shared_parser],
                         help = "Show/list a variety of things, like gas price or summoners.")
     parser_list.add_argument("what", help = "What to show. By default, list summoners.", nargs = '?',
                         choices = show_options, default = "summoners")
-    parser_list.add_argument("-n", "--limit", help = "Limit the number of tokens shown. Optional integer.",
+    parser_list.add_argument("-n", "--limit", help = "Limit the number of tokens shown. Optional integer. " + \
+                        "With crafting-proba, the item DC (default 20).",
                         default = 0, type = int)
+    parser_list.add_argument("--proba", help = "With crafting-proba, the chance of success (in %%) to reach, from 1 to 100. " + \
+                        "Default: 100.", default = 100, type = percentage)
+    parser_list.add_argument("--crafter", help = "With crafting-proba, show the crafting material needed by this summoner " + \
+                        "for every craftable item.", default = 0, type = int)
+    parser_list.add_argument("--per-token", help = "With items, show one row per item token instead of counts per item.",
+                        action = "store_true")
     
 
     # Command RUN takes argument --actions:
@@ -57,6 +125,20 @@ def create_parser():
                         "cellar" (send to cellar dungeon)''',
                         nargs='*', default = ["list", "adventure", "level_up", "claim_gold", "cellar"])
 
+    # Command DAEMON: same actions as RUN, but keeps running
+    parser_daemon = subparsers.add_parser("daemon", parents=[shared_parser],
+                        help = "Keep running and take actions as soon as summoners are ready.")
+    parser_daemon.add_argument('actions', help='''Actions to take. Will do everything by default.
+                        Select one or more from 
+                        "adventure", 
+                        "level_up", 
+                        "claim_gold", 
+                        "cellar" (send to cellar dungeon)''',
+                        nargs='*', default = ["adventure", "level_up", "claim_gold", "cellar"])
+    parser_daemon.add_argument('--resync-interval', help='''How often (in seconds) to look for new summoners 
+                        on the address and reload all of them. Default: ''' + str(Daemon.DEFAULT_RESYNC_INTERVAL),
+                        default = Daemon.DEFAULT_RESYNC_INTERVAL, type = int)
+
     # Command SUMMON takes argument --class and optionally -n
     parser_summon = subparsers.add_parser("summon", parents=[shared_parser],
                         help = "Summon new summoners of a given class and optionally set attributes.")
@@ -150,10 +232,17 @@ def create_parser():
     parser_craft.add_argument('base_type', help='What type of item.', 
                         choices = ["good", "armor", "weapon"])
     parser_craft.add_argument("item_id", help='Which item to craft (integer)', type = int)
-    parser_craft.add_argument('--crafter', help = "Summoner ID of the crafter", required = True, type = int)
+    parser_craft.add_argument('--crafter', help = '''Summoner ID of the crafter. Can also be "all", in which case 
+                        the attempts are spread across all the summoners on the address who are ready to craft, 
+                        until N items (see -n) are crafted.''', required = True)
     parser_craft.add_argument('--mats', help = "Amount of crafting material to use", required = True, type = int)
     parser_craft.add_argument('-n', '--amount', help = "Number of items to create (default = 1)", default = 1, type = int)
-    parser_craft.add_argument('--simulate', help = "Simulate craft", action = "store_true")
+    parser_craft.add_argument('--simulate', help = "Simulate craft (locally). With -n, also shows the expected cost of N items.", 
+                        action = "store_true")
+    parser_craft.add_argument('--trials', help = "Number of attempts simulated with --simulate (default = " + \
+                        str(CraftingSimulator.DEFAULT_TRIALS) + ")", default = CraftingSimulator.DEFAULT_TRIALS, type = int)
+    parser_craft.add_argument('--spot-check', help = "With --simulate, also call the simulate() function of the crafting contract " + \
+                        "N times and check its results follow the same rules (default = 0)", default = 0, type = int)
 
     # Command SETUP-CRAFTING
     parser_setup_crafting = subparsers.add_parser("setup-crafting", parents=[shared_parser],
@@ -0,0 +1,139 @@
+from colorama import Fore
+import json
+import os
+
+import cache
+from multicall import Multicall, MulticallError
+
+class CodexSnapshot:
+    """Data of the codex contracts (items, skills), bundled with the bot in `codex/snapshot.json` once built.
+
+    Codex contracts are immutable, so their data can be read once and bundled: item and skill lookups then need no RPC.
+    The snapshot is loaded lazily, on first use, and ignored if it was built for another format version
+    or other contracts. Build it again with the `refresh-codex` command."""
+
+    # Bump when the snapshot format changes
+    VERSION = 1
+
+    PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "codex", "snapshot.json")
+
+    _data = None
+    _loaded = False
+
+    @classmethod
+    def get_data(cls):
+        """Snapshot data, or None if there's no usable snapshot"""
+        if not cls._loaded:
+            cls._data = cls.load(cls.PATH)
+            cls._loaded = True
+        return cls._data
+
+    @classmethod
+    def load(cls, path):
+        data = cache.load_json(path)
+        if data is None:
+            return None
+        if data.get("version") != cls.VERSION or data.get("contracts") != cls.get_contract_addresses():
+            print(Fore.YELLOW + "Codex snapshot is outdated: reading codex data from the chain instead." + Fore.RESET)
+            return None
+        return data
+
+    @staticmethod
+    def get_contract_addresses():
+        """Addresses of the contracts the snapshot is built from"""
+        from items import ItemCodex
+        from skills import SkillCodex
+        addresses = {name: ItemCodex.contract_addresses[name].lower() for name in ItemCodex.codex_sizes}
+        addresses.update({name: address.lower() for name, address in SkillCodex.contract_addresses.items()})
+        return addresses
+
+    @classmethod
+    def get_item_data(cls, codex_name, item_id):
+        data = cls.get_data()
+        if data is None:
+            return None
+        return data["items"][codex_name].get(str(item_id))
+
+    @classmethod
+    def get_skill_data(cls, skill_id):
+        data = cls.get_data()
+        if data is None:
+            return None
+        return data["skills"].get(str(skill_id))
+
+    @classmethod
+    def get_class_skills(cls, class_id):
+        data = cls.get_data()
+        if data is None:
+            return None
+        return data["class_skills"].get(str(class_id))
+
+    @staticmethod
+    def build(item_codex, skill_codex, block):
+        """Read all codex data from the chain with a multicall (at `block`, so the snapshot is consistent)"""
+        reads = [] # (section, codex name or None, id)
+        multicall = Multicall(item_codex.w3, block_identifier = block)
+        for codex_name, size in item_codex.codex_sizes.items():
+            contract = item_codex.contracts[codex_name]
+            for id in range(1, size + 1):
+                reads.append(("items", codex_name, id))
+                multicall.add(contract.functions.item_by_id(id))
+        for id in range(1, skill_codex.codex_sizes["skill_codex"] + 1):
+            reads.append(("skills", None, id))
+            multicall.add(skill_codex.contracts["skill_codex"].functions.skill_by_id(id))
+        for class_id in range(1, 12):
+            reads.append(("class_skills", None, class_id))
+            multicall.add(skill_codex.contracts["skills"].functions.class_skills_by_name(class_id))
+
+        items = {codex_name: {} for codex_name in item_codex.codex_sizes}
+        skills = {}
+        class_skills = {}
+        for (section, codex_name, id), value in zip(reads, multicall.execute()):
+            # A snapshot with holes would be used as is: fail instead
+            if value is None:
+                raise MulticallError(f"Could not read {codex_name or section} #{id} at block {block}")
+            if section == "items":
+                items[codex_name][str(id)] = value
+            elif section == "skills":
+                skills[str(id)] = value
+            else:
+                class_skills[str(id)] = value
+        # Round trip through json, so the snapshot compares equal to a loaded one
+        return json.loads(json.dumps({
+            "version": CodexSnapshot.VERSION,
+            "block": block,
+            "contracts": CodexSnapshot.get_contract_addresses(),
+            "items": items,
+            "skills": skills,
+            "class_skills": class_skills
+        }))
+
+    @staticmethod
+    def flatten(data):
+        """Snapshot entries by a readable name: "goods #3", "skill #5", etc"""
+        entries = {"version": data.get("version")}
+        for name, address in data.get("contracts", {}).items():
+            entries["contract " + name] = address
+        for codex_name, items in data.get("items", {}).items():
+            for id, item_data in items.items():
+                entries[f"{codex_name} #{id}"] = item_data
+        for id, skill_data in data.get("skills", {}).items():
+            entries[f"skill #{id}"] = skill_data
+        for class_id, class_skills in data.get("class_skills", {}).items():
+            entries[f"class skills #{class_id}"] = class_skills
+        return entries
+
+    @staticmethod
+    def diff(snapshot, reference):
+        """Differences between two snapshots (ignoring the block they were built at), as a list of strings"""
+        entries = CodexSnapshot.flatten(snapshot)
+        reference_entries = CodexSnapshot.flatten(reference)
+        return [f"{name}: expected {reference_entries.get(name)}, found {entries.get(name)}"
+                for name in reference_entries if entries.get(name) != reference_entries[name]] + \
+               [f"{name}: unexpected entry" for name in entries if name not in reference_entries]
+
+    @classmethod
+    def save(cls, data):
+        cls._data = data
+        cls._loaded = True
+        return cache.save_json(cls.PATH, data)
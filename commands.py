@@ -1,18 +1,42 @@
-from skills import InvalidSkillError, Skill, SkillCodex
-from crafting import CraftingEngine, CraftingError
-from items import ItemCodex, Item
+from skills import InvalidSkillError, Skill, SkillCodex, get_skill_codex
+from crafting import CraftingEngine, CraftingError, CraftingSession
+from crafting_job import CraftingJob
+from items import ItemCodex, Item, get_item_codex
 from rarity import get_address_from_args, get_signer_from_args, print_intro
 from summoner import InvalidAddressError, InvalidAmountError, InvalidSummonerError, Summoner
-from list_summoners import list_items, list_summoners
+from list_summoners import list_items, list_summoners, load_summoner, load_summoners
 from summoning import SummoningError, SummoningEngine
+from scheduler import ActionScheduler
+from daemon import Daemon
+from transacter import Transacter
+from codex import CodexSnapshot
+from multicall import MulticallError
 from colorama import Fore
+from tabulate import tabulate
 from key import InvalidInputError
+import os
+import cache
+import network
+
+# How old (in seconds) summoner data that can change anytime may be, by command (see `FleetStore`).
+# Before signing anything, `run` reads again the fields checked by the actions it's about to start (see `ActionScheduler.refresh`),
+# and summoners are forgotten by the store when they send a tx.
+MAX_STALENESS = {
+    "show": 300,
+    "list": 300,
+    "run": 300
+}
+
+def get_max_staleness(args):
+    if args.max_staleness is not None:
+        return args.max_staleness
+    return MAX_STALENESS.get(args.command, 0)
 
 def command_show(args, transacter):
     if args.what == "summoners":
         # Listing summoners
         owner_address = get_address_from_args(args)
-        summoners = list_summoners(owner_address, transacter, limit = args.limit)
+        summoners = list_summoners(owner_address, transacter, limit = args.limit, max_staleness = get_max_staleness(args))
         Summoner.print_summoners(summoners)
 
     elif args.what == "gas": 
@@ -20,25 +44,37 @@ def command_show(args, transacter):
         transacter.print_gas_price()
 
     elif args.what == "skills":
-        codex = SkillCodex()
+        codex = get_skill_codex()
         Skill.print_skills(codex.get_skills())
     
     elif args.what == "items":
         # Listing crafted items
         owner_address = get_address_from_args(args)
-        items = list_items(owner_address, limit = args.limit)
-        Item.print_items(items)
+        items = list_items(owner_address, transacter, limit = args.limit)
+        Item.print_inventory(items, per_token = args.per_token)
     
     elif args.what == "craftable":
-        codex = ItemCodex()
+        codex = get_item_codex()
         Item.print_items(codex.get_items("goods"))
         Item.print_items(codex.get_items("weapons"))
         Item.print_items(codex.get_items("armors"))
 
     elif args.what == "crafting-proba":
-        item_dc = args.limit if args.limit else 20
-        print("Probability table when crafting items with DC=" + str(item_dc))
-        CraftingEngine.print_proba_table(item_dc = item_dc)
+        target_proba = args.proba / 100
+        if args.crafter:
+            # Craft mats needed by this crafter for every item of the codex
+            summoner = load_summoner(args.crafter, transacter, max_staleness = get_max_staleness(args))
+            codex = get_item_codex()
+            items = [item for codex_name in ["goods", "armors", "weapons"] for item in codex.get_items(codex_name)]
+            rows = [{"Item": str(item), "Craft DC": item.DC, "Crafting Material": "-" if mats is None else mats}
+                    for item, mats in CraftingEngine.get_items_min_craft_mats(summoner.get_craft_level(), 
+                        summoner.attributes["int"], items, target_proba)]
+            print(f"Crafting material needed by {summoner} for a {args.proba}% chance of success:")
+            print(Fore.WHITE + tabulate(rows, headers = "keys", tablefmt = "pretty"))
+        else:
+            item_dc = args.limit if args.limit else 20
+            print("Probability table when crafting items with DC=" + str(item_dc))
+            CraftingEngine.print_proba_table(item_dc = item_dc, target_proba = target_proba)
 
 def command_summon(args, transacter):
     # Summoning new summoners
@@ -102,7 +138,7 @@ def command_summon(args, transacter):
 def command_run(args, transacter):
     owner_address = get_address_from_args(args)
     signer = get_signer_from_args(args)
-    summoners = list_summoners(owner_address, transacter, set_signer = signer)
+    summoners = list_summoners(owner_address, transacter, set_signer = signer, max_staleness = get_max_staleness(args))
 
     if "list" in args.actions:
         Summoner.print_summoners(summoners)
@@ -114,33 +150,21 @@ def command_run(args, transacter):
 
     print("Looking for things to do ...")
 
-    # We process each action entirely before moving to the next one
-    # This is important as, this way, we can wait for tx status only once at the end of a batch
-    # This way, level_up will "see" the correct XP and claim_gold will "see" the correct level
-
-    if "adventure" in args.actions:
-        print("Checking adventures...")
-        for summoner in summoners:        
-            summoner.adventure()
-        transacter.wait_for_pending_transations()
-
-    if "level_up" in args.actions:
-        print("Checking level-up...")
-        for summoner in summoners:
-            summoner.level_up()
-        transacter.wait_for_pending_transations()
-    
-    if "claim_gold" in args.actions:
-        print("Checking gold claims...")
-        for summoner in summoners:
-            summoner.claim_gold()
-        transacter.wait_for_pending_transations()
-
-    if "cellar" in args.actions:
-        print("Checking cellar loot...")
-        for summoner in summoners:
-            summoner.go_cellar()
-        transacter.wait_for_pending_transations()
+    # Actions are pipelined for each summoner: level_up waits for that summoner's adventure, 
+    # claim_gold and cellar wait for its level_up (so they "see" the correct level), 
+    # but no summoner waits for the rest of the fleet.
+    scheduler = ActionScheduler(transacter, args.actions)
+    scheduler.run(summoners)
+
+def command_daemon(args, transacter):
+    owner_address = get_address_from_args(args)
+    signer = get_signer_from_args(args)
+    daemon = Daemon(transacter, owner_address, signer, args.actions, 
+                    resync_interval = args.resync_interval, max_gas_price_gwei = args.maxgasprice)
+    try:
+        daemon.run()
+    except KeyboardInterrupt:
+        print(Fore.YELLOW + "Daemon stopped." + Fore.RESET)
 
 def command_transfer(args, transacter, transfer_all = False):
     if not args.from_id:
@@ -148,7 +172,7 @@ def command_transfer(args, transacter, transfer_all = False):
     
     owner_address = get_address_from_args(args)
     signer = get_signer_from_args(args)
-    summoners = list_summoners(owner_address, transacter, set_signer = signer)
+    summoners = list_summoners(owner_address, transacter, set_signer = signer, max_staleness = get_max_staleness(args))
     summoner_ids = [str(round(s.token_id)) for s in summoners]
     
     # Set sender(s)
@@ -161,7 +185,7 @@ def command_transfer(args, transacter, transfer_all = False):
             sender_id = int(args.from_id)
         except ValueError:
             raise InvalidSummonerError("Invalid sender ID")
-        senders = [Summoner(sender_id, transacter, signer = signer)]
+        senders = [s for s in summoners if s.token_id == sender_id]
 
     # Check recipient
     if args.to_id not in summoner_ids and not args.force:
@@ -193,7 +217,7 @@ def command_send_summoner(args, transacter):
     
     owner_address = get_address_from_args(args)
     signer = get_signer_from_args(args)
-    summoners = list_summoners(owner_address, transacter, set_signer = signer)
+    summoners = list_summoners(owner_address, transacter, set_signer = signer, max_staleness = get_max_staleness(args))
     summoner_ids = [str(round(s.token_id)) for s in summoners]
     
     # Set sender(s)
@@ -209,7 +233,7 @@ def command_send_summoner(args, transacter):
             sender_id = int(args.who)
         except ValueError:
             raise InvalidSummonerError("Invalid sender ID")
-        senders = [Summoner(sender_id, transacter, signer = signer)]
+        senders = [s for s in summoners if s.token_id == sender_id]
 
     # Check recipient
     if not args.to_address:
@@ -230,9 +254,9 @@ def command_setup_crafting(args, transacter):
 
     # Preparing summoners
     if len(args.summoner_ids) == 1 and args.summoner_ids[0] == "all":
-        summoners = list_summoners(owner_address, transacter, set_signer = signer)
+        summoners = list_summoners(owner_address, transacter, set_signer = signer, max_staleness = get_max_staleness(args))
     else:
-        summoners = [Summoner(id, transacter, signer = signer) for id in args.summoner_ids]
+        summoners = load_summoners(args.summoner_ids, transacter, signer = signer, max_staleness = get_max_staleness(args))
 
     if (args.approve_for_all):
         print(Fore.YELLOW + "Setting up crafting with --approve-for-all. This will:")
@@ -256,28 +280,32 @@ def command_setup_crafting(args, transacter):
 
 def command_craft(args, transacter):
     args.base_type = args.base_type + "s"
-    codex = ItemCodex()
+    codex = get_item_codex()
     item = Item.create_from_data(args.base_type, args.item_id, codex = codex)
-    summoner = Summoner(args.crafter, transacter = transacter)
+
+    if args.crafter == "all":
+        # Job mode: spread the attempts across all the crafters of the address
+        if args.simulate:
+            raise CraftingError("Simulations need a single crafter: use `--crafter [summoner_id]`")
+        if args.mats < 0 or args.mats % 10 != 0:
+            raise CraftingError("Invalid quantity of crafting material (should be a multiple of 10)")
+        owner_address = get_address_from_args(args)
+        signer = get_signer_from_args(args)
+        summoners = list_summoners(owner_address, transacter, set_signer = signer, max_staleness = get_max_staleness(args))
+        CraftingJob(transacter, summoners, item, args.mats, quantity = args.amount).run()
+        return
+
     crafting_engine = CraftingEngine()
 
     if args.simulate:
-        crafting_engine.simulate(summoner, item, args.mats, times = args.amount)
+        summoner = load_summoner(args.crafter, transacter)
+        crafting_engine.simulate(summoner, item, args.mats, amount = args.amount, 
+                                 trials = args.trials, spot_checks = args.spot_check)
     else:
+        # Balances and craft level are read once: the session keeps track of them
         signer = get_signer_from_args(args)
-        summoner.set_signer(signer)
-        receipts = []
-        for _ in range(args.amount):
-            try:
-                tx_status = crafting_engine.craft(summoner, item, args.mats)
-                if tx_status["status"] == "pending":
-                    receipts.extend(transacter.wait_for_pending_transations())
-                else:
-                    receipts.append(tx_status["receipt"])
-            except CraftingError as e:
-                print(Fore.RED + str(e) + Fore.RESET)
-                break
-        print(receipts)
+        summoner = load_summoner(args.crafter, transacter, signer = signer)
+        CraftingSession(crafting_engine, summoner, item, args.mats).run(args.amount)
 
 def command_set_attributes(args, transacter):
     owner_address = get_address_from_args(args)
@@ -294,9 +322,9 @@ def command_set_attributes(args, transacter):
 
     # Preparing summoners
     if len(args.summoner_ids) == 1 and args.summoner_ids[0] == "all":
-        summoners = list_summoners(owner_address, transacter, set_signer = signer)
+        summoners = list_summoners(owner_address, transacter, set_signer = signer, max_staleness = get_max_staleness(args))
     else:
-        summoners = [Summoner(id, transacter, signer = signer) for id in args.summoner_ids]
+        summoners = load_summoners(args.summoner_ids, transacter, signer = signer, max_staleness = get_max_staleness(args))
 
     # Assigning Attributes
     for summoner in summoners:
@@ -313,7 +341,7 @@ def command_set_skill(args, transacter):
     signer = get_signer_from_args(args)
     
     # Check skill name is valid
-    codex = SkillCodex()
+    codex = get_skill_codex()
     try:
         codex.get_skill_id(args.skill_name)
     except InvalidSkillError as e:
@@ -322,9 +350,9 @@ def command_set_skill(args, transacter):
 
     # Preparing summoners
     if len(args.summoner_ids) == 1 and args.summoner_ids[0] == "all":
-        summoners = list_summoners(owner_address, transacter, set_signer = signer)
+        summoners = list_summoners(owner_address, transacter, set_signer = signer, max_staleness = get_max_staleness(args))
     else:
-        summoners = [Summoner(id, transacter, signer = signer) for id in args.summoner_ids]
+        summoners = load_summoners(args.summoner_ids, transacter, signer = signer, max_staleness = get_max_staleness(args))
 
     # Assigning skills
     for summoner in summoners:
@@ -333,4 +361,45 @@ def command_set_skill(args, transacter):
         except (InvalidSummonerError, InvalidSkillError) as e:
             print(Fore.RED + str(e) + Fore.RESET)
 
-    transacter.wait_for_pending_transations()
\ No newline at end of file
+    transacter.wait_for_pending_transations()
+
+def command_refresh_abis(args):
+    # All the contracts the bot talks to (some are listed more than once)
+    contract_addresses = {}
+    for engine_class in [Transacter, CraftingEngine, ItemCodex, SkillCodex]:
+        for cname, address in engine_class.contract_addresses.items():
+            contract_addresses[address.lower()] = cname
+
+    for address, cname in contract_addresses.items():
+        print(Fore.WHITE + "Downloading ABI of " + cname + " (" + address + ")")
+        abi = Transacter.get_abi(address, refresh = True)
+        if args.bundle:
+            cache.save_json(os.path.join(Transacter.BUNDLED_ABI_DIR, address + ".json"), abi)
+
+    print(Fore.GREEN + "Refreshed " + str(len(contract_addresses)) + " ABIs" + \
+        (" and saved them to " + Transacter.BUNDLED_ABI_DIR if args.bundle else "") + Fore.RESET)
+
+def command_refresh_codex(args):
+    w3 = network.get_web3()
+    block = w3.eth.block_number
+    print(Fore.WHITE + "Reading item and skill codex data at block " + str(block) + ", this may take a while...")
+    try:
+        snapshot = CodexSnapshot.build(ItemCodex(), SkillCodex(), block)
+    except MulticallError as e:
+        raise SystemExit(Fore.RED + "Could not read codex data: " + str(e) + Fore.RESET)
+
+    if args.verify:
+        # Exits with an error when the bundled snapshot is missing or differs, so it can run in CI
+        bundled = cache.load_json(CodexSnapshot.PATH)
+        if bundled is None:
+            raise SystemExit(Fore.RED + "No codex snapshot found in " + CodexSnapshot.PATH + \
+                             ": run `refresh-codex` to build it, then commit it." + Fore.RESET)
+        differences = CodexSnapshot.diff(bundled, snapshot)
+        for difference in differences:
+            print(Fore.RED + difference + Fore.RESET)
+        if differences:
+            raise SystemExit(Fore.RED + str(len(differences)) + " differences: run `refresh-codex` to build the snapshot again." + Fore.RESET)
+        print(Fore.GREEN + "Codex snapshot (built at block " + str(bundled.get("block")) + ") matches the chain." + Fore.RESET)
+    else:
+        path = CodexSnapshot.save(snapshot)
+        print(Fore.GREEN + "Saved codex snapshot to " + path + Fore.RESET)
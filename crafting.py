@@ -1,11 +1,104 @@
 from colorama.ansi import Fore
 from tabulate import tabulate
-from transacter import Transacter
+from ownership import LogScanner
+from transacter import ReceiptCollector, Transacter
+import network
 from web3.main import Web3
 
+import math
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    # Optional: probability grids and simulations are computed one by one without it
+    np = None
+
 class CraftingError(Exception):
     pass
 
+class CraftingSimulator:
+    """Simulate crafting attempts locally, with the same rules as the crafting contract:
+       a d20 is added to the check (craft level + INT modifier) and the attempt succeeds if it reaches the item DC
+       (lowered by craft mats). Craft mats and XP are spent on every attempt, gold only when the item is crafted."""
+
+    DEFAULT_TRIALS = 10000
+
+    # XP spent by each attempt
+    XP_PER_ATTEMPT = 250
+
+    # z-score of the 95% confidence interval
+    Z_95 = 1.96
+
+    def __init__(self, craft_level, int_level, item, craft_mats, seed = None):
+        self.craft_level = craft_level
+        self.int_level = int_level
+        self.item = item
+        self.craft_mats = craft_mats
+        self.seed = seed
+
+    def get_check_base(self):
+        """Check before the d20, or None if the summoner can't craft at all"""
+        check = self.craft_level + (self.int_level - 10) // 2
+        return check if self.craft_level > 0 and check > 0 else None
+
+    def get_effective_dc(self):
+        return max(self.item.DC - self.craft_mats // CraftingEngine.CRAFT_MATS_PER_DC, 0)
+
+    def roll(self, trials):
+        """Outcome of each trial (True if crafted)"""
+        check_base = self.get_check_base()
+        if check_base is None:
+            return [False] * trials
+        dc = self.get_effective_dc()
+        if np is None:
+            rng = random.Random(self.seed)
+            return [check_base + rng.randrange(20) >= dc for _ in range(trials)]
+        d20 = np.random.default_rng(self.seed).integers(0, 20, size = trials)
+        return check_base + d20 >= dc
+
+    def run(self, trials = DEFAULT_TRIALS):
+        """Simulate attempts. Returns success rate, its 95% confidence interval and the expected cost per crafted item."""
+        successes = int(sum(self.roll(trials)))
+        success_rate = successes / trials
+        (ci_low, ci_high) = self.wilson_interval(successes, trials)
+        # Expected number of attempts per crafted item: each attempt costs mats and XP, gold is only paid on success
+        attempts_per_item = 1 / success_rate if successes else None
+        return {
+            "trials": trials,
+            "success_rate": success_rate,
+            "ci_low": ci_low,
+            "ci_high": ci_high,
+            "attempts_per_item": attempts_per_item,
+            "gold_per_item": self.item.cost if successes else None,
+            "craft_mats_per_item": self.craft_mats * attempts_per_item if successes else None,
+            "xp_per_item": self.XP_PER_ATTEMPT * attempts_per_item if successes else None
+        }
+
+    @classmethod
+    def wilson_interval(cls, successes, trials):
+        """95% confidence interval of a success rate (Wilson score interval, fine near 0% and 100%)"""
+        z = cls.Z_95
+        p = successes / trials
+        center = (p + z**2 / (2 * trials)) / (1 + z**2 / trials)
+        margin = z * math.sqrt(p * (1 - p) / trials + z**2 / (4 * trials**2)) / (1 + z**2 / trials)
+        return max(center - margin, 0), min(center + margin, 1)
+
+    def check_contract_result(self, crafted, check, cost, dc):
+        """Whether a result of the contract's simulate() follows the same rules. Returns a list of differences."""
+        differences = []
+        if dc != self.get_effective_dc():
+            differences.append(f"DC {dc} instead of {self.get_effective_dc()}")
+        check_base = self.get_check_base()
+        if check_base is not None and not check_base <= check < check_base + 20:
+            differences.append(f"check {check} out of range {check_base}-{check_base + 19}")
+        if crafted != (check_base is not None and check >= dc):
+            differences.append(f"crafted is {crafted} with check {check} and DC {dc}")
+        if cost / 1e18 != self.item.cost:
+            differences.append(f"cost {cost / 1e18} instead of {self.item.cost}")
+        return differences
+
 class CraftingEngine:
 
     contract_addresses = {
@@ -19,14 +112,17 @@ class CraftingEngine:
     contract_checksums = {k: Web3.toChecksumAddress(v) for k, v in contract_addresses.items()}
 
     def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider('https://rpc.ftm.tools/'))
-        self.contracts = {cname: Transacter.rate_limit(self.get_contract(cname)) for cname in self.contract_addresses.keys()}
+        self.w3 = network.get_web3()
+        self.contracts = {cname: self.get_contract(cname) for cname in self.contract_addresses.keys()}
 
     def get_contract(self, contract_name):
         '''Get contract or raise a KeyError if contract isn't listed'''
         return self.w3.eth.contract(address = self.contract_checksums[contract_name], 
                                     abi = Transacter.get_abi(self.contract_addresses[contract_name]))
 
+    # Craft mats reduce the item DC by 1 every 10 mats
+    CRAFT_MATS_PER_DC = 10
+
     @staticmethod
     def check_craft_proba(craft_level, int_level, item_dc, craft_mats):
         if craft_level == 0:
@@ -34,98 +130,164 @@ class CraftingEngine:
         int_modifier = (int_level - 10) // 2
         if craft_level + int_modifier <= 0:
             return 0
-        item_dc = max(item_dc - craft_mats // 10, 0)
+        item_dc = max(item_dc - craft_mats // CraftingEngine.CRAFT_MATS_PER_DC, 0)
         check = craft_level + int_modifier - item_dc
-        check_plus_d20 = [check + d20 for d20 in range(0, 20)]
-        proba = sum([x >= 0 for x in check_plus_d20]) / 20
-        return proba
+        # Success when check + d20 >= 0, with d20 in 0..19
+        return min(max(check + 20, 0), 20) / 20
 
     @staticmethod
     def check_craft(summoner, item, craft_mats):
         return CraftingEngine.check_craft_proba(summoner.get_craft_level(), summoner.attributes["int"], item.DC, craft_mats)
 
     @staticmethod
-    def get_proba_data(item_dc):
-        data = []
+    def get_proba_grid(craft_levels, int_levels, item_dcs, craft_mats):
+        """Success probabilities for every combination of the given values (same rules as `check_craft_proba`).
+           Returns an array indexed by [craft level][int level][item DC][craft mats] (nested lists without numpy)."""
+        if np is None:
+            return [[[[CraftingEngine.check_craft_proba(craft_level, int_level, item_dc, mats) for mats in craft_mats]
+                      for item_dc in item_dcs] for int_level in int_levels] for craft_level in craft_levels]
+        craft_level = np.asarray(craft_levels).reshape(-1, 1, 1, 1)
+        int_modifier = (np.asarray(int_levels).reshape(1, -1, 1, 1) - 10) // 2
+        item_dc = np.asarray(item_dcs).reshape(1, 1, -1, 1)
+        mats = np.asarray(craft_mats).reshape(1, 1, 1, -1)
+        effective_dc = np.maximum(item_dc - mats // CraftingEngine.CRAFT_MATS_PER_DC, 0)
+        proba = np.clip(craft_level + int_modifier - effective_dc + 20, 0, 20) / 20
+        can_craft = (craft_level > 0) & (craft_level + int_modifier > 0)
+        return np.where(can_craft, proba, 0)
+
+    @staticmethod
+    def get_min_craft_mats_grid(craft_levels, int_levels, item_dcs, target_proba = 1):
+        """Least craft mats (a multiple of 10) to reach `target_proba` for every combination of the given values,
+           read from `get_proba_grid`. Returns nested lists indexed by [craft level][int level][item DC], 
+           with None when the target can't be reached."""
+        # Beyond DC * 10 craft mats, the effective DC is 0: more mats don't help
+        craft_mats = range(0, max(item_dcs, default = 0) * CraftingEngine.CRAFT_MATS_PER_DC + 1, CraftingEngine.CRAFT_MATS_PER_DC)
+        grid = CraftingEngine.get_proba_grid(craft_levels, int_levels, item_dcs, craft_mats)
+        if np is None:
+            return [[[next((mats for mats, proba in zip(craft_mats, probas) if proba >= target_proba - 1e-9), None)
+                      for probas in dc_grid] for dc_grid in int_grid] for int_grid in grid]
+        reached = grid >= target_proba - 1e-9
+        # Index of the first craft mats reaching the target (argmax of booleans), or None if none does
+        min_mats = np.where(reached.any(axis = 3), reached.argmax(axis = 3) * CraftingEngine.CRAFT_MATS_PER_DC, None)
+        return min_mats.tolist()
 
-        for int_level in range(18, 25, 2):
-            for craft_level in range(4, 8):
-                for craft_mats in range(0, 500, 10):
-                    proba = CraftingEngine.check_craft_proba(craft_level, int_level, item_dc, craft_mats)
-                    if proba >= 0.7:
-                        data.append({
-                            "Item DC": item_dc,
-                            "Intelligence": int_level,
-                            "Craft Level": craft_level,
-                            "Crafting Material Spent": craft_mats,
-                            "Probability of Success": str(round(100 * proba, 2)) + "%"
-                        })
-                    if proba == 1:
-                        break
+    @staticmethod
+    def get_min_craft_mats(craft_level, int_level, item_dcs, target_proba = 1):
+        """Least craft mats (a multiple of 10) to reach `target_proba` for each item DC, or None when it can't be reached"""
+        return CraftingEngine.get_min_craft_mats_grid([craft_level], [int_level], item_dcs, target_proba)[0][0]
+
+    @staticmethod
+    def get_items_min_craft_mats(craft_level, int_level, items, target_proba = 1):
+        """Least craft mats to reach `target_proba` for every item (e.g. the whole codex), as a list of (item, mats or None)"""
+        return list(zip(items, CraftingEngine.get_min_craft_mats(craft_level, int_level, [item.DC for item in items], target_proba)))
+
+    # Range of the crafting probability table
+    PROBA_TABLE_INT_LEVELS = range(8, 31, 2)
+    PROBA_TABLE_CRAFT_LEVELS = range(1, 13)
+
+    @staticmethod
+    def get_proba_data(item_dc, target_proba = 1):
+        """Least craft mats to reach target_proba, by intelligence (rows) and craft level (columns)"""
+        craft_levels = list(CraftingEngine.PROBA_TABLE_CRAFT_LEVELS)
+        int_levels = list(CraftingEngine.PROBA_TABLE_INT_LEVELS)
+        grid = CraftingEngine.get_min_craft_mats_grid(craft_levels, int_levels, [item_dc], target_proba)
+        data = []
+        for j, int_level in enumerate(int_levels):
+            row = {"INT \\ Craft lvl": int_level}
+            for i, craft_level in enumerate(craft_levels):
+                mats = grid[i][j][0]
+                row[str(craft_level)] = "-" if mats is None else mats
+            data.append(row)
         return data
 
     @staticmethod
-    def print_proba_table(item_dc):
-        tbl = tabulate(CraftingEngine.get_proba_data(item_dc), headers = "keys", tablefmt = "pretty")
-        print(Fore.WHITE + tbl)
+    def print_proba_table(item_dc, target_proba = 1):
+        tbl = tabulate(CraftingEngine.get_proba_data(item_dc, target_proba), headers = "keys", tablefmt = "pretty")
+        print(Fore.WHITE + "Crafting material needed for a " + str(round(100 * target_proba)) + \
+              "% chance of success (\"-\" when it can't be reached):")
+        print(tbl)
 
-    def simulate(self, summoner, item, craft_mats, times = 1):
-        """Simulate item crafting (proba + repeated attempts)"""
+    def simulate(self, summoner, item, craft_mats, amount = 1, trials = CraftingSimulator.DEFAULT_TRIALS, spot_checks = 0):
+        """Simulate item crafting: probability, local Monte Carlo simulation and optional checks against the contract"""
         # 1. Show proba
         print(f"Simulating craft of a {item} with {summoner} using {craft_mats} crafting material:")
         proba = CraftingEngine.check_craft(summoner, item, craft_mats)
         print(f"Success probability with {craft_mats} craft mats: {round(100 * proba, 1)}%")
 
-        # 2. Show optimal amount of craft mats
-        proba_base = CraftingEngine.check_craft(summoner, item, 0)
-        optimal_craft_mats = 10 * (1 - proba_base) / 0.05
-        print(f"Craft mats for 100% success rate: {round(optimal_craft_mats)} craft mats")
-        
+        # 2. Show least amount of craft mats for some probabilities
+        craft_level = summoner.get_craft_level()
+        int_level = summoner.attributes["int"]
+        for target_proba in [0.5, 0.75, 0.9, 1]:
+            mats = CraftingEngine.get_min_craft_mats(craft_level, int_level, [item.DC], target_proba)[0]
+            if mats is None:
+                print(f"Craft mats for {round(100 * target_proba)}% success rate: impossible")
+            else:
+                print(f"Craft mats for {round(100 * target_proba)}% success rate: {mats} craft mats")
+
+        # 3. Local simulation
+        simulator = CraftingSimulator(craft_level, int_level, item, craft_mats)
+        result = simulator.run(trials)
+        print(f"Simulated {trials} attempts: success rate {round(100 * result['success_rate'], 1)}% " + \
+              f"(95% CI: {round(100 * result['ci_low'], 1)}% - {round(100 * result['ci_high'], 1)}%)")
+        if result["attempts_per_item"] is None:
+            print(Fore.RED + "No item crafted: this summoner can't craft this item with these craft mats." + Fore.RESET)
+        else:
+            print(f"Expected cost per item: {round(result['attempts_per_item'], 2)} attempts, " + \
+                  f"{round(result['gold_per_item'], 2)} gold, {round(result['craft_mats_per_item'], 1)} craft mats, " + \
+                  f"{round(result['xp_per_item'])} XP")
+            if amount > 1:
+                print(f"Expected cost for {amount} items: {round(amount * result['attempts_per_item'], 1)} attempts, " + \
+                      f"{round(amount * result['gold_per_item'], 2)} gold, {round(amount * result['craft_mats_per_item'])} craft mats, " + \
+                      f"{round(amount * result['xp_per_item'])} XP")
 
-        # 3. Actual attempts
-        if times:
-            print(f"Simulating using crafting contract:")
-            attempts = [Transacter.rate_limit(self._simulate(summoner.token_id, item.base_type_id, item.item_id, craft_mats), 4) \
-                        for _ in range(times)]
-            
-            if times > 1:
-                success_rate = sum(attempts) / times
-                print(f"Success rate: {round(100 * success_rate, 1)}%")
+        # 4. Optional checks against the simulate() function of the crafting contract
+        if spot_checks:
+            print(f"Checking {spot_checks} results of the crafting contract against the local rules:")
+            mismatches = 0
+            for i in range(spot_checks):
+                if i > 0:
+                    # Results only change with the block
+                    time.sleep(self.SPOT_CHECK_DELAY)
+                contract_result = self._simulate(summoner.token_id, item.base_type_id, item.item_id, craft_mats)
+                differences = simulator.check_contract_result(*contract_result)
+                for difference in differences:
+                    print(Fore.RED + "Mismatch: " + difference + Fore.RESET)
+                mismatches += bool(differences)
+            if mismatches:
+                print(Fore.RED + f"{mismatches}/{spot_checks} contract results don't match the local rules." + Fore.RESET)
+            else:
+                print(Fore.GREEN + f"All {spot_checks} contract results match the local rules." + Fore.RESET)
         return proba
-        
+
+    # Seconds between two calls to the contract's simulate() (about a block)
+    SPOT_CHECK_DELAY = 1
 
     def _simulate(self, summoner_id, base_type, item_type, craft_mats):
-        """Call simulate() from the crafting contract"""
+        """Call simulate() from the crafting contract. Returns (crafted, check, cost, dc)."""
         crafted, check, cost, dc = self.contracts["crafting"].functions.\
             simulate(summoner_id, base_type, item_type, craft_mats).call()
-        cost = cost / 1e18
         if crafted:
-            print(Fore.GREEN + f"Success!\tCheck: {check}\tItem DC:{dc} \tCost:{cost}" + Fore.RESET)
+            print(Fore.GREEN + f"Success!\tCheck: {check}\tItem DC:{dc} \tCost:{cost / 1e18}" + Fore.RESET)
         else:
-            print(Fore.RED + f"Failure!\tCheck: {check}\tItem DC:{dc} \tCost:{cost}" + Fore.RESET)
-        return crafted
+            print(Fore.RED + f"Failure!\tCheck: {check}\tItem DC:{dc} \tCost:{cost / 1e18}" + Fore.RESET)
+        return crafted, check, cost, dc
+
+    # Attempts below this success probability are refused
+    MIN_PROBA = 0.5
 
     def craft(self, summoner, item, craft_mats):
-        if not summoner.signer:
-            raise CraftingError("Summoner can't sign tx without a signer")
-        if summoner.gold < item.cost:
-            raise CraftingError("Summoner doesn't have enough gold to craft the item")
-        if craft_mats < 0 or craft_mats % 10 != 0:
-            raise CraftingError("Invalid quantity of crafting material (should be a multiple of 10)")
-        if summoner.get_balance_craft1() < craft_mats:
-            raise CraftingError("Summoner doesn't have enough crafting material")
-        if summoner.get_craft_level() == 0:
-            raise CraftingError("Summoner can't craft. Increase crafting skill level.")
-        
-        success_proba = self.check_craft(summoner, item, craft_mats)
-        if success_proba == 0:
-            raise CraftingError("Summoner has no chance to craft this: aborting")
-        if success_proba < 0.5:
-            raise CraftingError(f"Success proba is too low ({round(100 * success_proba, 1)}%): aborting")
+        """Single crafting attempt. To craft many times, use a `CraftingSession`."""
+        return CraftingSession(self, summoner, item, craft_mats).submit()
 
-        print(f"Attempting to craft a {item} with {summoner}. Success probability: {round(100 * success_proba, 1)}%")
-        craft_fun = self.contracts["crafting"].functions.craft(summoner.token_id, item.base_type_id, item.item_id, craft_mats)
-        return summoner.sign_and_execute(craft_fun, gas = 500000)
+    @staticmethod
+    def count_crafted(receipt):
+        """Number of items minted in a craft tx (0 if the attempt failed)"""
+        if receipt is None or receipt.status != 1:
+            return 0
+        crafting_contract = CraftingEngine.contract_addresses["crafting"].lower()
+        zero_topic = LogScanner.address_topic("0x" + "0" * 40)
+        return len([log for log in receipt.logs if log.address.lower() == crafting_contract and len(log.topics) > 1 and \
+                    Web3.toHex(log.topics[0]) == LogScanner.TRANSFER_TOPIC and Web3.toHex(log.topics[1]) == zero_topic])
         
     @staticmethod
     def setup_crafting(summoner, approve_for_all = False):
@@ -156,7 +318,169 @@ class CraftingEngine:
     def is_ready_to_craft(summoner):
         crafting_contract = CraftingEngine.contract_addresses["crafting"]
         crafting_spender = CraftingEngine.crafting_spender
-        return  summoner.get_craft_level() > 0 and \
-                summoner.is_approved(crafting_contract) and \
-                summoner.get_gold_allowance(crafting_spender) > 0 and \
-                summoner.get_craft_mats_allowance(crafting_spender) > 0
\ No newline at end of file
+        return CraftingEngine.check_ready_to_craft(summoner.get_craft_level(), summoner.is_approved(crafting_contract),
+                                                   summoner.get_gold_allowance(crafting_spender),
+                                                   summoner.get_craft_mats_allowance(crafting_spender))
+
+    @staticmethod
+    def check_ready_to_craft(craft_level, is_approved, gold_allowance, craft_mats_allowance):
+        """Same as `is_ready_to_craft` but from pre-fetched values"""
+        return craft_level > 0 and is_approved and gold_allowance > 0 and craft_mats_allowance > 0
+
+
+class CraftingSession:
+    """Crafting attempts of one summoner, with balances read once and then tracked locally.
+
+    Each submitted attempt reserves its craft mats, XP and gold, so many attempts can be in flight
+    without reading balances again. Receipts settle the reservations: the contract always spends craft mats and XP,
+    and only spends gold when the item is crafted. Tx that revert or are rejected by the node give everything back,
+    and count as failed: after `MAX_FAILED_ATTEMPTS` of them, the session stops (they'd most likely fail again).
+    Tx whose receipt didn't arrive in time keep their reservation, since they may still be mined."""
+
+    MAX_FAILED_ATTEMPTS = 3
+
+    def __init__(self, crafting_engine, summoner, item, craft_mats):
+        if not summoner.signer:
+            raise CraftingError("Summoner can't sign tx without a signer")
+        if craft_mats < 0 or craft_mats % 10 != 0:
+            raise CraftingError("Invalid quantity of crafting material (should be a multiple of 10)")
+        self.crafting_engine = crafting_engine
+        self.transacter = summoner.transacter
+        self.summoner = summoner
+        self.item = item
+        self.craft_mats = craft_mats
+
+        # Pre-fetched data if any (see `Summoner.batch_reads`), else read once
+        data = summoner.details_data or summoner.fetch_details_data()
+        self.craft_level = data["skills"][5]
+        self.gold = data["gold"] / 1e18
+        self.craft_mats_balance = data["craft1"]
+        self.xp = data["summoner"][0] / 1e18
+        self.proba = CraftingEngine.check_craft_proba(self.craft_level, summoner.attributes["int"], item.DC, craft_mats)
+
+        self.in_flight = {} # tx_hash => True, until the receipt is settled
+        self.attempts = 0
+        self.crafted = 0
+        self.failed = 0
+
+    def check_attempt(self):
+        """Raise a CraftingError if another attempt can't be made with the balances left"""
+        if self.craft_level == 0:
+            raise CraftingError("Summoner can't craft. Increase crafting skill level.")
+        if self.proba == 0:
+            raise CraftingError("Summoner has no chance to craft this: aborting")
+        if self.proba < CraftingEngine.MIN_PROBA:
+            raise CraftingError(f"Success proba is too low ({round(100 * self.proba, 1)}%): aborting")
+        if self.gold < self.item.cost:
+            raise CraftingError("Summoner doesn't have enough gold to craft the item")
+        if self.craft_mats_balance < self.craft_mats:
+            raise CraftingError("Summoner doesn't have enough crafting material")
+        if self.xp < CraftingSimulator.XP_PER_ATTEMPT:
+            raise CraftingError("Summoner doesn't have enough XP to craft")
+        if self.failed >= self.MAX_FAILED_ATTEMPTS:
+            raise CraftingError(f"{self.failed} crafting attempts failed: stopping")
+
+    def get_max_attempts(self):
+        """Attempts that can be submitted now, if they were all successful (the most expensive case)"""
+        try:
+            self.check_attempt()
+        except CraftingError:
+            return 0
+        limits = [int(self.xp // CraftingSimulator.XP_PER_ATTEMPT)]
+        if self.item.cost > 0:
+            limits.append(int(self.gold // self.item.cost))
+        if self.craft_mats > 0:
+            limits.append(int(self.craft_mats_balance // self.craft_mats))
+        return min(limits)
+
+    def submit(self):
+        """Sign a crafting attempt and reserve what it may spend. Returns the tx status."""
+        self.check_attempt()
+        print(f"Attempting to craft a {self.item} with {self.summoner}. Success probability: {round(100 * self.proba, 1)}%")
+        craft_fun = self.crafting_engine.contracts["crafting"].functions.\
+            craft(self.summoner.token_id, self.item.base_type_id, self.item.item_id, self.craft_mats)
+        try:
+            tx_status = self.summoner.sign_and_execute(craft_fun, gas = 500000)
+        except ValueError:
+            # Rejected by the node
+            self.failed += 1
+            raise
+        self.reserve(1)
+        self.attempts += 1
+        if tx_status["status"] == "pending":
+            self.in_flight[tx_status["hash"]] = True
+        else:
+            self.settle_receipt(tx_status["receipt"])
+        return tx_status
+
+    def reserve(self, sign):
+        self.gold -= sign * self.item.cost
+        self.craft_mats_balance -= sign * self.craft_mats
+        self.xp -= sign * CraftingSimulator.XP_PER_ATTEMPT
+
+    def settle(self, tx_hash, receipt):
+        """Settle an attempt in flight from its receipt (None if the tx was rejected and will never be mined)"""
+        if self.in_flight.pop(tx_hash, None):
+            if receipt is None:
+                # Nothing spent
+                self.reserve(-1)
+                self.failed += 1
+            else:
+                self.settle_receipt(receipt)
+
+    def settle_receipt(self, receipt):
+        if receipt is None:
+            # No receipt in time: the tx may still be mined, keep its reservation
+            return
+        if receipt.status != 1:
+            # Reverted: nothing spent but gas
+            self.reserve(-1)
+            self.failed += 1
+            return
+        crafted = CraftingEngine.count_crafted(receipt)
+        if not crafted:
+            self.gold += self.item.cost
+        self.crafted += crafted
+
+    def run(self, amount, wait_timeout = 360):
+        """Make `amount` attempts, with as many in flight as the balances allow. Returns the number of items crafted."""
+        collector = ReceiptCollector(self.transacter)
+        last_receipt_time = time.time()
+        while True:
+            # Submit what the balances allow, then broadcast it all at once
+            while self.attempts < amount and self.get_max_attempts() > 0:
+                try:
+                    self.submit()
+                except ValueError as e:
+                    # Rejected by the node: counts as failed, so this stops after MAX_FAILED_ATTEMPTS of them.
+                    # Attempts already in flight are still collected below.
+                    print(Fore.RED + "Crafting tx rejected: " + str(e) + Fore.RESET)
+            sent = {tx["tx_hash"]: tx for tx in self.transacter.take_pending_transactions()}
+            for tx_hash in list(self.in_flight):
+                if tx_hash in sent:
+                    collector.add(tx_hash, sent[tx_hash]["gas_price"])
+                elif tx_hash not in collector.pending:
+                    # Rejected by the node: won't be mined
+                    self.settle(tx_hash, None)
+            if not collector.pending:
+                break
+
+            # Receipts give back the gold of failed attempts, which may allow more attempts
+            arrived = collector.poll()
+            for tx_hash, receipt in arrived:
+                self.settle(tx_hash, receipt)
+            if arrived:
+                last_receipt_time = time.time()
+            elif time.time() - last_receipt_time > wait_timeout:
+                print(Fore.RED + "Tx taking too long, gave up waiting for " + str(len(collector.pending)) + " receipts" + Fore.RESET)
+                break
+            else:
+                time.sleep(ReceiptCollector.POLL_INTERVAL)
+
+        if self.attempts < amount:
+            try:
+                self.check_attempt()
+            except CraftingError as e:
+                print(Fore.RED + str(e) + Fore.RESET)
+        print(Fore.GREEN + f"Crafted {self.crafted} {self.item} in {self.attempts} attempts" + Fore.RESET)
+        return self.crafted
@@ -0,0 +1,114 @@
+from colorama import Fore
+from web3 import Web3
+import time
+
+from crafting import CraftingEngine, CraftingError, CraftingSession
+from transacter import ReceiptCollector
+
+class CraftingJob:
+    """Craft a quantity of an item with many crafters at once.
+
+    Each round spreads attempts across all ready crafters (within their gold, craft mats and XP, best chances first),
+    sends them together (one pipelined batch in `--txmode batch`), and counts the items crafted from the receipts.
+    Rounds go on until the quantity is crafted, no crafter can make another attempt (see `CraftingSession`
+    for failed attempts), or every attempt of a round failed.
+    Balances are read once: each crafter has a `CraftingSession` that keeps track of them."""
+
+    def __init__(self, transacter, summoners, item, craft_mats, quantity, wait_timeout = 360):
+        self.transacter = transacter
+        self.crafting_engine = CraftingEngine()
+        self.item = item
+        self.craft_mats = craft_mats
+        self.quantity = quantity
+        self.wait_timeout = wait_timeout
+        self.sessions = [CraftingSession(self.crafting_engine, summoner, item, craft_mats)
+                         for summoner in summoners if self.is_ready(summoner)]
+
+    @staticmethod
+    def is_ready(summoner):
+        """Whether the summoner is set up for crafting (from pre-fetched data, see `Summoner.batch_reads`)"""
+        data = summoner.details_data
+        crafting_contract = Web3.toChecksumAddress(CraftingEngine.contract_addresses["crafting"])
+        is_approved = data["approved_for_all"] or Web3.toChecksumAddress(data["approved"]) == crafting_contract
+        return CraftingEngine.check_ready_to_craft(data["skills"][5], is_approved, 
+                                                   data["gold_allowance"], data["craft_mats_allowance"])
+
+    def plan(self, remaining):
+        """Session of each attempt of the next round: one attempt per crafter in turn,
+           until the expected number of items reaches `remaining`"""
+        budgets = {session: session.get_max_attempts() for session in self.sessions}
+        crafters = sorted([s for s in self.sessions if budgets[s] > 0], key = lambda s: s.proba, reverse = True)
+        attempts = []
+        expected_items = 0
+        while crafters and expected_items < remaining:
+            for session in list(crafters):
+                if expected_items >= remaining:
+                    break
+                attempts.append(session)
+                expected_items += session.proba
+                budgets[session] -= 1
+                if budgets[session] == 0:
+                    crafters.remove(session)
+        return attempts
+
+    def get_crafted(self):
+        return sum(session.crafted for session in self.sessions)
+
+    def get_failed(self):
+        return sum(session.failed for session in self.sessions)
+
+    def run(self):
+        """Returns the number of items crafted"""
+        while self.get_crafted() < self.quantity:
+            remaining = self.quantity - self.get_crafted()
+            attempts = self.plan(remaining)
+            if not attempts:
+                print(Fore.RED + "No crafter can make another attempt (check readiness, gold, craft mats and XP)." + Fore.RESET)
+                break
+            print(Fore.WHITE + f"Crafting {remaining} {self.item}: {len(attempts)} attempts " + \
+                  f"with {len(set(attempts))} crafters" + Fore.RESET)
+
+            # Sign all attempts of the round, then broadcast them at once
+            crafted_before = self.get_crafted()
+            failed_before = self.get_failed()
+            not_sent = 0
+            sessions_by_hash = {}
+            for session in attempts:
+                try:
+                    tx_status = session.submit()
+                except (CraftingError, ValueError) as e:
+                    print(Fore.RED + f"{session.summoner} could not craft: {e}" + Fore.RESET)
+                    # Tx rejected by the node (ValueError) already count as failed attempts
+                    not_sent += isinstance(e, CraftingError)
+                    continue
+                if tx_status["status"] == "pending":
+                    sessions_by_hash[tx_status["hash"]] = session
+            self.collect(sessions_by_hash)
+
+            crafted = self.get_crafted() - crafted_before
+            print(Fore.GREEN + f"Crafted {crafted} items in {len(attempts)} attempts " + \
+                  f"({self.get_crafted()}/{self.quantity})" + Fore.RESET)
+            if not crafted and self.get_failed() - failed_before + not_sent >= len(attempts):
+                print(Fore.RED + "Every attempt of the round failed: stopping." + Fore.RESET)
+                break
+        return self.get_crafted()
+
+    def collect(self, sessions_by_hash):
+        """Broadcast signed attempts and settle their sessions from the receipts"""
+        collector = ReceiptCollector(self.transacter)
+        for tx in self.transacter.take_pending_transactions():
+            collector.add(tx["tx_hash"], tx["gas_price"])
+        for tx_hash, session in sessions_by_hash.items():
+            if tx_hash not in collector.pending:
+                # Rejected by the node: won't be mined
+                session.settle(tx_hash, None)
+        start_time = time.time()
+        while collector.pending and time.time() - start_time <= self.wait_timeout:
+            arrived = collector.poll()
+            for tx_hash, receipt in arrived:
+                if tx_hash in sessions_by_hash:
+                    sessions_by_hash[tx_hash].settle(tx_hash, receipt)
+            if collector.pending and not arrived:
+                time.sleep(ReceiptCollector.POLL_INTERVAL)
+        if collector.pending:
+            print(Fore.RED + "Tx taking too long, gave up waiting for " + str(len(collector.pending)) + " receipts" + Fore.RESET)
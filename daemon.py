@@ -0,0 +1,166 @@
+from colorama import Fore
+import heapq
+import requests
+import time
+
+from list_summoners import list_tokens_from_contract
+from multicall import MulticallError
+from ownership import OwnershipError
+from scheduler import ActionScheduler
+from summoner import Summoner
+from sync import FleetSync
+from transacter import Transacter
+
+class Daemon:
+    """Keep the fleet in memory and act on summoners exactly when their cooldowns expire.
+
+    Summoners are kept in a min-heap of (next ready timestamp, summoner id), built from their adventurers logs.
+    The daemon sleeps until the earliest timestamp, then only acts on the summoners that are ready.
+    Summoner data is kept up to date from contract events (see `FleetSync`) rather than read again.
+    Ownership is checked again every `resync_interval` seconds, to pick up new (or sent) summoners.
+    Network and node errors don't stop the daemon: the summoners (or the resync) are retried later."""
+
+    DEFAULT_RESYNC_INTERVAL = 3600
+
+    # Wake up a bit after the cooldown, in case the chain timestamp lags behind our clock
+    WAKE_UP_MARGIN = 5
+
+    # When nothing could be done for a ready summoner (e.g. tx failed, gas too high), try again later
+    RETRY_DELAY = 600
+
+    # Errors from the node, the explorer or the network (web3 raises ValueError for RPC errors): log them and try again later
+    RECOVERABLE_ERRORS = (MulticallError, OwnershipError, requests.exceptions.RequestException, ValueError)
+
+    def __init__(self, transacter, owner_address, signer, actions,
+                 resync_interval = DEFAULT_RESYNC_INTERVAL, max_gas_price_gwei = None):
+        self.transacter = transacter
+        self.owner_address = owner_address
+        self.signer = signer
+        self.scheduler = ActionScheduler(transacter, actions)
+        self.actions = self.scheduler.actions
+        self.resync_interval = resync_interval
+        self.max_gas_price_gwei = max_gas_price_gwei
+        self.fleet = FleetSync(transacter, owner_address)
+        self.ready_heap = []
+        self.last_resync = 0
+        self.update_chain_time()
+
+    def update_chain_time(self):
+        """Chain time is estimated from the timestamp of the latest block and our clock"""
+        self.transacter.update_timestamp()
+        self.clock_offset = self.transacter.timestamp - time.time()
+
+    def chain_time(self):
+        return time.time() + self.clock_offset
+
+    def next_ready_time(self, summoner):
+        """Timestamp when the summoner will have something to do (from pre-fetched data, see Summoner.batch_reads)"""
+        data = summoner.details_data
+        ready_times = []
+        if "adventure" in self.actions:
+            ready_times.append(data["adventurers_log"])
+        if "cellar" in self.actions and data["cellar_loot"] >= Summoner.MIN_CELLAR_LOOT:
+            ready_times.append(data["cellar_log"])
+        if not ready_times:
+            # Level up and gold claims come after adventures: nothing to wait for
+            return self.chain_time() + self.resync_interval
+        next_time = min(ready_times)
+        if next_time <= self.chain_time():
+            return next_time
+        return next_time + self.WAKE_UP_MARGIN
+
+    def schedule(self, summoners, not_before = 0):
+        for summoner in summoners:
+            ready_time = max(self.next_ready_time(summoner), not_before)
+            heapq.heappush(self.ready_heap, (ready_time, summoner.token_id))
+
+    def retry_later(self, token_ids):
+        retry_time = self.chain_time() + self.RETRY_DELAY
+        for token_id in token_ids:
+            heapq.heappush(self.ready_heap, (retry_time, token_id))
+
+    def try_resync(self):
+        """Resync, or try again in `RETRY_DELAY` seconds if the node or the explorer fails"""
+        try:
+            self.resync()
+        except self.RECOVERABLE_ERRORS as e:
+            print(Fore.RED + "Could not sync summoners: " + str(e) + ". Trying again later." + Fore.RESET)
+            self.last_resync = time.time() - self.resync_interval + self.RETRY_DELAY
+
+    def resync(self):
+        """Update ownership, load new summoners, and rebuild the heap"""
+        print(Fore.WHITE + "Syncing summoners owned by " + self.owner_address + Fore.RESET)
+        token_ids = list_tokens_from_contract(self.owner_address, Transacter.contract_addresses["summoner"])
+        self.fleet.track(token_ids)
+        self.fleet.sync()
+        self.update_chain_time()
+        self.ready_heap = []
+        self.schedule(self.fleet.get_summoners())
+        self.last_resync = time.time()
+
+    def pop_ready(self):
+        """Remove and return the ids of all summoners ready now"""
+        ready_ids = []
+        now = self.chain_time()
+        while self.ready_heap and self.ready_heap[0][0] <= now:
+            _, token_id = heapq.heappop(self.ready_heap)
+            if token_id not in ready_ids:
+                ready_ids.append(token_id)
+        return ready_ids
+
+    def check_gas_price(self):
+        if self.max_gas_price_gwei is None:
+            return True
+        gas_price_gwei = self.transacter.get_gas_price() * 1e9
+        if gas_price_gwei > self.max_gas_price_gwei:
+            print(Fore.RED + "Gas price too high (" + str(round(gas_price_gwei, 1)) + " gwei): waiting." + Fore.RESET)
+            return False
+        return True
+
+    def act(self, token_ids):
+        """Run the actions for the given summoners, then schedule them again"""
+        if not self.check_gas_price():
+            self.retry_later(token_ids)
+            return
+        self.fleet.sync()
+        self.update_chain_time()
+        summoners = self.fleet.get_summoners(signer = self.signer, token_ids = token_ids)
+        self.scheduler.run(summoners)
+        self.transacter.wait_for_pending_transations()
+
+        # Fresh state after the actions: from their events, and reads of what events don't tell
+        for action in self.actions:
+            self.fleet.mark_stale(token_ids, FleetSync.ACTION_FIELDS[action])
+        self.fleet.sync()
+        self.update_chain_time()
+        summoners = self.fleet.get_summoners(token_ids = token_ids)
+        still_ready = [s for s in summoners if self.next_ready_time(s) <= self.chain_time()]
+        self.schedule([s for s in summoners if s not in still_ready])
+        self.schedule(still_ready, not_before = self.chain_time() + self.RETRY_DELAY)
+
+    def run(self):
+        """Run forever (until interrupted)"""
+        print(Fore.YELLOW + "Starting daemon for actions: " + ", ".join(self.actions) + Fore.RESET)
+        self.try_resync()
+        while True:
+            if time.time() - self.last_resync >= self.resync_interval:
+                self.try_resync()
+            if not self.ready_heap:
+                time.sleep(max(self.resync_interval - (time.time() - self.last_resync), 0))
+                continue
+
+            next_time = self.ready_heap[0][0]
+            wait_time = next_time - self.chain_time()
+            if wait_time > 0:
+                next_resync = self.resync_interval - (time.time() - self.last_resync)
+                print(Fore.WHITE + "Next summoner ready in " + Summoner.seconds_to_hms(round(wait_time)).strip() + Fore.RESET)
+                time.sleep(max(min(wait_time, next_resync), 0))
+                continue
+
+            ready_ids = self.pop_ready()
+            print(Fore.WHITE + str(len(ready_ids)) + " summoner" + ("s are" if len(ready_ids) > 1 else " is") + " ready" + Fore.RESET)
+            try:
+                self.act(ready_ids)
+            except self.RECOVERABLE_ERRORS as e:
+                print(Fore.RED + "Could not act on ready summoners: " + str(e) + ". Trying again later." + Fore.RESET)
+                self.retry_later(ready_ids)
@@ -2,8 +2,10 @@ from colorama.ansi import Fore
 from tabulate import tabulate
 from web3.main import Web3
 
+from codex import CodexSnapshot
 from summoner import InvalidAddressError
 from transacter import Transacter
+import network
 
 
 class InvalidItemError(Exception):
@@ -28,8 +30,19 @@ class ItemCodex:
     contract_checksums = {k: Web3.toChecksumAddress(v) for k, v in contract_addresses.items()}
 
     def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider('https://rpc.ftm.tools/'))
-        self.contracts = {cname: Transacter.rate_limit(self.get_codex_contract(cname)) for cname in self.contract_addresses.keys()}
+        self.w3 = network.get_web3()
+        self._contracts = None
+        # Codex data never changes: read each item only once
+        self.item_data = {}
+        # Items by (codex name, id), shared by all tokens of the same item
+        self.items = {}
+
+    @property
+    def contracts(self):
+        """Contracts are only needed when the data isn't in the codex snapshot"""
+        if self._contracts is None:
+            self._contracts = {cname: self.get_codex_contract(cname) for cname in self.contract_addresses.keys()}
+        return self._contracts
 
     def get_codex_contract(self, codex_name):
         '''Get contract or raise a KeyError if contract isn't listed'''
@@ -38,23 +51,39 @@ class ItemCodex:
 
     def get_item_data(self, codex_name, id):
         try:
-            contract = self.contracts[codex_name]
             size = self.codex_sizes[codex_name]
         except KeyError:
             raise InvalidItemError("Invalid codex name")
         if id > size:
             raise InvalidItemError("Invalid item id: too big")
-        item_data = contract.functions.item_by_id(id).call()
-        return item_data
+        if (codex_name, id) not in self.item_data:
+            item_data = CodexSnapshot.get_item_data(codex_name, id)
+            if item_data is None:
+                item_data = self.contracts[codex_name].functions.item_by_id(id).call()
+            self.item_data[(codex_name, id)] = item_data
+        return self.item_data[(codex_name, id)]
+
+    def get_item(self, codex_name, id):
+        if (codex_name, id) not in self.items:
+            self.items[(codex_name, id)] = Item.create_from_data(codex_name, id, self)
+        return self.items[(codex_name, id)]
 
     def get_items(self, codex_name):
         try:
-            contract = self.contracts[codex_name]
             size = self.codex_sizes[codex_name]
         except KeyError:
             raise InvalidItemError("Invalid codex name")
         return [Item.create_from_data(codex_name, id, self) for id in range(1, size+1)]
         
+_item_codex = None
+
+def get_item_codex():
+    """Item codex shared by the whole session (codex data never changes)"""
+    global _item_codex
+    if _item_codex is None:
+        _item_codex = ItemCodex()
+    return _item_codex
+
 class Item:
 
     base_type_from_id = {
@@ -77,7 +106,7 @@ class Item:
     @classmethod
     def create_from_token(cls, token_id, codex):
         (base_type, item_type, crafted, crafter) = codex.contracts["crafting"].functions.items(token_id).call()
-        return Item.create_from_data(cls.base_type_from_id[base_type], item_id = item_type, codex = codex)
+        return codex.get_item(cls.base_type_from_id[base_type], item_type)
 
     def __init__(self):
         raise InvalidItemError("Items must be instantiated with Item.create_from_data or Item.create_from_token")
@@ -87,20 +116,38 @@ class Item:
 
     @staticmethod
     def print_items(items):
+        Item.print_rows([item.get_details() for item in items])
+
+    @staticmethod
+    def print_inventory(inventory, per_token = False):
+        """Print owned items ({token_id: item}): one row per item with how many are owned, or one row per token"""
+        if per_token:
+            rows = [dict({"token_id": token_id}, **item.get_details()) for token_id, item in inventory.items()]
+        else:
+            counts = {}
+            for item in inventory.values():
+                counts[item] = counts.get(item, 0) + 1
+            items = sorted(counts, key = lambda item: (item.base_type_id, item.item_id))
+            rows = [dict({"count": counts[item]}, **item.get_details()) for item in items]
+        Item.print_rows(rows)
+
+    @staticmethod
+    def print_rows(rows):
+        """Print item details (see `get_details`), in one table per base type"""
         def print_tbl(dict):
             print(Fore.WHITE + tabulate(dict, headers = "keys", tablefmt = "pretty"))
 
-        goods = [item.get_details() for item in items if item.base_type == "goods"]
+        goods = [row for row in rows if row["base_type"] == "goods"]
         if goods:
             print("\n --- GOODS ---")
             print_tbl(goods)
 
-        armors = [item.get_details() for item in items if item.base_type == "armors"]
+        armors = [row for row in rows if row["base_type"] == "armors"]
         if armors:
             print("\n --- ARMORS ---")
             print_tbl(armors)
 
-        weapons = [item.get_details() for item in items if item.base_type == "weapons"]
+        weapons = [row for row in rows if row["base_type"] == "weapons"]
         if weapons:
             print("\n --- WEAPONS ---")
             print_tbl(weapons)
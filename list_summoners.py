@@ -1,42 +1,24 @@
 from colorama import Fore
-import requests
+from web3 import Web3
+from web3.exceptions import ContractLogicError
 from transacter import Transacter
 
 # Local imports
-from summoner import Summoner
-from items import ItemCodex, Item
+from crafting import CraftingEngine
+from multicall import Multicall, MulticallError
+import network
+from ownership import OwnershipIndex
+from snapshot import FleetSnapshot
+from store import get_store
+from summoner import InvalidSummonerError, Summoner
+from items import ItemCodex, Item, get_item_codex
 
 def list_tokens_from_contract(owner_address, contract_address, limit = 0):
-    """List tokens by listing ERC721 transactions"""
+    """List tokens by listing ERC721 transfers (only those since the last run, see OwnershipIndex)"""
+    index = OwnershipIndex(owner_address, contract_address)
+    index.update()
 
-    owner_address = owner_address.lower()
-    contract_address = contract_address.lower()
-    
-    # Check all ERC721 transactions from account using FTScan API
-    erc721transfers_url = "https://api.ftmscan.com/api?module=account&action=tokennfttx&address=" + \
-        owner_address + "&startblock=0&endblock=999999999&sort=asc"
-
-    try:
-        res = requests.get(erc721transfers_url)
-        res_json = res.json()
-        transfers = res_json["result"]
-    except requests.exceptions.RequestException as e:
-        raise SystemExit(e)
-
-    # Loop through ERC721 transactions and count token sent and received
-    token_counts = {}
-
-    for transaction in transfers:
-        if transaction["contractAddress"] == contract_address:
-            token_id = int(transaction["tokenID"])
-            if transaction["to"] == owner_address:
-                token_counts[token_id] = token_counts.get(token_id, 0) + 1
-            if transaction["from"] == owner_address:
-                token_counts[token_id] = token_counts.get(token_id, 0) - 1
-
-    # Tokens we still own should have a count of 1 (we could have sent them and gotten them back)
-    # We should only ever have counts of -1 and +1
-    token_ids =  [token for token in token_counts if token_counts[token] > 0]
+    token_ids = index.get_token_ids()
     if limit:
         print(f"Limiting results to {limit} / {len(token_ids)} tokens.")
         token_ids = token_ids[0:limit]
@@ -44,7 +26,7 @@ def list_tokens_from_contract(owner_address, contract_address, limit = 0):
     return token_ids
 
 
-def list_summoners(address, transacter, set_signer = None, limit = 0):
+def list_summoners(address, transacter, set_signer = None, limit = 0, max_staleness = 0):
     '''List summoners owned by the given address'''
     
     print("Scanning for summoners, this may take a while...")
@@ -54,15 +36,109 @@ def list_summoners(address, transacter, set_signer = None, limit = 0):
     print(Fore.WHITE + "Fetching summoner info, this may take a while...\n")
     
     # Finally, we instantiate a Summoner for each ID
-    summoners = []
-    for id in token_ids:
-        summoner = Summoner(id, transacter, signer = set_signer)
-        summoners.append(summoner)
-
-    return summoners
+    return load_summoners(token_ids, transacter, signer = set_signer, max_staleness = max_staleness)
+
+def load_summoners(token_ids, transacter, signer = None, max_staleness = 0):
+    """Build summoners from their IDs, reading their data from a fleet snapshot (see `load_snapshot`)"""
+    return load_snapshot(token_ids, transacter, max_staleness).get_summoners(transacter, signer = signer)
+
+def load_summoner(token_id, transacter, signer = None, max_staleness = 0):
+    """Build one summoner (see `load_summoners`). Raises InvalidSummonerError if it can't be read."""
+    summoners = load_summoners([token_id], transacter, signer = signer, max_staleness = max_staleness)
+    if not summoners:
+        raise InvalidSummonerError(f"Summoner {token_id}: could not fetch summoner data. Does it exist?")
+    return summoners[0]
+
+def load_snapshot(token_ids, transacter, max_staleness = 0):
+    """Fleet snapshot of the given summoners, fetching their data with a few aggregated calls, all at the same block.
+       Data stored by previous runs is reused when it's fresh enough (see `FleetStore`), with the block it was read at: 
+       `max_staleness` is how old (in seconds) data that can change anytime may be."""
+    try:
+        token_ids = [int(id) for id in token_ids]
+    except ValueError:
+        raise InvalidSummonerError("Invalid Summoner ID (must be castable to int)")
+
+    store = get_store()
+    entries = store.load(token_ids)
+    known_data = {id: {field: entry["value"] for field, entry in entries[id].items()} for id in token_ids}
+    blocks = {id: {field: entry["block"] for field, entry in entries[id].items()} for id in token_ids}
+    fields_by_token = {id: store.stale_fields(entries[id], Summoner.DATA_FIELDS, max_staleness, transacter.timestamp) 
+                       for id in token_ids}
+    fields_by_token = {id: fields for id, fields in fields_by_token.items() if fields}
+
+    block = timestamp = None
+    if fields_by_token:
+        # All reads at the same block, remembered in the store
+        latest_block = transacter.w3.eth.get_block("latest")
+        block, timestamp = latest_block["number"], latest_block["timestamp"]
+        fresh_data = fetch_summoners_fields(fields_by_token, transacter, known_data = known_data, block_identifier = block)
+        store.save(fresh_data, block)
+        for id, values in fresh_data.items():
+            known_data[id].update(values)
+            for field in values:
+                blocks[id].pop(field, None)
+
+    return FleetSnapshot(block, known_data, timestamp = timestamp, blocks = blocks)
+
+def fetch_summoners_fields(fields_by_token, transacter, known_data = None, block_identifier = "latest"):
+    """Fetch some fields of many summoners ({token_id: fields}, see `Summoner.batch_reads`) with a few aggregated calls. 
+       `known_data` gives the owners of summoners whose owner isn't fetched (needed for `approved_for_all`).
+       Returns {token_id: {field: value}}."""
+    known_data = known_data or {}
+
+    # First pass: everything that only depends on the token ID
+    w3funs = []
+    indices = {}
+    for id, fields in fields_by_token.items():
+        reads = Summoner.batch_reads(id, transacter.contracts)
+        indices[id] = {}
+        for field in fields:
+            if field in reads:
+                indices[id][field] = len(w3funs)
+                w3funs.append(reads[field])
+    results = execute_reads(w3funs, transacter, block_identifier)
+    summoners_data = {id: {field: results[i] for field, i in summoner_indices.items()} 
+                      for id, summoner_indices in indices.items()}
+
+    # Second pass: crafting approval for all, which depends on the owner (usually the same for everyone)
+    crafting_contract = CraftingEngine.contract_addresses["crafting"]
+    owners = {}
+    for id, fields in fields_by_token.items():
+        owner = summoners_data[id].get("owner", known_data.get(id, {}).get("owner"))
+        if "approved_for_all" in fields and owner is not None:
+            owners[id] = Web3.toChecksumAddress(owner)
+    unique_owners = sorted(set(owners.values()))
+    results = execute_reads([transacter.contracts["summoner"].functions.isApprovedForAll(owner, crafting_contract) 
+                             for owner in unique_owners], transacter, block_identifier)
+    approvals = dict(zip(unique_owners, results))
+    for id, owner in owners.items():
+        summoners_data[id]["approved_for_all"] = approvals[owner]
+
+    return summoners_data
+
+def execute_reads(w3funs, transacter, block_identifier = "latest"):
+    """Run contract reads with a few aggregated calls and return their results, in order (None for calls that reverted)"""
+    if not w3funs:
+        return []
+    try:
+        multicall = Multicall(transacter.w3, block_identifier = block_identifier)
+        for w3fun in w3funs:
+            multicall.add(w3fun)
+        return multicall.execute()
+    except MulticallError as e:
+        # E.g. no Multicall3 contract on this chain: call them one by one, in parallel
+        print(Fore.YELLOW + str(e) + "\nReading them one by one instead." + Fore.RESET)
+        return list(network.get_executor().map(lambda w3fun: call_or_none(w3fun, block_identifier), w3funs))
+
+def call_or_none(w3fun, block_identifier = "latest"):
+    """Same as a call in a multicall: None if it reverted"""
+    try:
+        return w3fun.call(block_identifier = block_identifier)
+    except ContractLogicError:
+        return None
 
-def list_items(address, limit = 0):
-    '''List items owned by the given address'''
+def list_items(address, transacter, limit = 0):
+    '''List items owned by the given address, as {token_id: item}'''
     
     print("Scanning for items, this may take a while...")
     token_ids = list_tokens_from_contract(address, contract_address = ItemCodex.contract_addresses["crafting"], limit = limit)
@@ -70,8 +146,19 @@ def list_items(address, limit = 0):
 
 
     print(Fore.WHITE + "Fetching item details, this may take a while...\n")
-    codex = ItemCodex()
-    items = [Item.create_from_token(token_id, codex) for token_id in token_ids]
-
+    return load_items(token_ids, transacter)
+
+def load_items(token_ids, transacter):
+    """Items of the given tokens ({token_id: item}), reading all tokens with a few aggregated calls.
+       Item data comes from the shared codex (see `get_item_codex`): each item type is only looked up once."""
+    crafting_contract = CraftingEngine().contracts["crafting"]
+    results = execute_reads([crafting_contract.functions.items(token_id) for token_id in token_ids], transacter)
+    codex = get_item_codex()
+    items = {}
+    for token_id, result in zip(token_ids, results):
+        if result is None:
+            print(Fore.YELLOW + f"Item {token_id}: could not fetch item data, skipping." + Fore.RESET)
+            continue
+        (base_type, item_type, crafted, crafter) = result
+        items[token_id] = codex.get_item(Item.base_type_from_id[base_type], item_type)
     return items
-
@@ -0,0 +1,185 @@
+from colorama import Fore
+from eth_utils import function_abi_to_4byte_selector
+from tabulate import tabulate
+import json
+import math
+import random
+import threading
+import time
+
+class RpcMetrics:
+    """Count, errors, bytes and latency of RPC requests, by RPC method and by contract function.
+
+    Every request goes through the shared provider or an RPC batch (see `network`), which record it here.
+    Contract calls aggregated by Multicall are recorded too, each with the latency of its aggregate call:
+    contract functions show which reads dominate a run, RPC methods what was actually sent to the node."""
+
+    PERCENTILES = [50, 95, 99]
+
+    # Latencies kept per entry, to compute percentiles: a uniform sample once there are more (reservoir sampling),
+    # so memory stays bounded in long runs (e.g. the daemon). Total time is counted from all of them.
+    MAX_LATENCIES = 1000
+
+    # Max number of contract functions printed (the most called). The JSON output has all of them.
+    MAX_FUNCTIONS_SHOWN = 15
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.methods = {} # RPC method => entry
+        self.functions = {} # (contract address, selector) => entry
+
+    @staticmethod
+    def new_entry():
+        return {"calls": 0, "errors": 0, "bytes_sent": 0, "bytes_received": 0, "total_time": 0, "latencies": []}
+
+    def add(self, entries, key, latency, bytes_sent, bytes_received, error):
+        entry = entries.get(key)
+        if entry is None:
+            entry = entries[key] = self.new_entry()
+        entry["calls"] += 1
+        entry["errors"] += int(bool(error))
+        entry["bytes_sent"] += bytes_sent
+        entry["bytes_received"] += bytes_received
+        entry["total_time"] += latency
+        if len(entry["latencies"]) < self.MAX_LATENCIES:
+            entry["latencies"].append(latency)
+        else:
+            # Each of the latencies so far has the same chance to be in the sample
+            i = random.randrange(entry["calls"])
+            if i < self.MAX_LATENCIES:
+                entry["latencies"][i] = latency
+
+    def record_request(self, method, params, latency, bytes_sent, bytes_received, error = False):
+        """Record a JSON-RPC request (latency in seconds). eth_call requests are also recorded by contract function."""
+        with self.lock:
+            self.add(self.methods, method, latency, bytes_sent, bytes_received, error)
+            if method == "eth_call" and params and isinstance(params[0], dict):
+                key = self.get_function_key(params[0].get("to"), params[0].get("data"))
+                self.add(self.functions, key, latency, bytes_sent, bytes_received, error)
+
+    def record_call(self, address, data, latency, return_data, error = False):
+        """Record a contract call that didn't go to the node on its own (e.g. aggregated by Multicall).
+           Bytes are counted as hex, like in a request of its own."""
+        data, return_data = self.to_hex(data), self.to_hex(return_data)
+        with self.lock:
+            self.add(self.functions, self.get_function_key(address, data), latency, len(data), len(return_data), error)
+
+    @staticmethod
+    def to_hex(data):
+        return "0x" + bytes(data).hex() if isinstance(data, (bytes, bytearray)) else (data or "0x")
+
+    @staticmethod
+    def get_function_key(address, data):
+        return ((address or "").lower(), RpcMetrics.to_hex(data)[:10].lower())
+
+    ### SUMMARY -----------------------------
+
+    @staticmethod
+    def get_contract_names():
+        """Names of the contracts the bot talks to, by address"""
+        from crafting import CraftingEngine
+        from items import ItemCodex
+        from multicall import Multicall
+        from skills import SkillCodex
+        from transacter import Transacter
+        addresses = {"multicall": Multicall.contract_address}
+        for contract_addresses in [Transacter.contract_addresses, CraftingEngine.contract_addresses, ItemCodex.contract_addresses]:
+            addresses.update(contract_addresses)
+        # Not the same "skills" contract as the transacter's: this one serves class skills
+        addresses["skill_codex"] = SkillCodex.contract_addresses["skill_codex"]
+        addresses["class_skills"] = SkillCodex.contract_addresses["skills"]
+        return {address.lower(): name for name, address in addresses.items()}
+
+    @staticmethod
+    def get_abi(address):
+        from multicall import Multicall
+        from transacter import Transacter
+        if address == Multicall.contract_address.lower():
+            return Multicall.abi
+        # ABIs of contracts called are stored locally, so this doesn't download anything
+        return Transacter.get_abi(address)
+
+    def get_function_names(self, keys):
+        """Readable names ("summoner.ownerOf") of function keys (contract address, selector)"""
+        contract_names = self.get_contract_names()
+        selectors_by_address = {}
+        names = {}
+        for address, selector in keys:
+            contract_name = contract_names.get(address)
+            if contract_name is None:
+                names[(address, selector)] = address + "." + selector
+                continue
+            if address not in selectors_by_address:
+                selectors_by_address[address] = {"0x" + function_abi_to_4byte_selector(abi).hex(): abi["name"]
+                                                 for abi in self.get_abi(address) if abi.get("type") == "function"}
+            names[(address, selector)] = contract_name + "." + selectors_by_address[address].get(selector, selector)
+        return names
+
+    @staticmethod
+    def percentile(sorted_values, p):
+        """Nearest-rank percentile"""
+        if not sorted_values:
+            return None
+        return sorted_values[max(math.ceil(p / 100 * len(sorted_values)) - 1, 0)]
+
+    def summarize(self, entries):
+        """{key: summary}, with total time and latency percentiles (in ms) instead of the latencies"""
+        summaries = {}
+        for key, entry in entries.items():
+            latencies = sorted(entry["latencies"])
+            summary = {k: v for k, v in entry.items() if k != "latencies"}
+            summary["total_time"] = round(entry["total_time"], 3)
+            for p in self.PERCENTILES:
+                summary[f"p{p}_ms"] = round(self.percentile(latencies, p) * 1000, 1)
+            summaries[key] = summary
+        return summaries
+
+    def get_summary(self):
+        """Summaries by RPC method and by contract function name"""
+        with self.lock:
+            methods = self.summarize(self.methods)
+            functions = self.summarize(self.functions)
+        function_names = self.get_function_names(list(functions))
+        return {
+            "methods": methods,
+            "functions": {function_names[key]: summary for key, summary in functions.items()}
+        }
+
+    @staticmethod
+    def get_rows(summaries, first_column, sort_by, limit = None):
+        rows = sorted(summaries.items(), key = lambda item: -item[1][sort_by])
+        return [dict({first_column: name, "calls": summary["calls"], "errors": summary["errors"],
+                      "kB sent": round(summary["bytes_sent"] / 1000, 1),
+                      "kB received": round(summary["bytes_received"] / 1000, 1)},
+                     **{f"p{p} (ms)": summary[f"p{p}_ms"] for p in RpcMetrics.PERCENTILES})
+                for name, summary in rows[:limit]]
+
+    def print_summary(self):
+        if not self.methods:
+            return
+        summary = self.get_summary()
+        print(Fore.WHITE + "\nRPC requests:")
+        print(tabulate(self.get_rows(summary["methods"], "method", "total_time"), headers = "keys", tablefmt = "pretty") + Fore.RESET)
+        if summary["functions"]:
+            shown = min(len(summary["functions"]), self.MAX_FUNCTIONS_SHOWN)
+            print(Fore.WHITE + f"Contract calls ({shown} most called of {len(summary['functions'])}):")
+            print(tabulate(self.get_rows(summary["functions"], "function", "calls", self.MAX_FUNCTIONS_SHOWN),
+                           headers = "keys", tablefmt = "pretty") + Fore.RESET)
+
+    def save(self, path, **extra):
+        """Append the summary (with `extra` fields, e.g. the command) as one JSON line, to track trends across runs"""
+        record = dict({"timestamp": int(time.time())}, **extra, **self.get_summary())
+        try:
+            with open(path, "a") as f:
+                f.write(json.dumps(record) + "\n")
+        except OSError as e:
+            print(Fore.YELLOW + "Could not write metrics to " + path + ": " + str(e) + Fore.RESET)
+
+_metrics = None
+
+def get_metrics():
+    """Metrics of the whole session"""
+    global _metrics
+    if _metrics is None:
+        _metrics = RpcMetrics()
+    return _metrics
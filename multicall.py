@@ -0,0 +1,75 @@
+from web3 import Web3
+import time
+
+from metrics import get_metrics
+import network
+
+class MulticallError(Exception):
+    """Used to indicate a failed aggregate call"""
+    pass
+
+class Multicall:
+    """Aggregate many contract reads into a few Multicall3 `aggregate3` calls"""
+
+    # Multicall3 is deployed at the same address on most EVM chains, including Fantom Opera
+    contract_address = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
+    # Only the functions we need, so we don't have to download the full ABI
+    abi = [
+        {
+            "name": "aggregate3", "type": "function", "stateMutability": "payable",
+            "inputs": [{"name": "calls", "type": "tuple[]", "components": [
+                {"name": "target", "type": "address"},
+                {"name": "allowFailure", "type": "bool"},
+                {"name": "callData", "type": "bytes"}]}],
+            "outputs": [{"name": "returnData", "type": "tuple[]", "components": [
+                {"name": "success", "type": "bool"},
+                {"name": "returnData", "type": "bytes"}]}]
+        }
+    ]
+
+    # Max number of calls aggregated in a single eth_call.
+    # Large chunks may hit the gas limit of eth_call on public RPCs.
+    DEFAULT_CHUNK_SIZE = 250
+
+    def __init__(self, w3, chunk_size = DEFAULT_CHUNK_SIZE, block_identifier = "latest"):
+        """`block_identifier` pins all reads to the same block (e.g. to apply events after that block)"""
+        self.w3 = w3
+        self.contract = w3.eth.contract(address = Web3.toChecksumAddress(self.contract_address), abi = self.abi)
+        self.chunk_size = chunk_size
+        self.block_identifier = block_identifier
+        self.calls = []
+
+    def add(self, w3fun):
+        """Queue a contract call (as built by `contract.functions.fun(args)`). Returns its index in the results."""
+        self.calls.append(w3fun)
+        return len(self.calls) - 1
+
+    def execute(self):
+        """Run all queued calls and return their decoded results, in order.
+           Chunks are sent in parallel (see `network.workers`). Calls that reverted are returned as `None`."""
+        chunks = [self.calls[start:(start + self.chunk_size)] for start in range(0, len(self.calls), self.chunk_size)]
+        self.calls = []
+        if len(chunks) == 1:
+            return self.execute_chunk(chunks[0])
+        chunks_results = network.get_executor().map(self.execute_chunk, chunks)
+        return [result for chunk_results in chunks_results for result in chunk_results]
+
+    def execute_chunk(self, chunk):
+        payload = [(w3fun.address, True, w3fun._encode_transaction_data()) for w3fun in chunk]
+        start = time.monotonic()
+        try:
+            raw_results = self.contract.functions.aggregate3(payload).call(block_identifier = self.block_identifier)
+        except Exception as e:
+            raise MulticallError("Multicall failed: " + str(e))
+        # Each aggregated call is recorded with the latency of the whole aggregate call
+        latency = time.monotonic() - start
+        metrics = get_metrics()
+        for (address, allow_failure, data), (success, return_data) in zip(payload, raw_results):
+            metrics.record_call(address, data, latency, return_data, error = not success)
+        return [self.decode_result(w3fun, success, data) for w3fun, (success, data) in zip(chunk, raw_results)]
+
+    def decode_result(self, w3fun, success, data):
+        if not success:
+            return None
+        return network.decode_call_output(w3fun, data)
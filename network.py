@@ -0,0 +1,220 @@
+from concurrent.futures import ThreadPoolExecutor
+import requests
+from requests.adapters import HTTPAdapter
+from web3 import Web3
+from web3._utils.abi import get_abi_output_types
+import json
+import threading
+import time
+
+from metrics import get_metrics
+
+# Shared HTTP session and web3 provider: every engine and API client goes through them,
+# so connections are kept alive and reused instead of doing a new TLS handshake per request.
+
+DEFAULT_RPC_ENDPOINT = "https://rpc.ftm.tools/"
+DEFAULT_EXPLORER_API = "https://api.ftmscan.com/api"
+DEFAULT_POOL_SIZE = 20
+REQUEST_TIMEOUT = 30
+
+# Max number of requests made in parallel (by threads) and max number of RPC requests per second, across all threads
+DEFAULT_WORKERS = 4
+DEFAULT_MAX_RPS = 25
+
+rpc_endpoint = DEFAULT_RPC_ENDPOINT
+explorer_api = DEFAULT_EXPLORER_API
+pool_size = DEFAULT_POOL_SIZE
+workers = DEFAULT_WORKERS
+
+class RateLimiter:
+    """Space out requests so there are at most `max_per_second` of them, across all threads. 0 means no limit."""
+
+    def __init__(self, max_per_second = 0):
+        self.interval = 1 / max_per_second if max_per_second else 0
+        self.next_time = 0
+        self.lock = threading.Lock()
+
+    def wait(self):
+        if not self.interval:
+            return
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+rate_limiter = RateLimiter(DEFAULT_MAX_RPS)
+
+_session = None
+_w3 = None
+_executor = None
+_chain_id = None
+
+def configure(endpoint = None, pool = None, max_workers = None, max_rps = None, explorer = None):
+    """Set RPC endpoint, connection pool size, parallelism, rate limit and explorer API (FTMScan or compatible). 
+       Must be called before the first call to get_web3()/get_session()."""
+    global rpc_endpoint, pool_size, workers, rate_limiter, explorer_api, _session, _w3, _executor, _chain_id
+    if endpoint:
+        rpc_endpoint = endpoint
+    if explorer:
+        explorer_api = explorer
+    if pool:
+        pool_size = pool
+    if max_workers:
+        workers = max_workers
+    if max_rps is not None:
+        rate_limiter = RateLimiter(max_rps)
+    _session = None
+    _w3 = None
+    _chain_id = None
+    if _executor is not None:
+        _executor.shutdown(wait = False)
+    _executor = None
+
+class RateLimitedHTTPProvider(Web3.HTTPProvider):
+    """HTTP provider going through the shared rate limiter and session, recording the metrics of each request (see `metrics`).
+       web3's own provider caches a session per thread, so worker threads wouldn't share the connection pool."""
+
+    def make_request(self, method, params):
+        rate_limiter.wait()
+        request_data = self.encode_rpc_request(method, params)
+        start = time.monotonic()
+        try:
+            res = get_session().post(self.endpoint_uri, data = request_data, **self.get_request_kwargs())
+            res.raise_for_status()
+            raw_response = res.content
+        except Exception:
+            get_metrics().record_request(method, params, time.monotonic() - start, len(request_data), 0, error = True)
+            raise
+        # Latency of the POST only, not of decoding
+        latency = time.monotonic() - start
+        response = self.decode_rpc_response(raw_response)
+        get_metrics().record_request(method, params, latency, len(request_data), len(raw_response), error = "error" in response)
+        return response
+
+def get_session():
+    """HTTP session with a keep-alive connection pool, shared by everyone"""
+    global _session
+    if _session is None:
+        _session = requests.Session()
+        adapter = HTTPAdapter(pool_connections = pool_size, pool_maxsize = pool_size)
+        _session.mount("https://", adapter)
+        _session.mount("http://", adapter)
+    return _session
+
+def get_web3():
+    """Web3 instance using the shared session, shared by everyone"""
+    global _w3
+    if _w3 is None:
+        provider = RateLimitedHTTPProvider(rpc_endpoint, request_kwargs = {"timeout": REQUEST_TIMEOUT})
+        _w3 = Web3(provider)
+    return _w3
+
+def get_chain_id():
+    """Chain ID of the RPC endpoint, asked only once"""
+    global _chain_id
+    if _chain_id is None:
+        _chain_id = get_web3().eth.chain_id
+    return _chain_id
+
+def get_executor():
+    """Thread pool for requests made in parallel (see `workers`), shared by everyone"""
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers = workers)
+    return _executor
+
+def decode_call_output(w3fun, data):
+    """Decode the return data of a contract call the same way `w3fun.call()` would"""
+    output_types = get_abi_output_types(w3fun.abi)
+    values = get_web3().codec.decode_abi(output_types, Web3.toBytes(hexstr = data) if isinstance(data, str) else data)
+    return values[0] if len(values) == 1 else list(values)
+
+class RpcError(Exception):
+    """Error returned by the node for one request"""
+    pass
+
+class RpcBatch:
+    """Queue JSON-RPC requests and send them together, as a JSON-RPC array batch (one HTTP POST per chunk)"""
+
+    # Max number of requests per POST. Public nodes usually reject very large batches.
+    DEFAULT_BATCH_SIZE = 100
+
+    def __init__(self, batch_size = DEFAULT_BATCH_SIZE):
+        self.batch_size = batch_size
+        self.requests = []
+        self.decoders = []
+
+    def __len__(self):
+        return len(self.requests)
+
+    def add(self, method, params, decoder = None):
+        """Queue a request. Returns its index in the results. 
+           `decoder` is an optional function applied to the raw result."""
+        self.requests.append({"jsonrpc": "2.0", "id": len(self.requests), "method": method, "params": params})
+        self.decoders.append(decoder)
+        return len(self.requests) - 1
+
+    def add_call(self, w3fun, tx_params = None):
+        """Queue an eth_call to a contract function (as built by `contract.functions.fun(args)`)"""
+        call = {"to": w3fun.address, "data": w3fun._encode_transaction_data()}
+        if tx_params:
+            call.update(tx_params)
+        return self.add("eth_call", [call, "latest"], decoder = lambda data: decode_call_output(w3fun, data))
+
+    def flush(self):
+        """Send all queued requests and return their results, in order.
+           Failed requests don't raise: their result is an RpcError instead."""
+        results = []
+        for start in range(0, len(self.requests), self.batch_size):
+            results.extend(self.send(self.requests[start:(start + self.batch_size)]))
+
+        # Decode results
+        for i, decoder in enumerate(self.decoders):
+            if decoder and not isinstance(results[i], RpcError):
+                try:
+                    results[i] = decoder(results[i])
+                except Exception as e:
+                    results[i] = RpcError("Could not decode result: " + str(e))
+        self.requests = []
+        self.decoders = []
+        return results
+
+    def send(self, requests_chunk):
+        """POST a chunk of requests, returns results or RpcError for each request"""
+        rate_limiter.wait()
+        start = time.monotonic()
+        try:
+            res = get_session().post(rpc_endpoint, json = requests_chunk, timeout = REQUEST_TIMEOUT)
+            responses = res.json()
+        except (requests.exceptions.RequestException, ValueError) as e:
+            self.record(requests_chunk, [None] * len(requests_chunk), time.monotonic() - start)
+            return [RpcError(str(e)) for _ in requests_chunk]
+        latency = time.monotonic() - start
+        if not isinstance(responses, list):
+            # Whole batch rejected, e.g. node doesn't support batching
+            self.record(requests_chunk, [None] * len(requests_chunk), latency)
+            return [RpcError(str(responses.get("error", responses))) for _ in requests_chunk]
+
+        responses_by_id = {response.get("id"): response for response in responses}
+        self.record(requests_chunk, [responses_by_id.get(request["id"]) for request in requests_chunk], latency)
+        results = []
+        for request in requests_chunk:
+            response = responses_by_id.get(request["id"])
+            if response is None:
+                results.append(RpcError("No response for " + request["method"]))
+            elif "error" in response:
+                results.append(RpcError(str(response["error"].get("message", response["error"]))))
+            else:
+                results.append(response.get("result"))
+        return results
+
+    @staticmethod
+    def record(requests_chunk, responses, latency):
+        """Record the metrics of each request of a chunk (None for a missing response), all with the latency of the chunk"""
+        metrics = get_metrics()
+        for request, response in zip(requests_chunk, responses):
+            metrics.record_request(request["method"], request["params"], latency, len(json.dumps(request)),
+                                   len(json.dumps(response)) if response is not None else 0,
+                                   error = response is None or "error" in response)
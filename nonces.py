@@ -0,0 +1,137 @@
+from colorama import Fore
+from web3.exceptions import TransactionNotFound
+import time
+
+import cache
+
+class NonceManager:
+    """Hand out nonces for an address, safely across processes.
+
+    Nonces in flight (signed but not mined yet) are tracked in a state file, protected by a file lock,
+    so overlapping runs never reuse a nonce. Nonces of tx that were dropped or abandoned before being broadcast are gaps:
+    they're handed out again first, otherwise every later tx would be stuck behind them."""
+
+    # Check state against the chain at most this often (in seconds)
+    SYNC_INTERVAL = 30
+
+    # A tx unknown to the node this long after being broadcast is considered dropped (in seconds)
+    DROPPED_AFTER = 120
+
+    # A tx known to the node but not mined this long after being broadcast is considered stuck (in seconds)
+    STUCK_AFTER = 600
+
+    # A tx still not broadcast this long after being signed was abandoned (e.g. process killed) (in seconds).
+    # Until then, the run that signed it may still send it (e.g. batch txmode queues tx before broadcasting them).
+    ABANDONED_AFTER = 3600
+
+    def __init__(self, w3, address, chain_id):
+        self.w3 = w3
+        self.address = address
+        # The same address has different nonces on each chain
+        self.path = cache.cache_path("nonces", str(chain_id), address.lower() + ".json")
+        self.lock_path = self.path + ".lock"
+
+    def load_state(self):
+        state = cache.load_json(self.path, default = {})
+        return {
+            "next_nonce": state.get("next_nonce", 0),
+            "synced_at": state.get("synced_at", 0),
+            # nonce (as str, json keys) => {"tx_hash", "signed_at", "broadcast_at"}
+            "in_flight": state.get("in_flight", {}),
+            # nonces to reuse
+            "gaps": state.get("gaps", [])
+        }
+
+    def save_state(self, state):
+        cache.save_json(self.path, state)
+
+    def allocate(self):
+        """Reserve a nonce: the lowest gap if any, otherwise the next nonce"""
+        with cache.FileLock(self.lock_path):
+            state = self.load_state()
+            if time.time() - state["synced_at"] > self.SYNC_INTERVAL:
+                self.sync(state)
+            if state["gaps"]:
+                nonce = min(state["gaps"])
+                state["gaps"].remove(nonce)
+            else:
+                nonce = state["next_nonce"]
+                state["next_nonce"] = nonce + 1
+            state["in_flight"][str(nonce)] = {"tx_hash": None, "signed_at": time.time(), "broadcast_at": None}
+            self.save_state(state)
+        return nonce
+
+    def set_tx_hash(self, nonce, tx_hash):
+        """Remember which tx uses the nonce, to detect dropped tx later"""
+        with cache.FileLock(self.lock_path):
+            state = self.load_state()
+            if str(nonce) in state["in_flight"]:
+                state["in_flight"][str(nonce)]["tx_hash"] = tx_hash
+                self.save_state(state)
+
+    def set_broadcast(self, nonces):
+        """Remember that the tx using these nonces were sent to the node: they can be found dropped from now on"""
+        with cache.FileLock(self.lock_path):
+            state = self.load_state()
+            now = time.time()
+            for nonce in nonces:
+                if str(nonce) in state["in_flight"]:
+                    state["in_flight"][str(nonce)]["broadcast_at"] = now
+            self.save_state(state)
+
+    def take(self, nonce):
+        """Reserve a given gap (e.g. to fill it, see `Signer.sign_gap_filler`). Returns False if it's not a gap anymore."""
+        with cache.FileLock(self.lock_path):
+            state = self.load_state()
+            if nonce not in state["gaps"]:
+                return False
+            state["gaps"].remove(nonce)
+            state["in_flight"][str(nonce)] = {"tx_hash": None, "signed_at": time.time(), "broadcast_at": None}
+            self.save_state(state)
+        return True
+
+    def release(self, nonce):
+        """Give back a nonce whose tx was never broadcast, so it can be reused"""
+        with cache.FileLock(self.lock_path):
+            state = self.load_state()
+            state["in_flight"].pop(str(nonce), None)
+            if nonce < state["next_nonce"] and nonce not in state["gaps"]:
+                state["gaps"].append(nonce)
+            self.save_state(state)
+
+    def sync(self, state):
+        """Update state from the chain: forget mined nonces, find gaps and stuck tx. Call with the lock held."""
+        confirmed_count = self.w3.eth.get_transaction_count(self.address)
+        now = time.time()
+
+        # Mined nonces are done
+        state["in_flight"] = {nonce: tx for nonce, tx in state["in_flight"].items() if int(nonce) >= confirmed_count}
+        state["gaps"] = [nonce for nonce in state["gaps"] if nonce >= confirmed_count]
+        state["next_nonce"] = max(state["next_nonce"], confirmed_count)
+
+        # Dropped tx (or abandoned tx, never broadcast) leave gaps
+        for nonce, tx in list(state["in_flight"].items()):
+            broadcast_at = tx.get("broadcast_at")
+            if broadcast_at is None:
+                # Signed but not sent yet: may still be waiting to be broadcast, don't hand its nonce out again
+                if now - tx["signed_at"] < self.ABANDONED_AFTER:
+                    continue
+            elif now - broadcast_at < self.DROPPED_AFTER:
+                continue
+            if tx["tx_hash"] is None or self.is_dropped(tx["tx_hash"]):
+                del state["in_flight"][nonce]
+            elif broadcast_at is not None and now - broadcast_at > self.STUCK_AFTER and int(nonce) == confirmed_count:
+                print(Fore.YELLOW + f"Tx {tx['tx_hash']} (nonce {nonce}) is stuck: " + \
+                      "later tx won't be mined until it is (maybe the gas price was too low)." + Fore.RESET)
+
+        # Any nonce between the confirmed count and the next nonce that isn't in flight is a gap
+        in_flight = {int(nonce) for nonce in state["in_flight"]}
+        state["gaps"] = sorted(set(range(confirmed_count, state["next_nonce"])) - in_flight)
+        state["synced_at"] = now
+
+    def is_dropped(self, tx_hash):
+        try:
+            self.w3.eth.get_transaction(tx_hash)
+            return False
+        except TransactionNotFound:
+            return True
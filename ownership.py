@@ -0,0 +1,208 @@
+from web3 import Web3
+import requests
+import threading
+
+import cache
+import network
+
+# Where ownership comes from: "ftmscan" (transfer history from FTMScan API) or "logs" (Transfer events from the RPC)
+SOURCES = ["ftmscan", "logs"]
+DEFAULT_SOURCE = "ftmscan"
+
+# Rarity contracts were deployed after this block on Fantom Opera: no need to scan logs before that
+DEFAULT_FIRST_BLOCK = 15000000
+
+source = DEFAULT_SOURCE
+first_block = DEFAULT_FIRST_BLOCK
+
+# Force a full rescan of the transfer history, ignoring the local index
+rescan = False
+
+class OwnershipError(Exception):
+    """Transfers of a contract could not be listed"""
+    pass
+
+def configure(full_rescan = False, ownership_source = None, scan_from_block = None):
+    global rescan, source, first_block
+    rescan = full_rescan
+    if ownership_source:
+        if ownership_source not in SOURCES:
+            raise ValueError("Invalid ownership source: " + str(ownership_source))
+        source = ownership_source
+    if scan_from_block is not None:
+        first_block = scan_from_block
+
+class OwnershipIndex:
+    """Tokens owned by an address on an ERC721 contract, kept on disk between runs.
+       The index remembers the last block scanned, so only newer transfers need to be fetched."""
+
+    def __init__(self, owner_address, contract_address):
+        self.owner_address = owner_address.lower()
+        self.contract_address = contract_address.lower()
+        self.path = cache.cache_path("ownership", self.owner_address + "_" + self.contract_address + ".json")
+        self.load()
+
+    def load(self):
+        data = {} if rescan else cache.load_json(self.path, default = {})
+        self.last_block = data.get("last_block", -1)
+        # Count of tokens received minus tokens sent, by token id.
+        # Tokens we still own have a count of 1 (we could have sent them and gotten them back).
+        self.token_counts = {int(token_id): count for token_id, count in data.get("token_counts", {}).items()}
+
+    def save(self):
+        cache.save_json(self.path, {"last_block": self.last_block, "token_counts": self.token_counts})
+
+    def apply_transfer(self, from_address, to_address, token_id):
+        """Apply an ERC721 transfer (in chronological order)"""
+        if to_address.lower() == self.owner_address:
+            self.token_counts[token_id] = self.token_counts.get(token_id, 0) + 1
+        if from_address.lower() == self.owner_address:
+            self.token_counts[token_id] = self.token_counts.get(token_id, 0) - 1
+
+    def get_token_ids(self):
+        return [token for token in self.token_counts if self.token_counts[token] > 0]
+
+    def update(self):
+        """Bring the index up to date using the configured source"""
+        if source == "logs":
+            self.update_from_logs()
+        else:
+            self.update_from_ftmscan()
+
+    def update_from_ftmscan(self):
+        """Fetch and apply transfers since the last block scanned"""
+        transfers = iter_ftmscan_transfers(self.owner_address, self.contract_address, start_block = self.last_block + 1)
+        for transfer in transfers:
+            self.apply_transfer(transfer["from"], transfer["to"], int(transfer["tokenID"]))
+            self.last_block = max(self.last_block, int(transfer["blockNumber"]))
+        self.save()
+
+    def update_from_logs(self):
+        """Fetch and apply Transfer events since the last block scanned, straight from the RPC"""
+        w3 = network.get_web3()
+        latest_block = w3.eth.block_number
+        from_block = max(self.last_block + 1, first_block)
+        if from_block > latest_block:
+            return
+
+        scanner = LogScanner(w3)
+        owner_topic = LogScanner.address_topic(self.owner_address)
+        transfer_topic = LogScanner.TRANSFER_TOPIC
+        contract_checksum = Web3.toChecksumAddress(self.contract_address)
+        logs = scanner.get_logs(contract_checksum, [transfer_topic, owner_topic], from_block, latest_block) + \
+               scanner.get_logs(contract_checksum, [transfer_topic, None, owner_topic], from_block, latest_block)
+
+        # Transfers to self show up in both lists
+        unique_logs = {(Web3.toHex(log["transactionHash"]), log["logIndex"]): log for log in logs}
+        for log in sorted(unique_logs.values(), key = lambda log: (log["blockNumber"], log["logIndex"])):
+            from_address, to_address, token_id = LogScanner.decode_transfer(log)
+            self.apply_transfer(from_address, to_address, token_id)
+        self.last_block = latest_block
+        self.save()
+
+class LogScanner:
+    """Get event logs over large block ranges with eth_getLogs.
+       The range is split in chunks fetched in parallel by the shared executor. 
+       Chunks rejected by the node (range too large, too many results) are split in half and tried again."""
+
+    TRANSFER_TOPIC = Web3.keccak(text = "Transfer(address,address,uint256)").hex()
+
+    DEFAULT_CHUNK_SIZE = 10000
+    MIN_CHUNK_SIZE = 8
+
+    def __init__(self, w3, chunk_size = DEFAULT_CHUNK_SIZE):
+        self.w3 = w3
+        self.chunk_size = chunk_size
+        # Chunks are fetched by the shared executor (see `network.get_executor`) and may shrink the chunk size
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def address_topic(address):
+        """Indexed address, as found in log topics"""
+        return "0x" + "0" * 24 + address.lower()[2:]
+
+    @staticmethod
+    def decode_transfer(log):
+        """Returns (from, to, token_id) from an ERC721 Transfer log"""
+        topics = [Web3.toHex(topic) for topic in log["topics"]]
+        from_address = "0x" + topics[1][-40:]
+        to_address = "0x" + topics[2][-40:]
+        # tokenId is indexed in standard ERC721 but some contracts put it in data
+        token_id = int(topics[3], 16) if len(topics) > 3 else int(Web3.toHex(log["data"]), 16)
+        return from_address, to_address, token_id
+
+    def get_logs(self, address, topics, from_block, to_block):
+        """All logs of `address` matching `topics` between from_block and to_block (included), in chain order"""
+        block_ranges = [(start, min(start + self.chunk_size - 1, to_block)) 
+                        for start in range(from_block, to_block + 1, self.chunk_size)]
+        chunks = network.get_executor().map(lambda block_range: self.get_logs_range(address, topics, *block_range), block_ranges)
+        logs = [log for chunk in chunks for log in chunk]
+        return sorted(logs, key = lambda log: (log["blockNumber"], log["logIndex"]))
+
+    def get_logs_range(self, address, topics, from_block, to_block):
+        try:
+            return self.w3.eth.get_logs({"address": address, "topics": topics, 
+                                         "fromBlock": from_block, "toBlock": to_block})
+        except (ValueError, requests.exceptions.RequestException) as e:
+            size = to_block - from_block + 1
+            if size <= self.MIN_CHUNK_SIZE:
+                raise OwnershipError(f"Could not get logs for blocks {from_block}-{to_block}: {e}")
+            # Next scans will use smaller chunks too (chunks of this one are already split)
+            with self.lock:
+                self.chunk_size = min(self.chunk_size, size // 2)
+            middle = from_block + size // 2
+            return self.get_logs_range(address, topics, from_block, middle - 1) + \
+                   self.get_logs_range(address, topics, middle, to_block)
+
+# FTMScan returns at most 10000 results per query (page x offset), so we page through them by block
+FTMSCAN_PAGE_SIZE = 1000
+FTMSCAN_MAX_RESULTS = 10000
+
+def iter_ftmscan_transfers(owner_address, contract_address, start_block = 0):
+    """Iterate over ERC721 transfers of contract_address from/to owner_address since start_block, 
+       in chronological order, using FTMScan API. Only one page is held in memory at a time."""
+    page = 1
+    # Transfers already returned in the last block seen, in case we restart the query from that block
+    last_block = start_block - 1
+    last_block_keys = set()
+    while True:
+        transfers = fetch_ftmscan_transfers_page(owner_address, contract_address, start_block, page)
+        for transfer in transfers:
+            block = int(transfer["blockNumber"])
+            key = (transfer["hash"], transfer["tokenID"], transfer["from"], transfer["to"])
+            if block == last_block and key in last_block_keys:
+                continue
+            if block != last_block:
+                last_block = block
+                last_block_keys = set()
+            last_block_keys.add(key)
+            yield transfer
+
+        if len(transfers) < FTMSCAN_PAGE_SIZE:
+            return
+        if (page + 1) * FTMSCAN_PAGE_SIZE > FTMSCAN_MAX_RESULTS:
+            # Can't page further: query again from the last block seen
+            if last_block == start_block:
+                raise OwnershipError("Too many transfers in block " + str(last_block) + " to list them with FTMScan")
+            start_block = last_block
+            page = 1
+        else:
+            page += 1
+
+def fetch_ftmscan_transfers_page(owner_address, contract_address, start_block, page):
+    """One page of ERC721 transfers of contract_address from/to owner_address since start_block, using FTMScan API"""
+    erc721transfers_url = network.explorer_api + "?module=account&action=tokennfttx&address=" + \
+        owner_address + "&contractaddress=" + contract_address + "&startblock=" + str(start_block) + \
+        "&endblock=999999999&sort=asc&page=" + str(page) + "&offset=" + str(FTMSCAN_PAGE_SIZE)
+
+    try:
+        res = network.get_session().get(erc721transfers_url, timeout = network.REQUEST_TIMEOUT)
+        res_json = res.json()
+        transfers = res_json["result"]
+    except requests.exceptions.RequestException as e:
+        raise OwnershipError("Could not list transfers from FTMScan: " + str(e)) from e
+
+    # On error, the result is a message: we must not update the index
+    if not isinstance(transfers, list):
+        raise OwnershipError("Could not list transfers from FTMScan: " + str(transfers))
+    return transfers
@@ -1,5 +1,6 @@
 from skills import InvalidSkillError
 from items import InvalidItemError
+from crafting import CraftingError
 from colorama import Fore
 import os.path
 import argparse
@@ -7,7 +8,10 @@ import argparse
 # Local modules
 import key
 import commands
+from metrics import get_metrics
 import cliparser
+import network
+import ownership
 from transacter import Signer, Transacter
 from summoner import InvalidAddressError, InvalidAmountError, InvalidSummonerError
 
@@ -71,76 +75,107 @@ if (__name__ == "__main__"):
         except key.InvalidInputError as e:
             print(Fore.RED + str(e) + Fore.RESET)
         exit()
-           
+
+    # All engines share the same connection pool
+    network.configure(endpoint = args.rpc, pool = args.pool_size, max_workers = args.workers, max_rps = args.max_rps,
+                      explorer = args.explorer_api)
+
+    # Refreshing ABIs doesn't need a transacter (which would load ABIs)
+    if args.command == "refresh-abis":
+        commands.command_refresh_abis(args)
+        exit()
+    ownership.configure(full_rescan = args.rescan, ownership_source = args.ownership_source, 
+                        scan_from_block = args.scan_from_block)
+
+    # Codex data doesn't need a transacter either
+    if args.command == "refresh-codex":
+        commands.command_refresh_codex(args)
+        exit()
+
     # Create transacter (to handle calls to the blackchain) and signer (to sign tx)
-    transacter = Transacter(txmode = args.txmode)
+    transacter = Transacter(txmode = args.txmode, gas_price_ttl = args.gas_price_ttl)
 
     # Check gas price
     gas_price_gwei = transacter.get_gas_price() * 1e9
     print("Gas price: " + str(round(gas_price_gwei, 1)) + " gwei")
-    if gas_price_gwei > args.maxgasprice:
+    # The daemon checks the gas price each time it wakes up instead
+    if gas_price_gwei > args.maxgasprice and args.command != "daemon":
         print(Fore.RED + "Gas price too high (>" + \
             str(round(args.maxgasprice, 1)) + "). Aborting." + Fore.RESET)
         exit()
 
     # Running the main command
 
-    ### LIST THINGS -----------
-    if args.command in ["show", "list"]:
-        commands.command_show(args, transacter)
-
-    ### SUMMON NEW SUMMONERS -----
-    elif args.command == "summon":
-        commands.command_summon(args, transacter)
-
-    # RUN ACTIONS ---------------
-    elif args.command == "run":
-        commands.command_run(args, transacter)
-
-    # TRANSFER ------------------
-    elif args.command in ["transfer", "transfer-all"]:
-        try:
-            commands.command_transfer(args, transacter, transfer_all = args.command == "transfer-all")
-        except (InvalidAmountError, InvalidSummonerError) as e:
-            print(Fore.RED + str(e))
-
-    # SEND-SUMMONER --------------
-    elif args.command == "send-summoner":
-        try:
-            commands.command_send_summoner(args, transacter)
-        except (InvalidAddressError, InvalidSummonerError) as e:
-            print(Fore.RED + str(e))
-
-    # CRAFT --------------
-    elif args.command == "craft":
-        try:
-            commands.command_craft(args, transacter)
-        except (InvalidItemError, InvalidAddressError, InvalidSummonerError) as e:
-            print(Fore.RED + str(e))
-
-    # SET-ATTRIBUTES --------------
-    elif args.command == "set-attributes":
-        try:
-            commands.command_set_attributes(args, transacter)
-        except (key.InvalidInputError, InvalidSummonerError, PermissionError) as e:
-            print(Fore.RED + str(e))
-
-    # SET-SKILL --------------
-    elif args.command == "set-skill":
-        try:
-            commands.command_set_skill(args, transacter)
-        except (InvalidSkillError, InvalidSummonerError) as e:
-            print(Fore.RED + str(e))
-
-    # SETUP-CRAFTING --------------
-    elif args.command == "setup-crafting":
-        commands.command_setup_crafting(args, transacter)
+    try:
+        ### LIST THINGS -----------
+        if args.command in ["show", "list"]:
+            commands.command_show(args, transacter)
+
+        ### SUMMON NEW SUMMONERS -----
+        elif args.command == "summon":
+            commands.command_summon(args, transacter)
+
+        # RUN ACTIONS ---------------
+        elif args.command == "run":
+            commands.command_run(args, transacter)
+
+        # DAEMON --------------------
+        elif args.command == "daemon":
+            commands.command_daemon(args, transacter)
+
+        # TRANSFER ------------------
+        elif args.command in ["transfer", "transfer-all"]:
+            try:
+                commands.command_transfer(args, transacter, transfer_all = args.command == "transfer-all")
+            except (InvalidAmountError, InvalidSummonerError) as e:
+                print(Fore.RED + str(e))
+
+        # SEND-SUMMONER --------------
+        elif args.command == "send-summoner":
+            try:
+                commands.command_send_summoner(args, transacter)
+            except (InvalidAddressError, InvalidSummonerError) as e:
+                print(Fore.RED + str(e))
+
+        # CRAFT --------------
+        elif args.command == "craft":
+            try:
+                commands.command_craft(args, transacter)
+            except (InvalidItemError, InvalidAddressError, InvalidSummonerError, CraftingError) as e:
+                print(Fore.RED + str(e))
+
+        # SET-ATTRIBUTES --------------
+        elif args.command == "set-attributes":
+            try:
+                commands.command_set_attributes(args, transacter)
+            except (key.InvalidInputError, InvalidSummonerError, PermissionError) as e:
+                print(Fore.RED + str(e))
+
+        # SET-SKILL --------------
+        elif args.command == "set-skill":
+            try:
+                commands.command_set_skill(args, transacter)
+            except (InvalidSkillError, InvalidSummonerError) as e:
+                print(Fore.RED + str(e))
+
+        # SETUP-CRAFTING --------------
+        elif args.command == "setup-crafting":
+            commands.command_setup_crafting(args, transacter)
         
-    else:
-        print(Fore.RED + "Unrecognised command")    
+        else:
+            print(Fore.RED + "Unrecognised command")    
+    # Transfers could not be listed (explorer or log errors): nothing can be done without the summoners
+    except ownership.OwnershipError as e:
+        exit(Fore.RED + str(e) + Fore.RESET)
         
     # Wait for all tx to complete (just in case!)
     transacter.wait_for_pending_transations()
     print("\n" + Fore.RED + "Total session cost: " + str(round(transacter.session_cost, 6)) + " FTM" + Fore.RESET)
+
+    # Where the RPC requests of the session went
+    metrics = get_metrics()
+    metrics.print_summary()
+    if args.metrics_file:
+        metrics.save(args.metrics_file, command = args.command, session_cost = transacter.session_cost)
     
 
@@ -0,0 +1,166 @@
+from colorama import Fore
+import time
+
+from list_summoners import execute_reads
+from transacter import ReceiptCollector
+
+class ActionScheduler:
+    """Run daily actions for many summoners, pipelined.
+
+    Each action only waits for the actions it depends on *for the same summoner*: a summoner levels up
+    as soon as its own adventure tx is mined, without waiting for the adventures of the rest of the fleet.
+    Gold claims wait for the other actions ready at the same time, so their claimable amounts are read together.
+    In single txmode, this runs the actions of a summoner before moving to the next one, then all gold claims.
+    A summoner whose action raises an error is skipped, the others carry on.
+    Summoner data may come from the local store or the snapshot it was loaded from: before anything is signed,
+    the fields checked by the actions this data says can run are read again in one go, so no tx is sent on stale data."""
+
+    # Summoner method for each action, in the order they are tried
+    ACTIONS = {
+        "adventure": "adventure",
+        "level_up": "level_up",
+        "claim_gold": "claim_gold",
+        "cellar": "go_cellar"
+    }
+
+    # level_up needs the XP of the adventure, claim_gold and cellar loot depend on the level
+    DEPENDENCIES = {
+        "adventure": [],
+        "level_up": ["adventure"],
+        "claim_gold": ["level_up"],
+        "cellar": ["level_up"]
+    }
+
+    # Summoner method checking whether each action can run, and the fields of `Summoner.BATCH_READS` it uses
+    # (claim_gold reads its claimable amount itself)
+    CHECKS = {
+        "adventure": ("check_adventure", ["adventurers_log"]),
+        "level_up": ("fast_check_level_up", ["summoner"]),
+        "cellar": ("check_go_cellar", ["cellar_log", "cellar_loot"])
+    }
+
+    def __init__(self, transacter, actions, wait_timeout = 360):
+        self.transacter = transacter
+        self.actions = [action for action in self.ACTIONS if action in actions]
+        self.dependencies = {action: self.get_dependencies(action) for action in self.actions}
+        self.wait_timeout = wait_timeout
+
+    def get_dependencies(self, action):
+        """Selected actions that `action` depends on, directly or through actions that aren't selected"""
+        dependencies = set()
+        for dependency in self.DEPENDENCIES[action]:
+            if dependency in self.actions:
+                dependencies.add(dependency)
+            else:
+                dependencies |= self.get_dependencies(dependency)
+        return dependencies
+
+    def run(self, summoners):
+        """Run all actions for all summoners. Returns the number of tx sent."""
+        if not self.actions:
+            return 0
+        start_time = time.time()
+        self.refresh(summoners)
+        done = [set() for _ in summoners]
+        started = [set() for _ in summoners]
+        waiting = {} # tx_hash => (summoner index, action)
+        collector = ReceiptCollector(self.transacter)
+        tx_count = 0
+        last_receipt_time = time.time()
+
+        while True:
+            # Start every action whose dependencies are done
+            new_txs = {}
+            for i, summoner in enumerate(summoners):
+                while True:
+                    ready_actions = [action for action in self.get_ready_actions(done[i], started[i]) 
+                                     if action != "claim_gold"]
+                    if not ready_actions:
+                        break
+                    for action in ready_actions:
+                        self.start_action(summoners, i, action, done, started, new_txs)
+
+            # Gold claims last, reading all claimable amounts in one request
+            claiming = [i for i in range(len(summoners)) if "claim_gold" in self.get_ready_actions(done[i], started[i])]
+            if claiming:
+                claimables = self.transacter.batch_call([summoners[i].claimable_gold_call() for i in claiming])
+                for i, claimable_gold in zip(claiming, claimables):
+                    self.start_action(summoners, i, "claim_gold", done, started, new_txs, claimable_gold = claimable_gold)
+
+            # Broadcast new tx. Those rejected by the node won't be mined: consider them done.
+            sent = {tx["tx_hash"]: tx for tx in self.transacter.take_pending_transactions()}
+            for tx_hash, (i, action) in new_txs.items():
+                if tx_hash in sent:
+                    collector.add(tx_hash, sent[tx_hash]["gas_price"])
+                    waiting[tx_hash] = (i, action)
+                else:
+                    done[i].add(action)
+            tx_count += len(sent)
+
+            if not waiting:
+                if all(started[i] == set(self.actions) for i in range(len(summoners))):
+                    break
+                continue
+
+            # Wait for receipts, then unlock the next actions of their summoners
+            arrived = collector.poll()
+            for tx_hash, _ in arrived:
+                i, action = waiting.pop(tx_hash)
+                done[i].add(action)
+            if arrived:
+                last_receipt_time = time.time()
+            elif time.time() - last_receipt_time > self.wait_timeout:
+                print(Fore.RED + "Tx taking too long, gave up waiting for " + str(len(waiting)) + " receipts" + Fore.RESET)
+                for i, action in waiting.values():
+                    done[i].add(action)
+                waiting = {}
+                collector = ReceiptCollector(self.transacter)
+            else:
+                time.sleep(ReceiptCollector.POLL_INTERVAL)
+
+        print(f"Ran {', '.join(self.actions)} for {len(summoners)} summoners " + \
+              f"({tx_count} tx) in {round(time.time() - start_time, 1)}s")
+        return tx_count
+
+    def refresh(self, summoners):
+        """Read again, in a few aggregated calls, the fields checked by the actions that pre-fetched data says can run.
+           Other actions are left alone: stale data saying an action can't run yet only delays it,
+           while stale data saying it can would send a tx that reverts."""
+        reads = [] # (summoner, field)
+        for summoner in summoners:
+            if summoner.details_data is None:
+                continue
+            fields = {field for action, (check, check_fields) in self.CHECKS.items()
+                      if action in self.actions and getattr(summoner, check)() for field in check_fields}
+            if fields:
+                # Snapshot data is read-only: update a copy
+                summoner.details_data = dict(summoner.details_data)
+                reads.extend((summoner, field) for field in sorted(fields))
+        values = execute_reads([summoner.batch_read(field, summoner.token_id, summoner.contracts) for summoner, field in reads],
+                               self.transacter)
+        for (summoner, field), value in zip(reads, values):
+            if value is None:
+                # Read it again from the chain when the action checks it
+                summoner.details_data.pop(field, None)
+                continue
+            summoner.details_data[field] = value
+            if field == "summoner":
+                summoner.set_summoner_info(value)
+
+    def start_action(self, summoners, i, action, done, started, new_txs, **kwargs):
+        """Start an action of summoner `i`, adding its tx to `new_txs` if pending. On error, skip the summoner."""
+        started[i].add(action)
+        try:
+            tx_status = getattr(summoners[i], self.ACTIONS[action])(**kwargs)
+        except Exception as e:
+            print(Fore.RED + str(summoners[i]) + ": " + action + " failed: " + str(e) + ". Skipping this summoner." + Fore.RESET)
+            started[i].update(self.actions)
+            done[i].update(self.actions)
+            return
+        if tx_status and tx_status["status"] == "pending":
+            new_txs[tx_status["hash"]] = (i, action)
+        else:
+            done[i].add(action)
+
+    def get_ready_actions(self, done, started):
+        return [action for action in self.actions if action not in started and self.dependencies[action] <= done]
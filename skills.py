@@ -3,7 +3,9 @@ from colorama.ansi import Fore
 from tabulate import tabulate
 from web3.main import Web3
 
+from codex import CodexSnapshot
 from transacter import Transacter
+import network
 
 class InvalidSkillError(Exception):
     pass
@@ -23,9 +25,24 @@ class SkillCodex:
     contract_checksums = {k: Web3.toChecksumAddress(v) for k, v in contract_addresses.items()}
 
     def __init__(self):
-        self.w3 = Web3(Web3.HTTPProvider('https://rpc.ftm.tools/'))
-        self.contracts = {cname: Transacter.rate_limit(self.get_codex_contract(cname)) for cname in self.contract_addresses.keys()}
-        self.class_skills = {class_id: self.get_class_skills(class_id) for class_id in range(1,12)}
+        self.w3 = network.get_web3()
+        self._contracts = None
+        self._class_skills = None
+        # Codex data never changes: read each skill only once
+        self.skill_data = {}
+
+    @property
+    def contracts(self):
+        """Contracts are only needed when the data isn't in the codex snapshot"""
+        if self._contracts is None:
+            self._contracts = {cname: self.get_codex_contract(cname) for cname in self.contract_addresses.keys()}
+        return self._contracts
+
+    @property
+    def class_skills(self):
+        if self._class_skills is None:
+            self._class_skills = {class_id: self.get_class_skills(class_id) for class_id in range(1,12)}
+        return self._class_skills
 
     def get_codex_contract(self, codex_name):
         '''Get contract or raise a KeyError if contract isn't listed'''
@@ -33,7 +50,10 @@ class SkillCodex:
                             abi = Transacter.get_abi(self.contract_addresses[codex_name]))
 
     def get_class_skills(self, class_id):
-        return self.contracts["skills"].functions.class_skills_by_name(class_id).call()
+        class_skills = CodexSnapshot.get_class_skills(class_id)
+        if class_skills is None:
+            class_skills = self.contracts["skills"].functions.class_skills_by_name(class_id).call()
+        return class_skills
 
     def get_classes(self, skill_name):
         class_ids = [class_id for class_id in self.class_skills if skill_name in self.class_skills[class_id]]
@@ -42,8 +62,12 @@ class SkillCodex:
     def get_skill_data(self, id):
         if id > self.codex_sizes["skill_codex"]:
             raise InvalidSkillError("Invalid skill id")
-        item_data = self.contracts["skill_codex"].functions.skill_by_id(id).call()
-        return item_data
+        if id not in self.skill_data:
+            item_data = CodexSnapshot.get_skill_data(id)
+            if item_data is None:
+                item_data = self.contracts["skill_codex"].functions.skill_by_id(id).call()
+            self.skill_data[id] = item_data
+        return self.skill_data[id]
 
     def get_skills(self):
         num_skills = self.codex_sizes["skill_codex"]
@@ -65,6 +89,15 @@ class SkillCodex:
             raise InvalidSkillError("Not a valid skill")
         return skill_id
 
+_skill_codex = None
+
+def get_skill_codex():
+    """Skill codex shared by the whole session (codex data never changes)"""
+    global _skill_codex
+    if _skill_codex is None:
+        _skill_codex = SkillCodex()
+    return _skill_codex
+
 class Skill:
 
     def __init__(self, id, codex):
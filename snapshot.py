@@ -0,0 +1,70 @@
+from colorama import Fore
+from types import MappingProxyType
+
+from summoner import InvalidSummonerError, Summoner
+
+class FleetSnapshot:
+    """Data of many summoners (see `Summoner.batch_reads`), see `list_summoners.load_snapshot`.
+
+    Fields read from the chain are all read at `block`. Fields reused from the store (see `FleetStore`) keep
+    the block they were read at (`get_block`): they still hold at `block` when their staleness policy says so
+    (attributes, cooldowns not expired), others may be up to `max_staleness` old. So the whole snapshot is only
+    pinned to `block` when loaded with `max_staleness = 0`.
+
+    A snapshot can't be changed. Summoners built from it read their data (balances, cooldowns, approvals, etc) 
+    from it instead of calling the contracts, until they send a tx: their data is then read from the chain again."""
+
+    __slots__ = ("block", "timestamp", "_data", "_blocks")
+
+    def __init__(self, block, data, timestamp = None, blocks = None):
+        """`data` is {token_id: {field: value}}. `block` is None if no field was read from the chain.
+           `blocks` ({token_id: {field: block}}) gives the block of fields not read at `block`."""
+        object.__setattr__(self, "block", block)
+        object.__setattr__(self, "timestamp", timestamp)
+        object.__setattr__(self, "_data", MappingProxyType({int(id): self.freeze(values) for id, values in data.items()}))
+        object.__setattr__(self, "_blocks", self.freeze({int(id): fields for id, fields in (blocks or {}).items()}))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("FleetSnapshot is immutable")
+
+    def __delattr__(self, name):
+        raise AttributeError("FleetSnapshot is immutable")
+
+    @staticmethod
+    def freeze(value):
+        """Read-only copy of decoded values: dicts become read-only mappings and lists become tuples"""
+        if isinstance(value, dict):
+            return MappingProxyType({k: FleetSnapshot.freeze(v) for k, v in value.items()})
+        if isinstance(value, (list, tuple)):
+            return tuple(FleetSnapshot.freeze(v) for v in value)
+        return value
+
+    def __contains__(self, token_id):
+        return token_id in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    @property
+    def token_ids(self):
+        return list(self._data)
+
+    def get(self, token_id):
+        """Data of a summoner (read-only), or None if it isn't in the snapshot"""
+        return self._data.get(token_id)
+
+    def get_block(self, token_id, field):
+        """Block a field of a summoner was read at"""
+        return self._blocks.get(token_id, {}).get(field, self.block)
+
+    def get_summoners(self, transacter, signer = None, token_ids = None):
+        """Summoners built from the snapshot. Optionally only those in `token_ids`.
+           Summoners that couldn't be read (e.g. burned) are skipped with a warning."""
+        token_ids = self.token_ids if token_ids is None else [id for id in token_ids if id in self]
+        summoners = []
+        for id in token_ids:
+            try:
+                summoners.append(Summoner(id, transacter, signer = signer, data = self._data[id]))
+            except InvalidSummonerError as e:
+                print(Fore.YELLOW + str(e) + " Skipping it." + Fore.RESET)
+        return summoners
@@ -0,0 +1,95 @@
+import json
+import sqlite3
+import threading
+import time
+
+import cache
+import network
+
+class FleetStore:
+    """Last known data of summoners (see `Summoner.batch_reads`), kept in a SQLite database between runs.
+
+    Each field is stored with the time and the block it was read at. Whether a field must be read again depends
+    on its staleness policy, and on how old the calling command accepts data to be (`max_staleness`, in seconds)."""
+
+    # Doesn't change once set (attributes): never read again
+    STATIC = "static"
+    # A cooldown timestamp: can't change before it expires, then behaves like TTL
+    UNTIL_EXPIRY = "until_expiry"
+    # Can change anytime: read again when older than max_staleness
+    TTL = "ttl"
+
+    POLICIES = {
+        "attributes": STATIC,
+        "adventurers_log": UNTIL_EXPIRY,
+        "cellar_log": UNTIL_EXPIRY
+    }
+    DEFAULT_POLICY = TTL
+
+    # Max number of ids per query (SQLite limits the number of parameters)
+    QUERY_CHUNK_SIZE = 500
+
+    def __init__(self, chain_id, path = None):
+        # Token ids mean different summoners on each chain
+        self.path = path or cache.cache_path("fleet", str(chain_id) + ".sqlite")
+        # Wait for other processes (e.g. overlapping cron jobs) rather than failing
+        self.connection = sqlite3.connect(self.path, timeout = 30, check_same_thread = False)
+        self.lock = threading.Lock()
+        with self.lock, self.connection:
+            self.connection.execute("""CREATE TABLE IF NOT EXISTS summoner_fields (
+                token_id INTEGER, field TEXT, value TEXT, block INTEGER, read_at REAL,
+                PRIMARY KEY (token_id, field))""")
+
+    def load(self, token_ids):
+        """Stored fields of the given summoners, as {token_id: {field: {"value", "block", "read_at"}}}"""
+        entries = {token_id: {} for token_id in token_ids}
+        with self.lock:
+            for start in range(0, len(token_ids), self.QUERY_CHUNK_SIZE):
+                chunk = token_ids[start:(start + self.QUERY_CHUNK_SIZE)]
+                rows = self.connection.execute("SELECT token_id, field, value, block, read_at FROM summoner_fields " + \
+                    "WHERE token_id IN (" + ",".join("?" * len(chunk)) + ")", chunk).fetchall()
+                for token_id, field, value, block, read_at in rows:
+                    entries[token_id][field] = {"value": json.loads(value), "block": block, "read_at": read_at}
+        return entries
+
+    def save(self, values_by_token, block):
+        """Store fields read at `block` ({token_id: {field: value}}). Failed reads (None) aren't stored."""
+        read_at = time.time()
+        rows = [(token_id, field, json.dumps(value), block, read_at)
+                for token_id, values in values_by_token.items() for field, value in values.items() if value is not None]
+        with self.lock, self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO summoner_fields VALUES (?, ?, ?, ?, ?)", rows)
+
+    def invalidate(self, token_ids, fields = None):
+        """Forget fields (default: all) of the given summoners, e.g. after sending a tx that changes them"""
+        with self.lock, self.connection:
+            for token_id in token_ids:
+                if fields is None:
+                    self.connection.execute("DELETE FROM summoner_fields WHERE token_id = ?", (token_id,))
+                else:
+                    self.connection.executemany("DELETE FROM summoner_fields WHERE token_id = ? AND field = ?",
+                                                [(token_id, field) for field in fields])
+
+    def is_fresh(self, field, entry, max_staleness, chain_time):
+        """Whether a stored field can be used as is"""
+        policy = self.POLICIES.get(field, self.DEFAULT_POLICY)
+        # Attributes that aren't set yet can be set anytime
+        if policy == self.STATIC and any(entry["value"]):
+            return True
+        if policy == self.UNTIL_EXPIRY and entry["value"] > chain_time:
+            return True
+        return time.time() - entry["read_at"] <= max_staleness
+
+    def stale_fields(self, entries, fields, max_staleness, chain_time):
+        """Fields (among `fields`) that must be read again, given stored entries of a summoner (see `load`)"""
+        return [field for field in fields
+                if field not in entries or not self.is_fresh(field, entries[field], max_staleness, chain_time)]
+
+_store = None
+
+def get_store():
+    """Store shared by all loaders"""
+    global _store
+    if _store is None:
+        _store = FleetStore(network.get_chain_id())
+    return _store
@@ -1,9 +1,11 @@
 from crafting import CraftingEngine
 from summoning import SummoningEngine
 from raritydata import RarityData
-from skills import InvalidSkillError, SkillCodex
+from skills import InvalidSkillError, get_skill_codex
+from store import get_store
 from colorama import Fore
 from web3 import Web3
+from web3.exceptions import ContractLogicError
 from tabulate import tabulate
 
 class InvalidSummonerError(Exception):
@@ -24,18 +26,27 @@ class Summoner:
     # Minimum expected loot (>=) to enable a trip to the cellar
     MIN_CELLAR_LOOT = 5
 
-    def __init__(self, id, transacter, signer = None):
+    # Fields of summoner data: those read by `batch_reads`, plus `approved_for_all` (read separately)
+    DATA_FIELDS = ["owner", "summoner", "gold", "attributes", "adventurers_log", "cellar_log", "cellar_loot", 
+                   "craft1", "skills", "approved", "gold_allowance", "craft_mats_allowance", "approved_for_all"]
+
+    def __init__(self, id, transacter, signer = None, data = None):
+        """Create a summoner. If `data` is given (see `Summoner.batch_reads`), use it instead of fetching each field."""
         try:
             self.token_id = int(id)
         except ValueError:
             raise InvalidSummonerError("Invalid Summoner ID (must be castable to int)")
         self.transacter = transacter
         self.contracts = transacter.contracts
-        self.owner = self.get_owner()
+        self.details_data = None
+        if data:
+            self.load_data(data)
+        else:
+            self.owner = self.get_owner()
+            self.update_summoner_info()
+            self.update_gold_balance()
+            self.update_attributes()
         self.set_signer(signer)
-        self.update_summoner_info()
-        self.update_gold_balance()
-        self.update_attributes()
 
     def __str__(self):
         return "A " + self.class_name + " (" + str(self.token_id) + ")"
@@ -48,23 +59,95 @@ class Summoner:
     def sign_and_execute(self, w3fun, gas):
         if not self.signer:
             raise PermissionError("Trying to sign without a signer: this should not happen.")
+        # Stored data of the summoner is about to change, and so is its snapshot data: read it from the chain from now on
+        get_store().invalidate([self.token_id])
+        self.details_data = None
         return self.transacter.sign_and_execute(w3fun, gas, signer = self.signer)
 
+    @staticmethod
+    def batch_reads(token_id, contracts):
+        """All the contract reads needed to build a summoner and its details, as a dict of name => w3fun.
+           Meant to be aggregated for many summoners at once (see `list_summoners.load_summoners`).
+           `approved_for_all` depends on the owner so it is read separately."""
+        return {field: Summoner.batch_read(field, token_id, contracts) for field in Summoner.BATCH_READS}
+
+    # Contract read of each field of `batch_reads`: (contract, function, arguments after the token ID)
+    BATCH_READS = {
+        "owner": ("summoner", "ownerOf", ()),
+        "summoner": ("summoner", "summoner", ()),
+        "gold": ("gold", "balanceOf", ()),
+        "attributes": ("attributes", "ability_scores", ()),
+        "adventurers_log": ("summoner", "adventurers_log", ()),
+        "cellar_log": ("craft1", "adventurers_log", ()),
+        "cellar_loot": ("craft1", "scout", ()),
+        "craft1": ("craft1", "balanceOf", ()),
+        "skills": ("skills", "get_skills", ()),
+        "approved": ("summoner", "getApproved", ()),
+        "gold_allowance": ("gold", "allowance", (CraftingEngine.crafting_spender,)),
+        "craft_mats_allowance": ("craft1", "allowance", (CraftingEngine.crafting_spender,))
+    }
+
+    @staticmethod
+    def batch_read(field, token_id, contracts):
+        """The contract read (w3fun) of one field of `batch_reads`"""
+        contract_name, function_name, args = Summoner.BATCH_READS[field]
+        return getattr(contracts[contract_name].functions, function_name)(token_id, *args)
+
+    def load_data(self, data):
+        """Set summoner fields from pre-fetched data (see `Summoner.batch_reads`)"""
+        if data.get("owner") is None or data.get("summoner") is None:
+            raise InvalidSummonerError(f"Summoner {self.token_id}: could not fetch summoner data. Does it exist?")
+        self.owner = Web3.toChecksumAddress(data["owner"])
+        self.set_summoner_info(data["summoner"])
+        self.gold = data["gold"] / 1e18
+        self.attributes = self.parse_attributes(data["attributes"])
+        self.details_data = data
+
+    def read(self, field):
+        """A field of `batch_reads`: from the snapshot data of the summoner if it has some, else from the chain"""
+        if self.details_data is not None and field in self.details_data:
+            return self.details_data[field]
+        return self.batch_read(field, self.token_id, self.contracts).call()
+
     def update_summoner_info(self):
         """Update class, level and xp"""
-        (xp, _, class_id, level) = self.contracts["summoner"].functions.summoner(self.token_id).call()
+        self.set_summoner_info(self.contracts["summoner"].functions.summoner(self.token_id).call())
+
+    def set_summoner_info(self, summoner_info):
+        (xp, _, class_id, level) = summoner_info
         self.xp = xp / 1e18
         self.class_id = class_id
         self.class_name = RarityData.class_from_id(class_id)
         self.level =  level
     
+    @staticmethod
+    def fetch_data(token_id, contracts):
+        """Fetch the same data as `Summoner.batch_reads`, one call at a time"""
+        try:
+            data = {name: w3fun.call() for name, w3fun in Summoner.batch_reads(token_id, contracts).items()}
+        except ContractLogicError:
+            raise InvalidSummonerError(f"Summoner {token_id}: could not fetch summoner data. Does it exist?")
+        data["approved_for_all"] = contracts["summoner"].functions.\
+            isApprovedForAll(Web3.toChecksumAddress(data["owner"]), CraftingEngine.contract_addresses["crafting"]).call()
+        return data
+
+    def fetch_details_data(self):
+        """Fetch the data behind `get_details` one call at a time"""
+        return self.fetch_data(self.token_id, self.contracts)
+
     def get_details(self):
         """Get a dict full of details about the summoner.
            Print it with tabulate for best results."""
+        data = self.details_data or self.fetch_details_data()
+        current_time = self.transacter.timestamp
         xp_str = str(round(self.xp)) + "/" + str(round(self.xp_required()))
-        craft_level = self.get_craft_level()
-        cellar_loot = round(self.expected_cellar_loot())
-        craft_mats = round(self.get_balance_craft1())
+        craft_level = data["skills"][5]
+        cellar_loot = round(data["cellar_loot"])
+        craft_mats = round(data["craft1"])
+        crafting_contract = Web3.toChecksumAddress(CraftingEngine.contract_addresses["crafting"])
+        is_approved = data["approved_for_all"] or Web3.toChecksumAddress(data["approved"]) == crafting_contract
+        is_ready_to_craft = CraftingEngine.check_ready_to_craft(craft_level, is_approved,
+                                                                data["gold_allowance"], data["craft_mats_allowance"])
         return  {
             "SummonerId": self.token_id,
             "Class": self.class_name,
@@ -78,10 +161,10 @@ class Summoner:
             "CHA": self.attributes["cha"]   if self.attributes["str"] else "",
             "XP": xp_str,
             "Gold": round(self.gold),
-            "Next Adventure": self.seconds_to_hms(self.time_to_next_adventure()),
-            "Crafter (level)": f'{"yes" if craft_level > 0 and self.is_ready_to_craft() else "no "} (lvl {craft_level})',
+            "Next Adventure": self.seconds_to_hms(data["adventurers_log"] - current_time),
+            "Crafter (level)": f'{"yes" if is_ready_to_craft else "no "} (lvl {craft_level})',
             "Craft Mat(I)": craft_mats if craft_mats else "",
-            "Next Cellar": self.seconds_to_hms(self.time_to_next_cellar()),
+            "Next Cellar": self.seconds_to_hms(data["cellar_log"] - current_time),
             "Next Loot": cellar_loot if cellar_loot else ""
         }
 
@@ -111,21 +194,29 @@ class Summoner:
     def update_gold_balance(self):
         self.gold = self.get_balance_gold()
 
-    def check_claim_gold(self):
-        claimable_gold = self.contracts["gold"].functions.claimable(self.token_id).call({"from": self.owner})
+    def claimable_gold_call(self):
+        """Call to the gold contract's claimable(), as (w3fun, tx_params). Must originate from owner."""
+        return self.contracts["gold"].functions.claimable(self.token_id), {"from": self.owner}
+
+    def check_claim_gold(self, claimable_gold = None):
+        """Check if gold can be claimed. `claimable_gold` can be pre-fetched, see `claimable_gold_call`."""
+        if claimable_gold is None:
+            w3fun, tx_params = self.claimable_gold_call()
+            claimable_gold = w3fun.call(tx_params)
         return claimable_gold > 0
 
-    def claim_gold(self):
-        if self.check_claim_gold():
+    def claim_gold(self, claimable_gold = None):
+        if self.check_claim_gold(claimable_gold):
             print(Fore.WHITE + str(self) + " is claiming gold")
             claim_gold_fun = self.contracts["gold"].functions.claim(self.token_id)
             tx_status = self.sign_and_execute(claim_gold_fun, gas = 120000)
             if tx_status["status"] == "success":
                 print("The summoner claimed gold with success !")
                 self.update_gold_balance()
+            return tx_status
 
     def get_balance_gold(self):
-        return self.get_balance_erc20(self.transacter.contracts["gold"], scaling_factor = 1e18)
+        return self.read("gold") / 1e18
 
     def transfer_gold(self, to_id, amount):
         print(Fore.WHITE + "Sending " + str(amount) + " gold from " + str(self.token_id) + " to " + str(to_id))
@@ -136,7 +227,7 @@ class Summoner:
 
     def time_to_next_adventure(self):
         """Get time to next adventure in seconds"""
-        next_time_available = self.contracts["summoner"].functions.adventurers_log(self.token_id).call()
+        next_time_available = self.read("adventurers_log")
         current_time = self.transacter.timestamp
         return next_time_available - current_time
 
@@ -144,6 +235,7 @@ class Summoner:
         return self.time_to_next_adventure() <= 0
 
     def adventure(self):
+        """Go on an adventure if possible. Returns the tx status (see Transacter.sign_and_execute) or None if nothing was done."""
         if self.check_adventure():
             print(Fore.WHITE + str(self) + " has gone on an adventure!")
             adventure_fun = self.contracts["summoner"].functions.adventure(self.token_id)
@@ -154,6 +246,7 @@ class Summoner:
             elif tx_status["status"] == "pending":
                 # Assume success and update xp (so that fast_check_level_up() works)
                 self.xp += 250
+            return tx_status
 
 
     ### LEVEL UP ----------------------------
@@ -165,6 +258,9 @@ class Summoner:
         return int(self.xp_required()) <= int(self.xp)
 
     def check_level_up(self):
+        if self.details_data is not None:
+            # Snapshot data: same formula as the contract's xp_required
+            return self.fast_check_level_up()
         self.update_summoner_info()
         xp_required = self.contracts["summoner"].functions.xp_required(int(self.level)).call() / 1e18
         return int(xp_required) <= int(self.xp)
@@ -179,16 +275,17 @@ class Summoner:
                 print(Fore.YELLOW + "Level passed!")
                 self.level += 1
                 self.xp = 0
+            return tx_status
 
     ### CELLAR (CRAFT1) -------------------------------------------
 
     def time_to_next_cellar(self):
-        next_time_available = self.contracts["craft1"].functions.adventurers_log(self.token_id).call()
+        next_time_available = self.read("cellar_log")
         current_time = self.transacter.timestamp
         return next_time_available - current_time
 
     def expected_cellar_loot(self):
-        return int(self.contracts["craft1"].functions.scout(self.token_id).call())
+        return int(self.read("cellar_loot"))
 
     def check_go_cellar(self):
         return self.time_to_next_cellar() <= 0 and self.expected_cellar_loot() >= self.MIN_CELLAR_LOOT
@@ -200,9 +297,10 @@ class Summoner:
             tx_status = self.sign_and_execute(cellar_fun, gas = 120000)
             if tx_status["status"] == "success":
                 print("The summoner came back from The Cellar with success !")
+            return tx_status
 
     def get_balance_craft1(self):
-        return self.get_balance_erc20(self.transacter.contracts["craft1"], scaling_factor = 1)
+        return self.read("craft1")
 
     def transfer_craft1(self, to_id, amount):
         print(Fore.WHITE + "Sending " + str(amount) + " crafting material (I) from " + str(self.token_id) + " to " + str(to_id))
@@ -228,7 +326,12 @@ class Summoner:
             print(Fore.RED + "Sender is same as recipient: skipping")
             return None
 
-        balance = contract.functions.balanceOf(self.token_id).call({"from": self.owner})
+        if contract.address == self.contracts["gold"].address:
+            balance = self.read("gold")
+        elif contract.address == self.contracts["craft1"].address:
+            balance = self.read("craft1")
+        else:
+            balance = contract.functions.balanceOf(self.token_id).call({"from": self.owner})
         # Set amount
         if amount == "max":
             amount = int(balance)
@@ -244,6 +347,7 @@ class Summoner:
             print(Fore.RED + "Empty balance: skipping")
             return None 
         # Do the transfer
+        get_store().invalidate([to_id])
         transfer_fun = contract.functions.transfer(self.token_id, to_id, amount)
         return self.sign_and_execute(transfer_fun, gas = 70000)
 
@@ -263,7 +367,7 @@ class Summoner:
     # SKILLS
     def set_skill(self, skill_name, level):
         """Take a dictionary of skills and sets them if possible"""
-        codex = SkillCodex()
+        codex = get_skill_codex()
         # Get skill id (checks that skill is valid at the same time)
         skill_id = codex.get_skill_id(skill_name)
         skill_index = skill_id - 1
@@ -296,7 +400,7 @@ class Summoner:
 
     def get_skills(self):
         """Dictionary of skill names to skill score"""
-        skills_raw = self.contracts["skills"].functions.get_skills(self.token_id).call()
+        skills_raw = self.read("skills")
         skill_dict = {RarityData.skill_names[i]: score for i, score in enumerate(skills_raw)}
         return skill_dict
 
@@ -305,16 +409,21 @@ class Summoner:
 
     def get_craft_level(self):
         """Three times faster than calling get_skill('Craft')"""
-        skills_vec = self.contracts["skills"].functions.get_skills(self.token_id).call()
+        skills_vec = self.read("skills")
         return skills_vec[5]
 
     # ATTRIBUTES
     def has_attributes(self):
+        if self.details_data is not None and "attributes" in self.details_data:
+            return any(self.details_data["attributes"])
         return self.contracts["attributes"].functions.character_created(self.token_id).call()
 
     def get_attributes(self):
-        (strength, dexterity, constitution, intelligence, wisdom, charisma) = \
-            self.contracts["attributes"].functions.ability_scores(self.token_id).call()
+        return self.parse_attributes(self.contracts["attributes"].functions.ability_scores(self.token_id).call())
+
+    @staticmethod
+    def parse_attributes(ability_scores):
+        (strength, dexterity, constitution, intelligence, wisdom, charisma) = ability_scores
         return {
             "str": strength,
             "dex": dexterity,
@@ -374,9 +483,12 @@ class Summoner:
         address = Web3.toChecksumAddress(address)
         if self.owner == address:
             return True
-        approved = self.contracts["summoner"].functions.getApproved(self.token_id).call()
+        approved = self.read("approved")
         if address == Web3.toChecksumAddress(approved):
             return True
+        crafting_contract = Web3.toChecksumAddress(CraftingEngine.contract_addresses["crafting"])
+        if address == crafting_contract and self.details_data is not None and "approved_for_all" in self.details_data:
+            return self.details_data["approved_for_all"]
         approved_all = self.contracts["summoner"].functions.isApprovedForAll(self.owner, address).call()
         return approved_all
     
@@ -387,6 +499,8 @@ class Summoner:
         return self.sign_and_execute(self.contracts["gold"].functions.approve(self.token_id, spender, amount), gas = 52000)
 
     def get_gold_allowance(self, spender):
+        if spender == CraftingEngine.crafting_spender:
+            return self.read("gold_allowance")
         return self.contracts["gold"].functions.allowance(self.token_id, spender).call()
 
     def approve_craft_mats(self, spender, amount = 2**256 - 1):
@@ -396,6 +510,8 @@ class Summoner:
         return self.sign_and_execute(self.contracts["craft1"].functions.approve(self.token_id, spender, amount), gas = 52000)
 
     def get_craft_mats_allowance(self, spender):
+        if spender == CraftingEngine.crafting_spender:
+            return self.read("craft_mats_allowance")
         return self.contracts["craft1"].functions.allowance(self.token_id, spender).call()
 
 
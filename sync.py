@@ -0,0 +1,257 @@
+from colorama import Fore
+from web3 import Web3
+from web3._utils.events import event_abi_to_log_topic, get_event_data
+
+from crafting import CraftingEngine
+from list_summoners import fetch_summoners_fields
+from ownership import LogScanner
+from snapshot import FleetSnapshot
+from summoner import Summoner
+
+ZERO_ADDRESS = "0x0000000000000000000000000000000000000000"
+
+class FleetSync:
+    """Keep the data of a fleet of summoners (see `Summoner.batch_reads`) up to date by following contract events.
+
+    A cold start reads everything. After that, each `sync()` fetches the events of the rarity contracts since the
+    last block synced and applies them to the local state (transfers, level ups, gold and craft mats balances, etc).
+    Fields that events can't update exactly are marked stale and only those are read again, at the same block.
+    A few summoners are fully read again each time and compared to the local state: on any mismatch, everything is read again."""
+
+    SYNCED_CONTRACTS = ["summoner", "gold", "craft1", "attributes", "skills"]
+
+    # Fields changed by actions that don't emit any event: they must be marked stale after the action
+    ACTION_FIELDS = {
+        "adventure": ["summoner", "adventurers_log"],
+        "level_up": [],
+        "claim_gold": [],
+        "cellar": []
+    }
+
+    # Number of summoners checked against the chain at each sync
+    CHECK_SAMPLE_SIZE = 5
+
+    # Max number of summoner ids per topic filter, for ERC20 events
+    TOPIC_IDS_CHUNK_SIZE = 100
+
+    def __init__(self, transacter, owner_address):
+        self.transacter = transacter
+        self.w3 = transacter.w3
+        self.contracts = transacter.contracts
+        self.owner_address = Web3.toChecksumAddress(owner_address)
+        self.fields = Summoner.DATA_FIELDS
+        self.state = {} # token_id => data
+        self.stale = {} # token_id => set of fields to read again
+        self.last_block = None
+        self.check_cursor = 0
+
+        # Events are decoded with the contract ABIs, found by contract address and topic0
+        self.event_abis = {}
+        for contract_name in self.SYNCED_CONTRACTS:
+            contract = self.contracts[contract_name]
+            for abi in contract.abi:
+                if abi["type"] == "event" and not abi.get("anonymous"):
+                    topic = Web3.toHex(event_abi_to_log_topic(abi))
+                    self.event_abis[(contract.address.lower(), topic)] = (contract_name, abi)
+
+        self.handlers = {
+            ("summoner", "Transfer"): self.on_summoner_transfer,
+            ("summoner", "Approval"): self.on_summoner_approval,
+            ("summoner", "ApprovalForAll"): self.on_approval_for_all,
+            ("summoner", "summoned"): self.on_summoned,
+            ("summoner", "leveled"): self.on_leveled,
+            ("gold", "Transfer"): lambda *values: self.on_erc20_transfer("gold", *values),
+            ("gold", "Approval"): lambda *values: self.on_erc20_approval("gold", *values),
+            ("craft1", "Transfer"): lambda *values: self.on_erc20_transfer("craft1", *values),
+            ("craft1", "Approval"): lambda *values: self.on_erc20_approval("craft1", *values),
+            ("attributes", "Created"): self.on_attributes,
+            ("attributes", "Leveled"): self.on_attributes
+        }
+
+    ### TRACKED SUMMONERS -------------------
+
+    def track(self, token_ids):
+        """Set the summoners of the fleet (e.g. from the ownership index). New ones are read at the next sync."""
+        token_ids = [int(id) for id in token_ids]
+        for token_id in list(self.state):
+            if token_id not in token_ids:
+                self.forget(token_id)
+        for token_id in token_ids:
+            self.add(token_id)
+
+    def add(self, token_id):
+        if token_id not in self.state:
+            self.state[token_id] = {}
+            self.mark_stale([token_id])
+
+    def forget(self, token_id):
+        self.state.pop(token_id, None)
+        self.stale.pop(token_id, None)
+
+    def mark_stale(self, token_ids, fields = None):
+        """Read these fields (default: all) again at the next sync"""
+        for token_id in token_ids:
+            if token_id in self.state:
+                self.stale.setdefault(token_id, set()).update(fields if fields is not None else self.fields)
+
+    def get_snapshot(self):
+        """Snapshot of the local state, at the last block synced (call `sync()` first)"""
+        return FleetSnapshot(self.last_block, self.state)
+
+    def get_summoners(self, signer = None, token_ids = None):
+        """Summoners built from the local state (call `sync()` first). Optionally only those in `token_ids`."""
+        return self.get_snapshot().get_summoners(self.transacter, signer = signer, token_ids = token_ids)
+
+    ### SYNC --------------------------------
+
+    def sync(self):
+        """Bring the local state up to the latest block"""
+        latest_block = self.w3.eth.block_number
+        cold_start = self.last_block is None
+        if cold_start:
+            self.mark_stale(list(self.state))
+        elif latest_block > self.last_block:
+            for contract_name, event_name, values in self.get_events(self.last_block + 1, latest_block):
+                self.handlers.get((contract_name, event_name), lambda *values: None)(*values)
+
+        self.read_stale(latest_block)
+        self.last_block = latest_block
+
+        if not cold_start and not self.check_consistency(latest_block):
+            print(Fore.YELLOW + "Local summoner data doesn't match the chain: reading everything again." + Fore.RESET)
+            self.mark_stale(list(self.state))
+            self.read_stale(latest_block)
+
+    def read_stale(self, block):
+        stale, self.stale = self.stale, {}
+        for token_id, values in self.read_fields(stale, block).items():
+            owner = values.get("owner", self.owner_address)
+            if owner is None or not self.is_owner(owner):
+                # Burned or sent away
+                self.forget(token_id)
+            else:
+                self.state[token_id].update(values)
+
+    def read_fields(self, fields_by_token, block):
+        """Read fields ({token_id: fields}) at a given block. Returns {token_id: {field: value}}"""
+        return fetch_summoners_fields(fields_by_token, self.transacter, known_data = self.state, block_identifier = block)
+
+    def check_consistency(self, block):
+        """Read a few summoners fully and compare them to the local state. Returns True if they match."""
+        candidates = sorted(self.state)
+        if not candidates:
+            return True
+        sample = [candidates[(self.check_cursor + i) % len(candidates)]
+                  for i in range(min(self.CHECK_SAMPLE_SIZE, len(candidates)))]
+        self.check_cursor += len(sample)
+        fresh = self.read_fields({token_id: self.fields for token_id in sample}, block)
+        return all(self.normalize(fresh[token_id]) == self.normalize(self.state[token_id]) for token_id in sample)
+
+    @staticmethod
+    def normalize(value):
+        """Comparable form of decoded values (tuples and lists, address case, etc)"""
+        if isinstance(value, dict):
+            return {k: FleetSync.normalize(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [FleetSync.normalize(v) for v in value]
+        if isinstance(value, str):
+            return value.lower()
+        return value
+
+    ### EVENTS ------------------------------
+
+    @staticmethod
+    def id_topic(token_id):
+        """Indexed uint, as found in log topics"""
+        return "0x" + hex(token_id)[2:].rjust(64, "0")
+
+    def get_events(self, from_block, to_block):
+        """Decoded events relevant to the fleet, in chain order, as (contract name, event name, values) tuples"""
+        scanner = LogScanner(self.w3)
+        addresses = [self.contracts[name].address for name in self.SYNCED_CONTRACTS]
+
+        # Events of the summoner, attributes and skills contracts have the owner (or sender) as first or second topic,
+        # ERC20 events have summoner ids
+        owner_topic = LogScanner.address_topic(self.owner_address)
+        logs = scanner.get_logs(addresses, [None, owner_topic], from_block, to_block) + \
+               scanner.get_logs(addresses, [None, None, owner_topic], from_block, to_block)
+        token_ids = sorted(self.state)
+        for start in range(0, len(token_ids), self.TOPIC_IDS_CHUNK_SIZE):
+            id_topics = [self.id_topic(id) for id in token_ids[start:(start + self.TOPIC_IDS_CHUNK_SIZE)]]
+            erc20_addresses = [self.contracts["gold"].address, self.contracts["craft1"].address]
+            logs += scanner.get_logs(erc20_addresses, [None, id_topics], from_block, to_block) + \
+                    scanner.get_logs(erc20_addresses, [None, None, id_topics], from_block, to_block)
+
+        unique_logs = {(Web3.toHex(log["transactionHash"]), log["logIndex"]): log for log in logs}
+        events = []
+        for log in sorted(unique_logs.values(), key = lambda log: (log["blockNumber"], log["logIndex"])):
+            if not log["topics"]:
+                continue
+            event_abi = self.event_abis.get((log["address"].lower(), Web3.toHex(log["topics"][0])))
+            if event_abi is None:
+                continue
+            contract_name, abi = event_abi
+            event = get_event_data(self.w3.codec, abi, log)
+            events.append((contract_name, abi["name"], [event["args"][arg["name"]] for arg in abi["inputs"]]))
+        return events
+
+    def is_owner(self, address):
+        return Web3.toChecksumAddress(address) == self.owner_address
+
+    def on_summoner_transfer(self, from_address, to_address, token_id):
+        if self.is_owner(to_address):
+            self.add(token_id)
+            if token_id in self.state and "approved" in self.state[token_id]:
+                # Transfers clear the approval
+                self.state[token_id]["approved"] = ZERO_ADDRESS
+        elif token_id in self.state:
+            self.forget(token_id)
+
+    def on_summoner_approval(self, owner, approved, token_id):
+        if token_id in self.state:
+            self.state[token_id]["approved"] = Web3.toChecksumAddress(approved)
+
+    def on_approval_for_all(self, owner, operator, approved):
+        crafting_contract = Web3.toChecksumAddress(CraftingEngine.contract_addresses["crafting"])
+        if self.is_owner(owner) and Web3.toChecksumAddress(operator) == crafting_contract:
+            for data in self.state.values():
+                data["approved_for_all"] = approved
+
+    def on_summoned(self, owner, class_id, token_id):
+        if self.is_owner(owner):
+            self.add(token_id)
+
+    def on_leveled(self, owner, level, token_id):
+        data = self.state.get(token_id)
+        if not data or "summoner" not in data:
+            return
+        (xp, log, class_id, current_level) = data["summoner"]
+        # Same formula as the contract's xp_required
+        xp_required = current_level * (current_level + 1) // 2 * 1000 * 10**18
+        # The event holds the level before the level up: any other level means our state is behind
+        if level != current_level or xp < xp_required:
+            self.mark_stale([token_id], ["summoner"])
+            return
+        data["summoner"] = [xp - xp_required, log, class_id, current_level + 1]
+        # Cellar loot depends on the level
+        self.mark_stale([token_id], ["cellar_loot"])
+
+    def on_erc20_transfer(self, contract_name, from_id, to_id, amount):
+        if from_id in self.state and contract_name in self.state[from_id]:
+            self.state[from_id][contract_name] -= amount
+        if to_id in self.state and contract_name in self.state[to_id]:
+            self.state[to_id][contract_name] += amount
+        if contract_name == "craft1" and from_id == 0 and to_id in self.state:
+            # Minted by a trip to the cellar, which resets its cooldown
+            self.mark_stale([to_id], ["cellar_log"])
+
+    def on_erc20_approval(self, contract_name, from_id, spender_id, amount):
+        allowance_field = "gold_allowance" if contract_name == "gold" else "craft_mats_allowance"
+        if from_id in self.state and spender_id == CraftingEngine.crafting_spender:
+            self.state[from_id][allowance_field] = amount
+
+    def on_attributes(self, creator, token_id, *ability_scores):
+        if token_id in self.state:
+            self.state[token_id]["attributes"] = list(ability_scores)
+            # Cellar loot depends on the attributes
+            self.mark_stale([token_id], ["cellar_loot"])
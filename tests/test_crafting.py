@@ -0,0 +1,75 @@
+from types import SimpleNamespace
+
+import crafting
+from crafting import CraftingSession
+
+class FakeTransacter:
+    """Batch txmode: signed tx are sent when taken, receipts come at the first poll"""
+    def __init__(self):
+        self.unsent = []
+        self.receipts = {}
+
+    def take_pending_transactions(self):
+        sent, self.unsent = self.unsent, []
+        return [{"tx_hash": tx_hash, "gas_price": 0} for tx_hash in sent]
+
+    def get_receipts(self, tx_hashes):
+        return [self.receipts.get(tx_hash) for tx_hash in tx_hashes]
+
+    def log_receipt(self, tx_hash, tx_receipt, gas_price_for_log):
+        pass
+
+class FakeSummoner:
+    """Signs tx, rejecting those listed in `rejected` (by attempt number) like the node would"""
+    def __init__(self, transacter, rejected):
+        self.transacter = transacter
+        self.rejected = rejected
+        self.signed = 0
+
+    def sign_and_execute(self, w3fun, gas):
+        self.signed += 1
+        if self.signed in self.rejected:
+            raise ValueError({"code": -32000, "message": "nonce too low"})
+        tx_hash = "0x" + str(self.signed)
+        self.transacter.unsent.append(tx_hash)
+        self.transacter.receipts[tx_hash] = SimpleNamespace(status = 1, logs = [])
+        return {"status": "pending", "hash": tx_hash, "receipt": None}
+
+def make_session(rejected):
+    transacter = FakeTransacter()
+    session = CraftingSession.__new__(CraftingSession)
+    session.crafting_engine = SimpleNamespace(contracts = {"crafting": SimpleNamespace(functions = SimpleNamespace(
+        craft = lambda *args: args))})
+    session.transacter = transacter
+    session.summoner = FakeSummoner(transacter, rejected)
+    session.summoner.token_id = 1
+    session.item = SimpleNamespace(cost = 10, base_type_id = 1, item_id = 1, DC = 20)
+    session.craft_mats = 0
+    session.craft_level = 5
+    session.gold = 1000
+    session.craft_mats_balance = 0
+    session.xp = 10000
+    session.proba = 0.9
+    session.in_flight = {}
+    session.attempts = 0
+    session.crafted = 0
+    session.failed = 0
+    return session
+
+def test_rejected_attempts_stop_the_session_and_in_flight_ones_are_collected(monkeypatch):
+    monkeypatch.setattr(crafting.time, "sleep", lambda seconds: None)
+    session = make_session(rejected = {2, 3, 4})
+    session.run(10)
+    assert session.failed == CraftingSession.MAX_FAILED_ATTEMPTS
+    # Only the first attempt was sent, and its receipt settled its reservation (nothing crafted: gold given back)
+    assert session.attempts == 1
+    assert session.in_flight == {}
+    assert session.gold == 1000
+
+def test_a_rejected_attempt_doesnt_stop_the_session(monkeypatch):
+    monkeypatch.setattr(crafting.time, "sleep", lambda seconds: None)
+    session = make_session(rejected = {2})
+    session.run(3)
+    assert session.failed == 1
+    assert session.attempts == 3
+    assert session.in_flight == {}
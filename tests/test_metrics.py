@@ -0,0 +1,75 @@
+import json
+import random
+
+import metrics
+import network
+from metrics import RpcMetrics
+
+def test_latencies_are_all_kept_below_the_cap():
+    rpc_metrics = RpcMetrics()
+    for latency in [0.1, 0.2, 0.3]:
+        rpc_metrics.add(rpc_metrics.methods, "eth_call", latency, 10, 20, error = False)
+    entry = rpc_metrics.methods["eth_call"]
+    assert entry["calls"] == 3
+    assert entry["latencies"] == [0.1, 0.2, 0.3]
+    assert entry["bytes_sent"] == 30 and entry["bytes_received"] == 60
+
+def test_latencies_are_a_uniform_sample_above_the_cap(monkeypatch):
+    monkeypatch.setattr(RpcMetrics, "MAX_LATENCIES", 100)
+    random.seed(1)
+    rpc_metrics = RpcMetrics()
+    for latency in range(10000):
+        rpc_metrics.add(rpc_metrics.methods, "eth_call", latency, 0, 0, error = False)
+    entry = rpc_metrics.methods["eth_call"]
+    assert entry["calls"] == 10000
+    assert len(entry["latencies"]) == 100
+    # Total time counts every request, not only the sampled ones
+    assert entry["total_time"] == sum(range(10000))
+    # Keeping the first (or last) latencies only would be far off the mean of all of them (4999.5)
+    assert 3500 < sum(entry["latencies"]) / 100 < 6500
+
+def test_errors_are_counted():
+    rpc_metrics = RpcMetrics()
+    rpc_metrics.add(rpc_metrics.methods, "eth_call", 0.1, 0, 0, error = True)
+    rpc_metrics.add(rpc_metrics.methods, "eth_call", 0.1, 0, 0, error = None)
+    assert rpc_metrics.methods["eth_call"]["errors"] == 1
+
+def test_percentile_is_nearest_rank():
+    values = list(range(1, 11))
+    assert RpcMetrics.percentile(values, 50) == 5
+    assert RpcMetrics.percentile(values, 95) == 10
+    assert RpcMetrics.percentile(values, 0) == 1
+    assert RpcMetrics.percentile([7], 99) == 7
+    assert RpcMetrics.percentile([], 50) is None
+
+def test_eth_call_is_recorded_by_contract_function():
+    rpc_metrics = RpcMetrics()
+    rpc_metrics.record_request("eth_call", [{"to": "0xABC", "data": "0x12345678abcd"}, "latest"], 0.1, 10, 20)
+    rpc_metrics.record_request("eth_blockNumber", [], 0.1, 10, 20)
+    assert set(rpc_metrics.methods) == {"eth_call", "eth_blockNumber"}
+    assert list(rpc_metrics.functions) == [("0xabc", "0x12345678")]
+
+def test_batch_records_each_request_with_the_latency_of_its_chunk(monkeypatch):
+    rpc_metrics = RpcMetrics()
+    monkeypatch.setattr(network, "get_metrics", lambda: rpc_metrics)
+    chunk = [{"jsonrpc": "2.0", "id": 0, "method": "eth_call", "params": [{"to": "0xabc", "data": "0x12345678"}, "latest"]},
+             {"jsonrpc": "2.0", "id": 1, "method": "eth_call", "params": [{"to": "0xabc", "data": "0x12345678"}, "latest"]},
+             {"jsonrpc": "2.0", "id": 2, "method": "eth_getBalance", "params": ["0xabc", "latest"]}]
+    responses = [{"jsonrpc": "2.0", "id": 0, "result": "0x01"},
+                 {"jsonrpc": "2.0", "id": 1, "error": {"code": 3, "message": "execution reverted"}},
+                 None]
+    network.RpcBatch.record(chunk, responses, 0.5)
+
+    calls = rpc_metrics.methods["eth_call"]
+    assert calls["calls"] == 2
+    assert calls["errors"] == 1
+    assert calls["latencies"] == [0.5, 0.5]
+    assert calls["bytes_sent"] == sum(len(json.dumps(request)) for request in chunk[:2])
+    assert calls["bytes_received"] == sum(len(json.dumps(response)) for response in responses[:2])
+    assert rpc_metrics.functions[("0xabc", "0x12345678")]["calls"] == 2
+    # No response: an error, nothing received
+    balance = rpc_metrics.methods["eth_getBalance"]
+    assert (balance["calls"], balance["errors"], balance["bytes_received"]) == (1, 1, 0)
+
+def test_session_metrics_are_shared():
+    assert metrics.get_metrics() is metrics.get_metrics()
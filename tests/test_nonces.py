@@ -0,0 +1,123 @@
+from web3.exceptions import TransactionNotFound
+import pytest
+
+import cache
+import nonces
+from nonces import NonceManager
+
+ADDRESS = "0x000000000000000000000000000000000000dEaD"
+
+class FakeEth:
+    """Node knowing `known_tx` and having mined `transaction_count` tx of the address"""
+    def __init__(self):
+        self.transaction_count = 0
+        self.known_tx = set()
+
+    def get_transaction_count(self, address):
+        return self.transaction_count
+
+    def get_transaction(self, tx_hash):
+        if tx_hash not in self.known_tx:
+            raise TransactionNotFound(tx_hash)
+        return {"hash": tx_hash}
+
+class FakeWeb3:
+    def __init__(self):
+        self.eth = FakeEth()
+
+class Clock:
+    def __init__(self):
+        self.now = 1000000.0
+
+    def time(self):
+        return self.now
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(nonces.time, "time", clock.time)
+    return clock
+
+@pytest.fixture
+def manager(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, "CACHE_DIR", str(tmp_path))
+    return NonceManager(FakeWeb3(), ADDRESS, 250)
+
+def sync(manager):
+    with cache.FileLock(manager.lock_path):
+        state = manager.load_state()
+        manager.sync(state)
+        manager.save_state(state)
+    return state
+
+def test_allocate_hands_out_consecutive_nonces(manager, clock):
+    manager.w3.eth.transaction_count = 5
+    assert [manager.allocate() for _ in range(3)] == [5, 6, 7]
+
+def test_released_nonce_is_reused_first(manager, clock):
+    nonces = [manager.allocate() for _ in range(3)]
+    manager.release(nonces[1])
+    assert manager.allocate() == nonces[1]
+    assert manager.allocate() == 3
+
+def test_take_only_reserves_gaps(manager, clock):
+    nonce = manager.allocate()
+    manager.allocate()
+    assert not manager.take(nonce)
+    manager.release(nonce)
+    assert manager.take(nonce)
+    assert not manager.take(nonce)
+
+def test_mined_nonces_are_forgotten(manager, clock):
+    for _ in range(3):
+        manager.allocate()
+    manager.w3.eth.transaction_count = 2
+    state = sync(manager)
+    assert list(state["in_flight"]) == ["2"]
+    assert state["next_nonce"] == 3
+
+def test_unsent_tx_keeps_its_nonce(manager, clock):
+    # Signed but still waiting to be broadcast (e.g. queued in batch txmode): unknown to the node, but not dropped
+    nonce = manager.allocate()
+    manager.set_tx_hash(nonce, "0xunsent")
+    clock.now += NonceManager.DROPPED_AFTER * 10
+    state = sync(manager)
+    assert str(nonce) in state["in_flight"]
+    assert nonce not in state["gaps"]
+    assert manager.allocate() == nonce + 1
+
+def test_dropped_tx_leaves_a_gap(manager, clock):
+    nonce = manager.allocate()
+    manager.set_tx_hash(nonce, "0xdropped")
+    manager.allocate()
+    manager.set_broadcast([nonce])
+    clock.now += NonceManager.DROPPED_AFTER + 1
+    state = sync(manager)
+    assert str(nonce) not in state["in_flight"]
+    assert state["gaps"] == [nonce]
+
+def test_tx_known_to_the_node_is_not_dropped(manager, clock):
+    nonce = manager.allocate()
+    manager.set_tx_hash(nonce, "0xknown")
+    manager.set_broadcast([nonce])
+    manager.w3.eth.known_tx.add("0xknown")
+    clock.now += NonceManager.DROPPED_AFTER + 1
+    state = sync(manager)
+    assert str(nonce) in state["in_flight"]
+
+def test_recently_broadcast_tx_is_not_dropped(manager, clock):
+    nonce = manager.allocate()
+    manager.set_tx_hash(nonce, "0xslow")
+    clock.now += NonceManager.ABANDONED_AFTER
+    # Broadcast late (long batch), not yet seen by the node
+    manager.set_broadcast([nonce])
+    state = sync(manager)
+    assert str(nonce) in state["in_flight"]
+
+def test_abandoned_tx_leaves_a_gap(manager, clock):
+    # Process killed after signing, before broadcasting
+    nonce = manager.allocate()
+    manager.set_tx_hash(nonce, "0xabandoned")
+    clock.now += NonceManager.ABANDONED_AFTER + 1
+    state = sync(manager)
+    assert state["gaps"] == [nonce]
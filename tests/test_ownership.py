@@ -0,0 +1,40 @@
+import pytest
+
+import ownership
+from ownership import OwnershipError, iter_ftmscan_transfers
+
+def make_transfers(blocks):
+    return [{"blockNumber": str(block), "hash": f"0x{block}{i}", "tokenID": str(i), "from": "0xa", "to": "0xb"}
+            for i, block in enumerate(blocks)]
+
+@pytest.fixture
+def explorer(monkeypatch):
+    """FTMScan with pages of 3 transfers and at most 6 results per query"""
+    monkeypatch.setattr(ownership, "FTMSCAN_PAGE_SIZE", 3)
+    monkeypatch.setattr(ownership, "FTMSCAN_MAX_RESULTS", 6)
+    explorer = {"transfers": [], "queries": []}
+
+    def fetch_page(owner_address, contract_address, start_block, page):
+        explorer["queries"].append((start_block, page))
+        assert page * ownership.FTMSCAN_PAGE_SIZE <= ownership.FTMSCAN_MAX_RESULTS
+        transfers = [transfer for transfer in explorer["transfers"] if int(transfer["blockNumber"]) >= start_block]
+        return transfers[(page - 1) * ownership.FTMSCAN_PAGE_SIZE:(page * ownership.FTMSCAN_PAGE_SIZE)]
+
+    monkeypatch.setattr(ownership, "fetch_ftmscan_transfers_page", fetch_page)
+    return explorer
+
+def test_pages_until_a_partial_page(explorer):
+    explorer["transfers"] = make_transfers([1, 2, 3, 4, 5])
+    assert list(iter_ftmscan_transfers("0xb", "0xc", start_block = 1)) == explorer["transfers"]
+    assert explorer["queries"] == [(1, 1), (1, 2)]
+
+def test_queries_again_from_the_last_block_past_the_max_results(explorer):
+    # Transfers of block 6 span the last page of the first query and the first page of the next one
+    explorer["transfers"] = make_transfers([1, 2, 3, 4, 6, 6, 6, 7, 8])
+    assert list(iter_ftmscan_transfers("0xb", "0xc", start_block = 1)) == explorer["transfers"]
+    assert explorer["queries"] == [(1, 1), (1, 2), (6, 1), (6, 2)]
+
+def test_too_many_transfers_in_one_block(explorer):
+    explorer["transfers"] = make_transfers([5] * 7)
+    with pytest.raises(OwnershipError):
+        list(iter_ftmscan_transfers("0xb", "0xc", start_block = 5))
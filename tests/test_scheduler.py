@@ -0,0 +1,45 @@
+import scheduler
+from scheduler import ActionScheduler
+
+class FakeSummoner:
+    """Summoner with pre-fetched data, whose cached checks say whether each action can run"""
+    def __init__(self, token_id, can_adventure, can_level_up):
+        self.token_id = token_id
+        self.contracts = None
+        self.details_data = {"adventurers_log": 0, "summoner": [0, 0, 1, 1]}
+        self.can_adventure = can_adventure
+        self.can_level_up = can_level_up
+
+    def check_adventure(self):
+        return self.can_adventure
+
+    def fast_check_level_up(self):
+        return self.can_level_up
+
+    def check_go_cellar(self):
+        return True
+
+    @staticmethod
+    def batch_read(field, token_id, contracts):
+        return (field, token_id)
+
+    def set_summoner_info(self, summoner_info):
+        self.summoner_info = summoner_info
+
+def test_refresh_reads_the_fields_of_actions_about_to_run(monkeypatch):
+    reads = []
+    def execute_reads(w3funs, transacter):
+        reads.extend(w3funs)
+        return [[5, 0, 1, 2] if field == "summoner" else None for field, token_id in w3funs]
+    monkeypatch.setattr(scheduler, "execute_reads", execute_reads)
+
+    summoners = [FakeSummoner(1, True, True), FakeSummoner(2, False, False), FakeSummoner(3, False, True)]
+    ActionScheduler(None, ["adventure", "level_up"]).refresh(summoners)
+
+    # Cellar isn't selected, summoner 2 can't act yet
+    assert sorted(reads) == [("adventurers_log", 1), ("summoner", 1), ("summoner", 3)]
+    assert summoners[0].summoner_info == [5, 0, 1, 2]
+    assert summoners[0].details_data["summoner"] == [5, 0, 1, 2]
+    # A failed read is read again from the chain by the action
+    assert "adventurers_log" not in summoners[0].details_data
+    assert summoners[1].details_data == {"adventurers_log": 0, "summoner": [0, 0, 1, 1]}
@@ -0,0 +1,53 @@
+import pytest
+
+import store
+from store import FleetStore
+
+NOW = 1000000.0
+
+@pytest.fixture
+def fleet_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(store.time, "time", lambda: NOW)
+    return FleetStore(250, path = str(tmp_path / "fleet.sqlite"))
+
+def entry(value, age):
+    return {"value": value, "block": 1, "read_at": NOW - age}
+
+def test_set_attributes_are_never_read_again(fleet_store):
+    assert fleet_store.is_fresh("attributes", entry([10, 10, 10, 10, 10, 10], age = 10**9), 0, NOW)
+
+def test_attributes_not_set_yet_follow_max_staleness(fleet_store):
+    assert fleet_store.is_fresh("attributes", entry([0, 0, 0, 0, 0, 0], age = 10), 60, NOW)
+    assert not fleet_store.is_fresh("attributes", entry([0, 0, 0, 0, 0, 0], age = 100), 60, NOW)
+
+def test_cooldowns_are_reused_until_they_expire(fleet_store):
+    chain_time = 5000
+    assert fleet_store.is_fresh("adventurers_log", entry(chain_time + 1, age = 10**6), 0, chain_time)
+    assert not fleet_store.is_fresh("cellar_log", entry(chain_time - 1, age = 100), 60, chain_time)
+    # Expired, but recent enough for the command
+    assert fleet_store.is_fresh("cellar_log", entry(chain_time - 1, age = 10), 60, chain_time)
+
+def test_other_fields_follow_max_staleness(fleet_store):
+    assert fleet_store.is_fresh("gold", entry(100, age = 60), 60, NOW)
+    assert not fleet_store.is_fresh("gold", entry(100, age = 61), 60, NOW)
+    assert not fleet_store.is_fresh("summoner", entry([1, 2, 3, 4], age = 1), 0, NOW)
+
+def test_stale_fields_include_missing_ones(fleet_store):
+    entries = {"gold": entry(100, age = 10), "craft1": entry(5, age = 100)}
+    assert fleet_store.stale_fields(entries, ["gold", "craft1", "skills"], 60, NOW) == ["craft1", "skills"]
+
+def test_saved_fields_are_loaded_with_their_block(fleet_store):
+    fleet_store.save({1: {"gold": 100, "summoner": [1, 2, 3, 4], "approved": None}, 2: {"gold": 5}}, block = 42)
+    entries = fleet_store.load([1, 2, 3])
+    # Failed reads aren't stored
+    assert entries[1] == {"gold": {"value": 100, "block": 42, "read_at": NOW},
+                          "summoner": {"value": [1, 2, 3, 4], "block": 42, "read_at": NOW}}
+    assert entries[2]["gold"]["value"] == 5
+    assert entries[3] == {}
+
+def test_invalidate_forgets_fields(fleet_store):
+    fleet_store.save({1: {"gold": 100, "craft1": 5}, 2: {"gold": 5}}, block = 42)
+    fleet_store.invalidate([1], fields = ["gold"])
+    assert list(fleet_store.load([1])[1]) == ["craft1"]
+    fleet_store.invalidate([1, 2])
+    assert fleet_store.load([1, 2]) == {1: {}, 2: {}}
@@ -0,0 +1,75 @@
+from web3 import Web3
+import pytest
+
+from crafting import CraftingEngine
+from sync import FleetSync, ZERO_ADDRESS
+
+OWNER = "0x000000000000000000000000000000000000dEaD"
+OTHER = "0x000000000000000000000000000000000000bEEF"
+XP = 10**18
+
+@pytest.fixture
+def fleet():
+    """Fleet of summoners 1 and 2, without a node: only events are applied"""
+    fleet = FleetSync.__new__(FleetSync)
+    fleet.owner_address = Web3.toChecksumAddress(OWNER)
+    fleet.fields = ["owner", "summoner", "gold", "craft1", "cellar_log", "cellar_loot", "attributes"]
+    fleet.state = {
+        1: {"summoner": [3500 * XP, 0, 1, 2], "gold": 100 * XP, "craft1": 10},
+        2: {"summoner": [0, 0, 2, 1], "gold": 0, "craft1": 0}
+    }
+    fleet.stale = {}
+    return fleet
+
+def test_level_up_spends_the_xp_required(fleet):
+    # Level 2 to 3 needs 3000 xp
+    fleet.on_leveled(OWNER, 2, 1)
+    assert fleet.state[1]["summoner"] == [500 * XP, 0, 1, 3]
+    assert fleet.stale == {1: {"cellar_loot"}}
+
+def test_level_up_from_another_level_reads_the_summoner_again(fleet):
+    # The event holds the level before the level up: we're behind
+    fleet.on_leveled(OWNER, 3, 1)
+    assert fleet.state[1]["summoner"] == [3500 * XP, 0, 1, 2]
+    assert fleet.stale == {1: {"summoner"}}
+
+def test_level_up_without_enough_xp_reads_the_summoner_again(fleet):
+    fleet.on_leveled(OWNER, 1, 2)
+    assert fleet.state[2]["summoner"] == [0, 0, 2, 1]
+    assert fleet.stale == {2: {"summoner"}}
+
+def test_erc20_transfers_move_balances_between_summoners(fleet):
+    fleet.on_erc20_transfer("gold", 1, 2, 40 * XP)
+    fleet.on_erc20_transfer("gold", 1, 99, 10 * XP)
+    assert fleet.state[1]["gold"] == 50 * XP
+    assert fleet.state[2]["gold"] == 40 * XP
+    assert fleet.stale == {}
+
+def test_craft_mats_minted_mark_the_cellar_cooldown_stale(fleet):
+    fleet.on_erc20_transfer("craft1", 0, 2, 3)
+    assert fleet.state[2]["craft1"] == 3
+    assert fleet.stale == {2: {"cellar_log"}}
+
+def test_summoners_sent_away_are_forgotten_and_received_ones_read(fleet):
+    fleet.stale = {1: {"gold"}}
+    fleet.on_summoner_transfer(OWNER, OTHER, 1)
+    fleet.on_summoner_transfer(OTHER, OWNER, 3)
+    assert set(fleet.state) == {2, 3}
+    assert fleet.stale == {3: set(fleet.fields)}
+
+def test_received_summoner_loses_its_approval(fleet):
+    fleet.state[2]["approved"] = OTHER
+    fleet.on_summoner_transfer(OTHER, OWNER, 2)
+    assert fleet.state[2]["approved"] == ZERO_ADDRESS
+
+def test_attributes_update_the_cellar_loot(fleet):
+    fleet.on_attributes(OWNER, 2, 10, 11, 12, 13, 14, 15)
+    fleet.on_attributes(OWNER, 99, 10, 11, 12, 13, 14, 15)
+    assert fleet.state[2]["attributes"] == [10, 11, 12, 13, 14, 15]
+    assert fleet.stale == {2: {"cellar_loot"}}
+
+def test_only_crafting_allowances_are_tracked(fleet):
+    fleet.on_erc20_approval("gold", 1, CraftingEngine.crafting_spender, 5)
+    fleet.on_erc20_approval("craft1", 1, 1234, 5)
+    assert fleet.state[1]["gold_allowance"] == 5
+    assert "craft_mats_allowance" not in fleet.state[1]
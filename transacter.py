@@ -1,28 +1,95 @@
 from colorama.ansi import Fore
 from web3 import Web3
+from web3._utils.method_formatters import receipt_formatter
+from web3.datastructures import AttributeDict
 import web3
 import requests
+import json
+import os
+import threading
 import time 
 
+import cache
+import network
+from nonces import NonceManager
+
 class Signer:
     """Class in charge of signing transactions"""
     def __init__(self, address, private_key):
         self.address = Web3.toChecksumAddress(address)
         self.private_key = private_key
-        self.w3 =  Web3(Web3.HTTPProvider('https://rpc.ftm.tools/'))
-        self.nonce =  self.w3.eth.get_transaction_count(self.address)
+        self.w3 = network.get_web3()
+        self.chain_id = network.get_chain_id()
+        self.nonce_manager = NonceManager(self.w3, self.address, self.chain_id)
+        # Nonces of signed tx, by tx hash
+        self.nonces = {}
 
-    def sign(self, w3fun, gas):
+    def sign(self, w3fun, gas, gas_price = None):
         """
-        Sign a transaction
+        Sign a transaction. Gas price is in wei, fetched from the node if not given.
         """
-        tx = w3fun.buildTransaction({
-            'chainId': 250,
+        nonce = self.nonce_manager.allocate()
+        tx_params = {
+            'chainId': self.chain_id,
             'gas': gas,
-            # TODO: gasprice is estimated automatically for now, will need to optimize it later
-            'nonce': self.nonce})
-        self.nonce = self.nonce + 1
-        return self.w3.eth.account.sign_transaction(tx, private_key = self.private_key)
+            'nonce': nonce}
+        if gas_price:
+            tx_params['gasPrice'] = gas_price
+        try:
+            tx = w3fun.buildTransaction(tx_params)
+            tx_signed = self.w3.eth.account.sign_transaction(tx, private_key = self.private_key)
+        except Exception:
+            self.nonce_manager.release(nonce)
+            raise
+        tx_hash = self.w3.toHex(tx_signed.hash)
+        self.nonce_manager.set_tx_hash(nonce, tx_hash)
+        self.nonces[tx_hash] = nonce
+        return tx_signed
+
+    def sign_gap_filler(self, nonce, gas_price):
+        """Sign an empty tx (0 FTM to self) with a released nonce, so later tx don't wait for it.
+           Returns None if the nonce was reused meanwhile."""
+        if not self.nonce_manager.take(nonce):
+            return None
+        tx = {'chainId': self.chain_id, 'to': self.address, 'value': 0, 'gas': 21000, 'gasPrice': gas_price, 'nonce': nonce}
+        tx_signed = self.w3.eth.account.sign_transaction(tx, private_key = self.private_key)
+        tx_hash = self.w3.toHex(tx_signed.hash)
+        self.nonce_manager.set_tx_hash(nonce, tx_hash)
+        self.nonces[tx_hash] = nonce
+        return tx_signed
+
+    def set_broadcast(self, tx_hashes):
+        """Call when signed tx were sent to the node, so their nonces are watched for dropped tx"""
+        nonces = [self.nonces[tx_hash] for tx_hash in tx_hashes if tx_hash in self.nonces]
+        if nonces:
+            self.nonce_manager.set_broadcast(nonces)
+
+    def release(self, tx_hash):
+        """Call when a signed tx could not be broadcast, so its nonce can be reused. Returns the nonce (None if unknown)."""
+        nonce = self.nonces.pop(tx_hash, None)
+        if nonce is not None:
+            self.nonce_manager.release(nonce)
+        return nonce
+
+class GasPriceOracle:
+    """Gas price cached for a few seconds, so we don't ask the node before every tx.
+       Fantom produces about one block per second, so a ttl of 1 means roughly one check per block."""
+
+    DEFAULT_TTL = 10
+
+    def __init__(self, w3, ttl = None):
+        self.w3 = w3
+        self.ttl = ttl if ttl is not None else self.DEFAULT_TTL
+        self.gas_price_wei = None
+        self.fetched_at = 0
+        self.lock = threading.Lock()
+
+    def get_gas_price_wei(self):
+        with self.lock:
+            if self.gas_price_wei is None or time.monotonic() - self.fetched_at >= self.ttl:
+                self.gas_price_wei = self.w3.eth.gas_price
+                self.fetched_at = time.monotonic()
+            return self.gas_price_wei
 
 class Transacter:
     """Class in charge of interacting with the blockchain"""
@@ -43,13 +110,22 @@ class Transacter:
     # Contracts adress checksums
     contract_checksums = {k: Web3.toChecksumAddress(v) for k, v in contract_addresses.items()}
 
-    def __init__(self, txmode = "single"):
-        """Create a transacter. If private key is not given, won't be able to sign anything but can still read contracts."""
+    # In batch txmode, signed tx are broadcast together once this many are queued
+    BROADCAST_BATCH_SIZE = 50
+
+    # ABIs shipped with the bot (optional), one file per contract address
+    BUNDLED_ABI_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "abis")
+
+    def __init__(self, txmode = "single", gas_price_ttl = None):
+        """Create a transacter. If private key is not given, won't be able to sign anything but can still read contracts.
+           Gas price is cached for `gas_price_ttl` seconds (see GasPriceOracle)."""
         self.txmode = txmode
-        self.w3 =  Web3(Web3.HTTPProvider('https://rpc.ftm.tools/'))
+        self.w3 = network.get_web3()
+        self.gas_oracle = GasPriceOracle(self.w3, ttl = gas_price_ttl)
         # Prepare all contracts only once
-        self.contracts = {cname: Transacter.rate_limit(self.get_contract(cname)) for cname in self.contract_addresses.keys()}
+        self.contracts = {cname: self.get_contract(cname) for cname in self.contract_addresses.keys()}
         self.update_timestamp() # create self.timestamp
+        self.unsent_transactions = []
         self.pending_transactions = []
         self.session_cost = 0
 
@@ -64,23 +140,41 @@ class Transacter:
                                     abi = Transacter.get_abi(self.contract_addresses[contract_name]))
 
     @staticmethod
-    def get_abi(contract_address):
-        '''Get abi from contract address'''
-        abi_contract_url = "https://api.ftmscan.com/api?module=contract&action=getabi&address=" + \
+    def get_abi(contract_address, refresh = False):
+        '''Get abi from contract address. 
+           Looks in the local ABI store first, then in the bundled ABIs, and only then asks FTMScan.
+           Use `refresh = True` to force a new download.'''
+        abi_filename = contract_address.lower() + ".json"
+        cached_abi_path = cache.cache_path("abis", abi_filename)
+        if not refresh:
+            # An empty ABI is valid (contracts the bot doesn't call)
+            for path in [cached_abi_path, os.path.join(Transacter.BUNDLED_ABI_DIR, abi_filename)]:
+                abi = cache.load_json(path)
+                if abi is not None:
+                    return abi
+        abi = Transacter.download_abi(contract_address)
+        cache.save_json(cached_abi_path, abi)
+        return abi
+
+    @staticmethod
+    def download_abi(contract_address):
+        '''Download abi from FTMScan (rate limited)'''
+        abi_contract_url = network.explorer_api + "?module=contract&action=getabi&address=" + \
             contract_address + "&apikey=" + Transacter.API_FTMSCAN_TOKEN
         try:
-            res = requests.get(abi_contract_url)
+            res = Transacter.rate_limit(network.get_session().get(abi_contract_url, timeout = network.REQUEST_TIMEOUT))
             res_json = res.json()
-            abi = res_json["result"]
         except requests.exceptions.RequestException as e:
             raise SystemExit(e)
-        return abi
+        if res_json.get("status") != "1":
+            raise SystemExit("Could not get ABI for " + contract_address + ": " + str(res_json.get("result")))
+        return json.loads(res_json["result"])
 
     def update_timestamp(self):
         self.timestamp = self.w3.eth.get_block('latest')["timestamp"]
 
     def get_gas_price(self):
-        return self.w3.eth.gas_price / 1e18
+        return self.gas_oracle.get_gas_price_wei() / 1e18
 
     def sign_and_execute(self, w3fun, gas, signer):
         """
@@ -90,25 +184,102 @@ class Transacter:
         """
         if not signer:
             raise PermissionError("Cannot sign without a signer with a private key")
-        tx_signed = signer.sign(w3fun, gas)
-        self.w3.eth.send_raw_transaction(tx_signed.rawTransaction)
+        gas_price_wei = self.gas_oracle.get_gas_price_wei()
+        tx_signed = signer.sign(w3fun, gas, gas_price = gas_price_wei)
         tx_hash = self.w3.toHex(self.w3.keccak(tx_signed.rawTransaction))
-        current_gas_price = self.get_gas_price()
+        current_gas_price = gas_price_wei / 1e18
         estimated_cost = gas * current_gas_price
-        print("Transaction sent, paying up to " + str(round(estimated_cost, 6)) + " FTM, id: " + tx_hash)
 
         if self.txmode == "batch":
-            self.pending_transactions.append({"tx_hash": tx_hash, "gas_price": current_gas_price})
+            # Tx are broadcast together, see broadcast_transactions()
+            self.unsent_transactions.append({"tx_hash": tx_hash, "raw_tx": self.w3.toHex(tx_signed.rawTransaction), 
+                                             "gas_price": current_gas_price, "estimated_cost": estimated_cost,
+                                             "signer": signer})
+            if len(self.unsent_transactions) >= self.BROADCAST_BATCH_SIZE:
+                self.broadcast_transactions()
             return {"status": "pending", "hash": tx_hash, "receipt": None}
         else:
+            try:
+                self.w3.eth.send_raw_transaction(tx_signed.rawTransaction)
+            except ValueError:
+                signer.release(tx_hash)
+                raise
+            signer.set_broadcast([tx_hash])
+            print("Transaction sent, paying up to " + str(round(estimated_cost, 6)) + " FTM, id: " + tx_hash)
             # Check receipt status
             print("Waiting for receipt...")
             tx_receipt = self.wait_for_tx(tx_hash, gas_price_for_log = current_gas_price)
             tx_status = "success" if tx_receipt.status == 1 else "failure"
             return {"status": tx_status, "hash": tx_hash, "receipt": tx_receipt}
 
-    def wait_for_tx(self, tx_hash, gas_price_for_log, wait_timeout = 360):
+    def broadcast_transactions(self):
+        """Send all signed tx waiting to be broadcast, in one request. Sent tx become pending."""
+        if not self.unsent_transactions:
+            return
+        batch = network.RpcBatch()
+        for tx in self.unsent_transactions:
+            batch.add("eth_sendRawTransaction", [tx["raw_tx"]])
+        results = batch.flush()
+
+        released = [] # (signer, nonce) of rejected tx
+        sent = {} # signer => hashes of tx sent
+        max_sent_nonces = {} # signer => highest nonce sent
+        for tx, result in zip(self.unsent_transactions, results):
+            signer = tx["signer"]
+            if isinstance(result, network.RpcError) and "already known" not in str(result):
+                print(Fore.RED + "Tx rejected: " + str(result) + ", id: " + tx["tx_hash"] + Fore.RESET)
+                released.append((signer, signer.release(tx["tx_hash"])))
+            else:
+                print("Transaction sent, paying up to " + str(round(tx["estimated_cost"], 6)) + " FTM, id: " + tx["tx_hash"])
+                self.pending_transactions.append({"tx_hash": tx["tx_hash"], "gas_price": tx["gas_price"]})
+                sent.setdefault(signer, []).append(tx["tx_hash"])
+                max_sent_nonces[signer] = max(max_sent_nonces.get(signer, -1), signer.nonces[tx["tx_hash"]])
+        self.unsent_transactions = []
+        for signer, tx_hashes in sent.items():
+            signer.set_broadcast(tx_hashes)
+
+        # A rejected tx leaves a gap: later tx of the same signer won't be mined until its nonce is used
+        gaps = [(signer, nonce) for signer, nonce in released if nonce is not None and nonce < max_sent_nonces.get(signer, -1)]
+        if gaps:
+            self.fill_nonce_gaps(gaps)
+
+    def fill_nonce_gaps(self, gaps):
+        """Send empty tx using the given nonces ([(signer, nonce)]), in one request"""
+        gas_price_wei = self.gas_oracle.get_gas_price_wei()
+        batch = network.RpcBatch()
+        fillers = []
+        for signer, nonce in gaps:
+            tx_signed = signer.sign_gap_filler(nonce, gas_price_wei)
+            if tx_signed is not None:
+                fillers.append((signer, self.w3.toHex(tx_signed.hash)))
+                batch.add("eth_sendRawTransaction", [self.w3.toHex(tx_signed.rawTransaction)])
+        for (signer, tx_hash), result in zip(fillers, batch.flush()):
+            if isinstance(result, network.RpcError) and "already known" not in str(result):
+                print(Fore.RED + "Could not fill the nonce gap left by a rejected tx: " + str(result) + Fore.RESET)
+                signer.release(tx_hash)
+            else:
+                print(Fore.YELLOW + "Sent an empty tx to fill the nonce gap left by a rejected tx, id: " + tx_hash + Fore.RESET)
+                signer.set_broadcast([tx_hash])
+
+    def get_receipts(self, tx_hashes):
+        """Get receipts of many tx in one request. Tx not mined yet (or on error) get `None`."""
+        def format_receipt(raw_receipt):
+            if raw_receipt is None:
+                return None
+            return AttributeDict.recursive(receipt_formatter(raw_receipt))
+
+        batch = network.RpcBatch()
+        for tx_hash in tx_hashes:
+            batch.add("eth_getTransactionReceipt", [tx_hash], decoder = format_receipt)
+        return [None if isinstance(receipt, network.RpcError) else receipt for receipt in batch.flush()]
+
+    def wait_for_tx(self, tx_hash, gas_price_for_log = None, wait_timeout = 360):
         """Returns tx receipt"""
+        # Tx may still be waiting to be broadcast
+        self.broadcast_transactions()
+        if gas_price_for_log is None:
+            gas_price_for_log = next((tx["gas_price"] for tx in self.pending_transactions if tx["tx_hash"] == tx_hash), 
+                                     self.get_gas_price())
         try:
             tx_receipt = self.w3.eth.wait_for_transaction_receipt(tx_hash, wait_timeout)
         except web3.exceptions.TransactionNotFound as e:
@@ -117,28 +288,43 @@ class Transacter:
         except web3.exceptions.TimeExhausted as e:
             print(Fore.RED + "Tx is taking too long:" + str(e))
             return None
+        self.log_receipt(tx_hash, tx_receipt, gas_price_for_log)
+        return tx_receipt
 
+    def log_receipt(self, tx_hash, tx_receipt, gas_price_for_log):
+        """Print receipt status and add tx cost to the session cost"""
         if tx_receipt.status == 1:
             actual_cost = tx_receipt.gasUsed * gas_price_for_log
             print(Fore.GREEN + "Tx success, actual cost " + str(round(actual_cost, 6)) + " FTM, id: " + str(tx_hash) + Fore.RESET)
             self.session_cost += actual_cost
         else:
             print(Fore.RED + "Tx failed (status = " + str(tx_receipt.status) + ")" + Fore.RESET)
-        return tx_receipt
 
     def wait_for_pending_transations(self, wait_timeout = 360):
-        """Returns a (possibly empty) list of receipts"""
-        receipts = []
-        if len(self.pending_transactions) > 0:
-            print("Waiting for " + str(len(self.pending_transactions)) + " tx receipts...")
-            for tx in self.pending_transactions:
-                tx_receipt = self.wait_for_tx(tx["tx_hash"], gas_price_for_log = tx["gas_price"])
-                if tx_receipt:
-                    receipts.append(tx_receipt)
-
-        # Reset pending tx and return all receipts
+        """Returns a (possibly empty) list of receipts, in the order they arrived"""
+        collector = ReceiptCollector(self)
+        for tx in self.take_pending_transactions():
+            collector.add(tx["tx_hash"], tx["gas_price"])
+        if collector.pending:
+            print("Waiting for " + str(len(collector.pending)) + " tx receipts...")
+        return collector.collect(wait_timeout)
+
+    def take_pending_transactions(self):
+        """Broadcast any signed tx, then return and forget all pending tx (so the caller can wait for them)"""
+        self.broadcast_transactions()
+        pending_transactions = self.pending_transactions
         self.pending_transactions = []
-        return receipts
+        return pending_transactions
+
+    @staticmethod
+    def batch_call(calls):
+        """Run many contract calls in one request. 
+           `calls` is a list of (w3fun, tx_params) where tx_params can be None or e.g. {"from": address}.
+           Returns the results in order, with `None` for failed calls."""
+        batch = network.RpcBatch()
+        for w3fun, tx_params in calls:
+            batch.add_call(w3fun, tx_params)
+        return [None if isinstance(result, network.RpcError) else result for result in batch.flush()]
 
     def print_gas_price(self):
         max_gas_per_action = {
@@ -154,3 +340,51 @@ class Transacter:
         for action in max_gas_per_action:
             max_cost = max_gas_per_action[action] * self.get_gas_price()
             print(action.ljust(10, ' ') + " => " + str(round(max_cost, 6)) + " FTM")
+
+class ReceiptCollector:
+    """Wait for the receipts of many tx at once. 
+       All pending tx are polled together (one batched request per round) and receipts are handled as they arrive,
+       so a slow tx doesn't hold up the others."""
+
+    POLL_INTERVAL = 1
+
+    def __init__(self, transacter):
+        self.transacter = transacter
+        self.pending = {}
+
+    def add(self, tx_hash, gas_price):
+        self.pending[tx_hash] = {"gas_price": gas_price}
+
+    def poll(self):
+        """Check all pending tx once. Returns a list of (tx_hash, receipt) for tx mined since the last poll."""
+        if not self.pending:
+            return []
+        tx_hashes = list(self.pending.keys())
+        arrived = []
+        for tx_hash, tx_receipt in zip(tx_hashes, self.transacter.get_receipts(tx_hashes)):
+            if tx_receipt:
+                tx = self.pending.pop(tx_hash)
+                self.transacter.log_receipt(tx_hash, tx_receipt, gas_price_for_log = tx["gas_price"])
+                arrived.append((tx_hash, tx_receipt))
+        return arrived
+
+    def collect(self, wait_timeout = 360):
+        """Poll until all receipts arrived or until timeout. Returns receipts in the order they arrived."""
+        total = len(self.pending)
+        if not total:
+            return []
+        start_time = time.time()
+        receipts = []
+        while self.pending:
+            arrived = self.poll()
+            receipts.extend(tx_receipt for _, tx_receipt in arrived)
+            if not self.pending:
+                break
+            if time.time() - start_time > wait_timeout:
+                print(Fore.RED + "Tx taking too long, gave up waiting for " + str(len(self.pending)) + " receipts" + Fore.RESET)
+                break
+            if arrived:
+                print("Received " + str(len(receipts)) + "/" + str(total) + " receipts...")
+            time.sleep(self.POLL_INTERVAL)
+        print("Received " + str(len(receipts)) + "/" + str(total) + " receipts in " + str(round(time.time() - start_time, 1)) + "s")
+        return receipts